@@ -9,12 +9,35 @@
 // Communication protocol
 #define CMD_LED_PULSE 0x01
 #define CMD_LED_EFFECT 0x02
+#define CMD_LED_BATCH 0x03  // Several [command, length, data...] entries in one packet
+#define CMD_LED_FRAME_SPAN 0x04  // Changed pixels of a frame pushed from the Pi
+#define CMD_LED_FRAME_COMMIT 0x05  // Show the pushed frame; echoed back as the ack
+#define CMD_HELLO 0x06  // Wire format handshake: [max version, capabilities]
+#define CMD_SEQUENCED 0x07  // [seq, command, data...]; acked, and repeats of a seq are ignored
+#define CMD_ACK 0x08  // Teensy -> Pi: [latest seq, bitmap of the 16 seqs before it, big-endian]
+#define CMD_TIME_SYNC 0x0B  // Pi -> Teensy: [Pi time, u32]; echoed back as [Pi time, millis(), u32 big-endian]
+#define CMD_LED_PULSE_AT 0x0C  // [strip, start time in millis(), u32 big-endian]
+#define CMD_LINK_STATS 0x0E  // Pi -> Teensy: []; answered with [good frames, bad frames, resyncs], u32 big-endian each
 #define CMD_BUTTON_PRESS 0x10
 #define CMD_BUTTON_LED 0x11
 #define CMD_SENSOR_DATA 0x20
 #define CMD_RING_LED_TEST 0x30  // Add this new command
 #define CMD_HEARTBEAT 0xFF
 
+// Wire formats
+// Legacy: every command is a fixed 35 byte CommandPacket.
+// V2: [FRAME_SYNC, length, command, data..., checksum] where length counts command + data and
+// the checksum is the XOR of length, command and data. Negotiated per connection with CMD_HELLO.
+// V2 CRC-8: v2 framing, but the checksum is a CRC-8 (polynomial 0x07) of the same bytes.
+#define WIRE_FORMAT_LEGACY 1
+#define WIRE_FORMAT_V2 2
+#define WIRE_FORMAT_V2_CRC8 3
+#define FRAME_SYNC 0xFE  // Never appears in UTF-8 text, so v2 frames can share the port with prints
+
+// CMD_HELLO capability bits
+#define CAP_SEQUENCED 0x01  // Understands CMD_SEQUENCED and sends CMD_ACK
+#define CAP_TIME_SYNC 0x02  // Answers CMD_TIME_SYNC and takes CMD_LED_PULSE_AT
+
 // LED configuration
 #define LED_CHIPSET WS2811
 #define LED_COLOR_ORDER WGRB
@@ -2,14 +2,14 @@ import argparse
 from pathlib import Path
 import pyo
 from dataclasses import dataclass, field, InitVar
-import RPi.GPIO as GPIO
 
-import keyboard
 import threading
 import time
 import random
 from typing import Callable
-from utils import DualTeensyTester
+from utils import DualTeensyTester, PULSE_LEAD_TIME, start_logging, stop_logging
+from utils.scheduler import ScheduledCall, TimerScheduler, next_tick
+from utils.trace import TraceRecorder, TraceReader, replay_trace, TRACE_GPIO, TRACE_KEYBOARD
 
 class Inputs:
     def listen(self):
@@ -23,12 +23,15 @@ class GPIOButtonInputs(Inputs):
     Every time voltage at a pin goes from low to high (ie a button press) it calls the callback.
     Does not trigger the callback continuously, only on low->high voltage changes.
     `listen()` method is blocking method that infinite loops until killed. Start in a thread if needed.
+    RPi.GPIO is only imported when this backend is used.
     """
 
     pins: dict[int, Callable[[], None]]
     pin_activations: dict[int, bool] = field(init=False)
 
     def __post_init__(self) -> None:
+        import RPi.GPIO as GPIO
+
         GPIO.setwarnings(False)
         GPIO.setmode(GPIO.BOARD)
         for pin in self.pins:
@@ -36,6 +39,8 @@ class GPIOButtonInputs(Inputs):
         self.pin_activations = {p: False for p in self.pins}
 
     def listen(self):
+        import RPi.GPIO as GPIO
+
         while True:
             for pin, callback in self.pins.items():
                 if GPIO.input(pin) == GPIO.HIGH:
@@ -52,11 +57,14 @@ class KeyboardInputs(Inputs):
     """
     Simple Keyboard input listener. Uses https://github.com/boppreh/keyboard
     Given a mapping from keys to callbacks, sets up listeners to trigger the callbacks.
+    keyboard is only imported when this backend is used.
     """
 
     keys: dict[str, Callable[[], None]]
 
     def __post_init__(self):
+        import keyboard
+
         for key, callable in self.keys.items():
             keyboard.add_hotkey(
                 key,
@@ -65,14 +73,22 @@ class KeyboardInputs(Inputs):
             )
 
     def listen(self) -> None:
+        import keyboard
+
         keyboard.wait()
 
 
+# Every DecayingParameter's decays run from this one thread rather than a Timer thread each
+DECAY_TIMERS = TimerScheduler("decay-timers")
+
+
 @dataclass
 class DecayingParameter:
     """
     Wrapper for a PYO paramater that can be "boosted" via external events, but always decays down to its base value.
     To use in PYO sound modules, pass my_parameter.value where you'll use it. (eg lfo = pyo.LFO(decaying_freq.value, mul=1))
+    Decays start on the first decay_period tick after a boost's ramp ends, as when they were polled every decay_period;
+    they are scheduled on DECAY_TIMERS rather than polled, and a new boost reschedules them.
     """
 
     base_value: float  # base value that this always decays to.
@@ -83,18 +99,22 @@ class DecayingParameter:
     )
     min_value: float = 0.0  # minimum value, in case you have a negative "boost".
     default_boost: float = 0.1  # default amount for a boost call, can be overriden.
+    decay_period: float = 1.0  # decays start on a tick of this period, counted from when the parameter was made.
     target_value: float = field(
         init=False
     )  # For internal use, tracks current "target value" this is ramping towards.
     value: pyo.Sig = field(
         init=False
     )  # The actual pyo.Sig object that can be used as a signal input.
-    ramping: bool = field(
-        default=False, init=False
-    )  # For internal use. Thread-safety variable to track when the value is still ramping up to a boosted value.
-    ramping_timer: threading.Timer | None = field(
+    started: float = field(
+        init=False, default_factory=time.monotonic
+    )  # For internal use. When the decay_period ticks are counted from.
+    boosts: int = field(
+        default=0, init=False
+    )  # For internal use. Counts boosts, so a decay scheduled before the latest boost is ignored.
+    pending_decay: ScheduledCall | None = field(
         init=False, default=None
-    )  # For internal use. Timer thread to set ramping flag to false.
+    )  # For internal use. The decay waiting on DECAY_TIMERS, if any.
     lock: threading.RLock = field(
         init=False, default_factory=threading.RLock
     )  # For internal use. Lock for thread safety.
@@ -102,18 +122,19 @@ class DecayingParameter:
     def __post_init__(self):
         self.target_value = self.base_value
         self.value = pyo.Sig(value=self.base_value)
-        self.decay()
 
-    def decay(self):
+    def decay(self, boost: int | None = None):
         with self.lock:
-            if not self.ramping and self.target_value != self.base_value:
+            if boost is not None and boost != self.boosts:
+                return  # Boosted again since this was scheduled; that boost has its own decay
+            self.pending_decay = None
+            if self.target_value != self.base_value:
                 self.value.value = pyo.SigTo(
                     value=self.base_value,
                     init=self.target_value,
                     time=self.decay_time,
                 )
                 self.target_value = self.base_value
-        threading.Timer(1, self.decay).start()
 
     def boost(self, boost_amount: float | None = None, ramp_time: float = 0):
         boost_amount = boost_amount or self.default_boost
@@ -133,19 +154,18 @@ class DecayingParameter:
                     init=current_value,
                     time=ramp_time,
                 )
-                self.ramping = True
-
-                def set_ramping():
-                    with self.lock:
-                        self.ramping = False
-
-                if self.ramping_timer is not None:
-                    self.ramping_timer.cancel()
-                self.ramping_timer = threading.Timer(ramp_time, set_ramping)
-                self.ramping_timer.start()
             else:
                 self.value.value = self.target_value
 
+            self.boosts += 1
+            if self.pending_decay is not None:
+                self.pending_decay.cancel()
+            self.pending_decay = DECAY_TIMERS.call_at(
+                next_tick(self.started, self.decay_period, time.monotonic() + ramp_time),
+                self.decay,
+                self.boosts,
+            )
+
 
 @dataclass
 class WhaleVoice:
@@ -184,6 +204,18 @@ def parse_args():
     parser.add_argument(
         "--input-type", choices=["gpio", "keyboard"], default="keyboard"
     )
+    parser.add_argument(
+        "--trace", type=Path, help="Record button presses and LED commands to this trace file"
+    )
+    parser.add_argument(
+        "--replay", type=Path, help="Play a recorded trace instead of listening for input"
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        help="Replay speed multiplier, 0 for as fast as possible",
+    )
     return parser.parse_args()
 
 
@@ -230,6 +262,10 @@ def main():
 
     s.boot()
     s.start()
+    # A trigger() is heard once the buffer being filled and the one playing have gone out;
+    # LED pulses are scheduled to start then too
+    audio_latency = 2 * s.getBufferSize() / s.getSamplingRate()
+    pulse_lead_time = max(PULSE_LEAD_TIME, audio_latency)
 
     project_dir = Path(__file__).parent.resolve()
     clip_files = list((project_dir / "mono").glob("**/*.wav"))
@@ -360,53 +396,90 @@ def main():
         else:
             whale.amplitude.boost(ramp_time=0.1, boost_amount=0.4)
 
-    gpio_inputs: Inputs = GPIOButtonInputs(
-        pins={
-            7: lambda: trigger(0),
-            8: lambda: trigger(1),
-            10: lambda: trigger(2),
-            11: lambda: trigger(3),
-            12: lambda: trigger(4),
-            13: lambda: trigger(5),
-            16: lambda: trigger(6),
-            18: lambda: trigger(7),
-        }
-    )
+    trace = TraceRecorder(args.trace) if args.trace else None
 
-    keyboard_inputs: Inputs = KeyboardInputs(
-        keys={
-            "q": lambda: trigger(0),
-            "e": lambda: trigger(2),
-            "w": lambda: trigger(1),
-            "r": lambda: trigger(3),
-            "t": lambda: trigger(4),
-            "y": lambda: trigger(5),
-            "a": lambda: trigger(6),
-            "s": lambda: trigger(7),
-            "d": lambda: trigger(8),
-            "f": lambda: trigger(9),
-            "g": lambda: trigger(10),
-            "h": lambda: trigger(11),
-            "z": lambda: trigger(12),
-            "x": lambda: trigger(13),
-            "c": lambda: trigger(14),
-            "v": lambda: trigger(15),
-            "b": lambda: clip_player.play_random(),
-        }
-    )
+    def traced(kind, button_index):
+        """Input callback that records the trigger to the trace, if there is one"""
 
+        def callback():
+            if trace is not None:
+                trace.record(kind, 0, button_index)
+            trigger(button_index)
+
+        return callback
+
+    # Only the backend in use is set up (and its module imported)
     if args.input_type == "gpio":
-        inputs = gpio_inputs
+        inputs: Inputs = GPIOButtonInputs(
+            pins={
+                7: traced(TRACE_GPIO, 0),
+                8: traced(TRACE_GPIO, 1),
+                10: traced(TRACE_GPIO, 2),
+                11: traced(TRACE_GPIO, 3),
+                12: traced(TRACE_GPIO, 4),
+                13: traced(TRACE_GPIO, 5),
+                16: traced(TRACE_GPIO, 6),
+                18: traced(TRACE_GPIO, 7),
+            }
+        )
     elif args.input_type == "keyboard":
-        inputs = keyboard_inputs
+        inputs = KeyboardInputs(
+            keys={
+                "q": traced(TRACE_KEYBOARD, 0),
+                "e": traced(TRACE_KEYBOARD, 2),
+                "w": traced(TRACE_KEYBOARD, 1),
+                "r": traced(TRACE_KEYBOARD, 3),
+                "t": traced(TRACE_KEYBOARD, 4),
+                "y": traced(TRACE_KEYBOARD, 5),
+                "a": traced(TRACE_KEYBOARD, 6),
+                "s": traced(TRACE_KEYBOARD, 7),
+                "d": traced(TRACE_KEYBOARD, 8),
+                "f": traced(TRACE_KEYBOARD, 9),
+                "g": traced(TRACE_KEYBOARD, 10),
+                "h": traced(TRACE_KEYBOARD, 11),
+                "z": traced(TRACE_KEYBOARD, 12),
+                "x": traced(TRACE_KEYBOARD, 13),
+                "c": traced(TRACE_KEYBOARD, 14),
+                "v": traced(TRACE_KEYBOARD, 15),
+                # Not a button: plays a clip directly, so it isn't traced or replayed
+                "b": lambda: clip_player.play_random(),
+            }
+        )
     else:
         raise ValueError(f"Input type {args.input_type} not supported")
 
     print("Audio engine started. Generating soundscape...")
+    # Hub output goes through the log thread from here on, so it never blocks button handling
+    start_logging()
+
+    if args.replay:
+        reader = TraceReader(args.replay)
+        print(f"⏪ Replaying {len(reader)} records ({reader.duration():.0f}s) from {args.replay} at {args.replay_speed}x")
+        # LED Teensys are driven too if they are connected; otherwise only the sound is
+        tester = DualTeensyTester(sound_callback=trigger, pulse_lead_time=pulse_lead_time)
+        tester.trace = trace
+        connected = tester.connect()
+        if connected:
+            tester.start_monitoring()
+        try:
+            print(f"📊 {replay_trace(args.replay, tester, trigger, speed=args.replay_speed)}")
+        except KeyboardInterrupt:
+            pass
+        if connected:
+            # As with the live path's context manager, only a connected hub is stopped
+            tester.stop_monitoring()
+        DECAY_TIMERS.stop()
+        stop_logging()
+        s.stop()
+        if trace is not None:
+            trace.close()
+        return
+
     print("Press Ctrl+C in the console to stop.")
     try:
         # Use centralized DualTeensyTester with sound callback
-        with DualTeensyTester(sound_callback=trigger) as tester:
+        with DualTeensyTester(sound_callback=trigger, pulse_lead_time=pulse_lead_time) as tester:
+            tester.trace = trace
             if tester.start_monitoring():
                 print("🎵 Sound engine ready - listening for button presses...")
                 # Keep main thread alive
@@ -419,6 +492,12 @@ def main():
         print("\nStopping audio server...")
         s.stop()
         print("Server stopped.")
+    finally:
+        DECAY_TIMERS.stop()
+        stop_logging()
+        if trace is not None:
+            trace.close()
+            print(f"💾 Wrote {trace.records} trace records to {args.trace}")
 
 
 if __name__ == "__main__":
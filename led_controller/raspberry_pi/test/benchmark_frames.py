@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Frame push compression benchmark
+Encodes a synthetic Pi-side animation and reports bytes per frame, compression ratio
+and the frame rate the writer's pacing allows. No hardware required
+"""
+
+import math
+import time
+
+# Import centralized configuration and frame encoder
+from utils.config import (
+    LINK_BYTES_PER_SECOND,
+    NUM_STRIPS_PER_TEENSY,
+    LED_STRIP_NUM_LEDS,
+    WIRE_FORMAT_LEGACY,
+    WIRE_FORMAT_V2,
+    WIRE_FORMAT_V2_CRC8,
+)
+from utils.frames import FrameEncoder
+from utils.protocol import WIRE_FORMAT_NAMES
+
+NUM_FRAMES = 300
+
+
+def comet_frame(t):
+    """A comet chasing down each strip over a dim background, strips offset from each other"""
+    pixels = [0x00000010] * (NUM_STRIPS_PER_TEENSY * LED_STRIP_NUM_LEDS)
+    for strip in range(NUM_STRIPS_PER_TEENSY):
+        head = (t + strip * 6) % LED_STRIP_NUM_LEDS
+        for tail in range(4):
+            brightness = 0xFF >> tail
+            pixels[strip * LED_STRIP_NUM_LEDS + (head - tail) % LED_STRIP_NUM_LEDS] = brightness << 16
+    return pixels
+
+
+def breathing_frame(t):
+    """Every pixel the same color, fading in and out"""
+    level = int(127 + 127 * math.sin(t / 10))
+    return [level << 24] * (NUM_STRIPS_PER_TEENSY * LED_STRIP_NUM_LEDS)
+
+
+def run(name, make_frame, wire_format):
+    encoder = FrameEncoder(wire_format=wire_format)
+    total_bytes = 0
+    ratios = []
+    start = time.perf_counter()
+    for t in range(NUM_FRAMES):
+        frame_bytes = encoder.encode(make_frame(t))
+        # Pretend the Teensy acknowledged straight away
+        encoder.acknowledge(encoder.last_stats.frame_id)
+        total_bytes += len(frame_bytes)
+        ratios.append(encoder.last_stats.compression_ratio)
+    elapsed = time.perf_counter() - start
+
+    bytes_per_frame = total_bytes / NUM_FRAMES
+    print(f"  {name:<10} {bytes_per_frame:>7.0f} bytes/frame  "
+          f"{sum(ratios) / len(ratios):>5.1f}x compression  "
+          f"{LINK_BYTES_PER_SECOND / bytes_per_frame:>7.1f} fps @ {LINK_BYTES_PER_SECOND} B/s  "
+          f"({elapsed / NUM_FRAMES * 1e3:.2f} ms to encode)")
+
+
+def main():
+    print(f"📊 Frame push benchmark ({NUM_FRAMES} frames, "
+          f"{NUM_STRIPS_PER_TEENSY}x{LED_STRIP_NUM_LEDS} RGBW pixels)")
+    for wire_format in (WIRE_FORMAT_LEGACY, WIRE_FORMAT_V2, WIRE_FORMAT_V2_CRC8):
+        print()
+        print(f"   {WIRE_FORMAT_NAMES[wire_format]} wire format, "
+              f"full frame: {FrameEncoder(wire_format=wire_format).full_frame_bytes} bytes")
+        print("-" * 80)
+        run("comet", comet_frame, wire_format)
+        run("breathing", breathing_frame, wire_format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Reconnect benchmark against simulated Teensys
+Unplugs and replugs a simulated LED Teensy while the TeensyHub is monitoring, and reports
+how long the hub takes to notice each unplug and to reattach, with udev hot-plug events
+and with only the backoff timer. No hardware required
+"""
+
+import argparse
+import statistics
+import time
+
+# Import centralized hub and simulator
+from utils import TeensyHub, start_logging, stop_logging
+from utils.hotplug import set_uevent_source
+from utils.simulator import TeensySimulator
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=10, help="Unplug/replug cycles per mode")
+    parser.add_argument("--teensy", default="b", help="Which simulated Teensy to unplug")
+    parser.add_argument("--away", type=float, default=0.3, help="Seconds each Teensy stays unplugged")
+    return parser.parse_args()
+
+
+def wait_for(condition, timeout=15.0):
+    """Seconds until condition() held, or None on timeout"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if condition():
+            return time.perf_counter() - start
+        time.sleep(0.0005)
+    return None
+
+
+def run(args, hotplug):
+    with TeensySimulator() as sim:
+        if not hotplug:
+            set_uevent_source(lambda groups: None)
+        hub = TeensyHub()
+        if not hub.connect() or not hub.start_monitoring():
+            print("❌ Could not connect to the simulated Teensys")
+            return
+        teensy = sim[args.teensy]
+        detach, attach = [], []
+        for _ in range(args.cycles):
+            teensy.unplug()
+            detach.append(wait_for(lambda: args.teensy not in hub.ports))
+            time.sleep(args.away)
+            teensy.plug()
+            attach.append(wait_for(lambda: args.teensy in hub.ports))
+        hub.stop_monitoring()
+
+    def summary(samples):
+        done = [sample * 1000 for sample in samples if sample is not None]
+        if not done:
+            return "never"
+        return f"median {statistics.median(done):7.1f}ms  max {max(done):7.1f}ms  ({len(done)}/{len(samples)})"
+
+    print(f"  {'hot-plug events' if hotplug else 'backoff timer only':<20} "
+          f"detach: {summary(detach)}   reattach: {summary(attach)}")
+
+
+def main():
+    args = parse_args()
+    # Connection chatter would swamp the output
+    start_logging("WARNING")
+    print(f"📊 {args.cycles} unplug/replug cycles of Teensy {args.teensy.upper()}, {args.away:.1f}s unplugged")
+    print("-" * 60)
+    try:
+        run(args, hotplug=True)
+        run(args, hotplug=False)
+    finally:
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
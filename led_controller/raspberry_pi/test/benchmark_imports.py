@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Import time budget check
+Imports each entry point in a fresh interpreter with python -X importtime and fails if
+one takes longer than its budget, or pulls in a module its fast path must not need
+(e.g. pyserial or asyncio just to encode packets). No hardware required
+
+Budgets are for the Raspberry Pi; on a faster or slower machine, scale them with --scale
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+RASPBERRY_PI_DIR = Path(__file__).resolve().parent.parent
+
+# (module, budget in ms, modules it must not import)
+IMPORT_BUDGETS = (
+    ("utils", 10, ("serial", "asyncio", "utils.protocol")),
+    ("utils.protocol", 30, ("serial", "asyncio", "utils.dual_teensy")),
+    ("utils.device_utils", 40, ("asyncio", "serial.tools.list_ports", "json")),
+    ("utils.dual_teensy", 150, ("asyncio",)),
+    ("sound.main", 600, ("asyncio", "keyboard", "RPi.GPIO")),
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module; the median is used")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget by this")
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports to list for a module over budget")
+    return parser.parse_args()
+
+
+def import_times(code):
+    """
+    Run code in a fresh interpreter under -X importtime
+
+    Returns:
+        [(depth, self us, cumulative us, module)] in import order, or None if it failed
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=RASPBERRY_PI_DIR,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+
+def error_message(module):
+    result = subprocess.run([sys.executable, "-c", f"import {module}"], cwd=RASPBERRY_PI_DIR,
+                            capture_output=True, text=True)
+    lines = result.stderr.strip().splitlines()
+    return lines[-1] if lines else "failed"
+
+
+def main():
+    args = parse_args()
+    # Whatever the interpreter loads on its own isn't charged to anyone
+    baseline = {name for _, _, _, name in import_times("pass") or ()}
+
+    print(f"📊 Import times, median of {args.runs} runs (budget scale {args.scale}x)")
+    print("-" * 60)
+    failures = 0
+    for module, budget_ms, forbidden in IMPORT_BUDGETS:
+        runs = [import_times(f"import {module}") for _ in range(args.runs)]
+        if any(rows is None for rows in runs):
+            print(f"  ⚠️  {module:<22} skipped: {error_message(module)}")
+            continue
+        totals = [sum(cumulative for depth, _, cumulative, name in rows if depth == 0 and name not in baseline)
+                  for rows in runs]
+        took_ms = statistics.median(totals) / 1000
+        limit_ms = budget_ms * args.scale
+        loaded = {name for _, _, _, name in runs[0]}
+        unwanted = [name for name in forbidden if name in loaded]
+
+        ok = took_ms <= limit_ms and not unwanted
+        failures += not ok
+        print(f"  {'✅' if ok else '❌'} {module:<22} {took_ms:7.1f}ms  (budget {limit_ms:.0f}ms)")
+        if unwanted:
+            print(f"       imports {', '.join(unwanted)}")
+        if took_ms > limit_ms:
+            slowest = sorted((row for row in runs[0] if row[3] not in baseline), key=lambda row: -row[1])
+            for _, self_us, cumulative_us, name in slowest[:args.top]:
+                print(f"       {name:<40} self {self_us / 1000:6.1f}ms  cumulative {cumulative_us / 1000:6.1f}ms")
+
+    if failures:
+        print(f"❌ {failures} module(s) over budget")
+        sys.exit(1)
+    print("✅ All imports within budget")
+
+
+if __name__ == "__main__":
+    main()
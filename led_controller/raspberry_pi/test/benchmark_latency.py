@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Latency recorder overhead benchmark
+Measures what a LatencyRecorder.record() call costs on the hot path, including its share
+of folding samples into the histogram, and how long a snapshot takes. No hardware required
+"""
+
+import time
+
+# Import centralized latency recorder
+from utils.latency import LatencyRecorder
+
+ITERATIONS = 200_000
+
+
+def main():
+    recorder = LatencyRecorder(('stage',))
+    stamp = time.perf_counter_ns
+
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        stamp()
+    stamp_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        recorder.record('stage', stamp())
+    record_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    snapshot = recorder.snapshot()['stage']
+    snapshot_elapsed = time.perf_counter() - start
+
+    print(f"📊 Latency recorder overhead ({ITERATIONS:,} events)")
+    print("-" * 60)
+    print(f"  {'perf_counter_ns() stamp':<28} {stamp_elapsed / ITERATIONS * 1e9:>6.0f} ns")
+    print(f"  {'stamp + record() + fold':<28} {record_elapsed / ITERATIONS * 1e9:>6.0f} ns")
+    print(f"  {'snapshot':<28} {snapshot_elapsed * 1e6:>6.0f} µs")
+    print(f"  Recorded {snapshot.count:,} samples: p50 {snapshot.p50_us:.2f}µs, p99 {snapshot.p99_us:.2f}µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Packet encoding benchmark
+Compares the original per-press encode and decode paths, loaded from git as they were at
+BASELINE_COMMIT, against the preallocated/cached paths in utils.protocol
+No hardware required
+"""
+
+import importlib.util
+import subprocess
+import time
+import types
+from pathlib import Path
+
+# Import centralized protocol
+from utils.protocol import (
+    PACKET_SIZE,
+    CommandPacket,
+    create_led_pulse_packet,
+    create_packet_array,
+    decode_packet_array,
+    encode_packet_array,
+    get_led_pulse_frame,
+)
+
+ITERATIONS = 200_000
+ARRAY_PACKETS = 10_000
+BASELINE_COMMIT = "92e49f0"  # utils/protocol.py before any of the encode work
+PROTOCOL_PATH = Path(__file__).resolve().parent.parent / "utils" / "protocol.py"
+
+
+def load_baseline_protocol():
+    """utils/protocol.py as of BASELINE_COMMIT, as a module, or None if git can't provide it"""
+    repo = PROTOCOL_PATH.parent
+    try:
+        root = subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=repo, capture_output=True,
+                              text=True, check=True).stdout.strip()
+        path = PROTOCOL_PATH.relative_to(root).as_posix()
+        source = subprocess.run(["git", "show", f"{BASELINE_COMMIT}:{path}"], cwd=repo, capture_output=True,
+                                text=True, check=True).stdout
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+    module = types.ModuleType("utils.baseline_protocol")
+    module.__package__ = "utils"  # Its relative imports resolve against today's utils.config
+    exec(compile(source, f"{BASELINE_COMMIT}:{path}", "exec"), module.__dict__)
+    return module
+
+
+def packet_to_bytes(strip_id):
+    return create_led_pulse_packet(strip_id).to_bytes()
+
+
+def make_pack_into_encoder():
+    buffer = bytearray(PACKET_SIZE)
+    packets = [create_led_pulse_packet(strip) for strip in range(8)]
+
+    def pack_into(strip_id):
+        packets[strip_id & 7].pack_into(buffer)
+        return buffer
+    return pack_into
+
+
+def run(name, encode, unit="encodes"):
+    start = time.perf_counter()
+    for i in range(ITERATIONS):
+        encode(i & 7)
+    elapsed = time.perf_counter() - start
+    rate = ITERATIONS / elapsed
+    print(f"  {name:<28} {rate:>12,.0f} {unit}/s  ({elapsed / ITERATIONS * 1e9:,.0f} ns each)")
+    return rate
+
+
+def benchmark_packet_arrays():
+    """Encode and validate many packets with a per-packet loop vs vectorized calls"""
+    if importlib.util.find_spec("numpy") is None:
+        print("  (NumPy not installed, skipping packet array benchmark)")
+        return
+
+    commands = [(0x01 + i % 3, bytes(range(i % 33))) for i in range(ARRAY_PACKETS)]
+    encode_packet_array(create_packet_array(commands[:1]))  # Imports NumPy, so that isn't timed
+
+    start = time.perf_counter()
+    looped = b''.join(CommandPacket(command, len(data), data).to_bytes() for command, data in commands)
+    loop_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    buffer = encode_packet_array(create_packet_array(commands))
+    array_elapsed = time.perf_counter() - start
+    assert buffer == looped
+
+    print(f"  {'encode loop':<28} {ARRAY_PACKETS / loop_elapsed:>12,.0f} packets/s")
+    print(f"  {'encode_packet_array':<28} {ARRAY_PACKETS / array_elapsed:>12,.0f} packets/s")
+
+    start = time.perf_counter()
+    bad_loop = 0
+    for offset in range(0, len(buffer), PACKET_SIZE):
+        try:
+            CommandPacket.from_bytes(buffer[offset:offset + PACKET_SIZE])
+        except ValueError:
+            bad_loop += 1
+    loop_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, bad = decode_packet_array(buffer)
+    array_elapsed = time.perf_counter() - start
+    assert bad_loop == int(bad.sum()) == 0
+
+    print(f"  {'decode loop':<28} {ARRAY_PACKETS / loop_elapsed:>12,.0f} packets/s")
+    print(f"  {'decode_packet_array':<28} {ARRAY_PACKETS / array_elapsed:>12,.0f} packets/s")
+
+
+def main():
+    baseline = load_baseline_protocol()
+    if baseline is None:
+        print(f"❌ Can't load utils/protocol.py at {BASELINE_COMMIT} (needs git and the repository history)")
+        return
+
+    def baseline_to_bytes(strip_id):
+        return baseline.create_led_pulse_packet(strip_id).to_bytes()
+
+    # Sanity check that every path produces identical bytes before timing anything
+    pack_into = make_pack_into_encoder()
+    frames = [baseline_to_bytes(strip) for strip in range(8)]
+    for strip, expected in enumerate(frames):
+        assert packet_to_bytes(strip) == expected
+        assert bytes(pack_into(strip)) == expected
+        assert get_led_pulse_frame(strip) == expected
+        assert CommandPacket.from_bytes(expected).to_bytes() == expected
+
+    print(f"📊 LED pulse encode benchmark ({ITERATIONS:,} iterations)")
+    print("-" * 60)
+    before = run(f"{BASELINE_COMMIT}: to_bytes", baseline_to_bytes)
+    run("CommandPacket.to_bytes", packet_to_bytes)
+    run("CommandPacket.pack_into", pack_into)
+    after = run("cached frame lookup", get_led_pulse_frame)
+    print("-" * 60)
+    print(f"🚀 Cached frames are {after / before:.1f}x faster than the original encode path")
+    print()
+    print(f"📊 Packet decode benchmark ({ITERATIONS:,} iterations)")
+    print("-" * 60)
+    before = run(f"{BASELINE_COMMIT}: from_bytes", lambda strip: baseline.CommandPacket.from_bytes(frames[strip]),
+                 unit="decodes")
+    after = run("CommandPacket.from_bytes", lambda strip: CommandPacket.from_bytes(frames[strip]), unit="decodes")
+    print("-" * 60)
+    print(f"{'🚀' if after >= before else '⚠️ '} from_bytes is {after / before:.2f}x the original decode path")
+    print()
+    print(f"📊 Bulk validation of {ARRAY_PACKETS:,} received packets")
+    print("-" * 60)
+    benchmark_packet_arrays()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark against simulated Teensys
+Runs the full TeensyHub (detection, handshake, I/O loop, writers) against pty stand-ins
+for every Teensy, presses buttons on the simulated Teensy A at a fixed rate and reports
+the latency histograms and whether every LED pulse arrived. No hardware required
+"""
+
+import argparse
+import time
+
+# Import centralized hub and simulator
+from utils import TeensyHub, start_logging, stop_logging
+from utils.simulator import TeensySimulator
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--presses", type=int, default=2000, help="Button presses to send")
+    parser.add_argument("--rate", type=float, default=200.0, help="Presses per second")
+    parser.add_argument("--baudrate", type=int, default=None, help="Throttle the simulated links to this line rate")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Chance of each byte being corrupted")
+    parser.add_argument("--legacy", action="store_true", help="Simulate firmware without the v2 wire format")
+    parser.add_argument("--no-crc", action="store_true", help="Simulate firmware with XOR-checksummed v2 frames only")
+    parser.add_argument("--text-events", action="store_true", help="Send BUTTON_PRESS:n lines instead of binary events")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Per-press log lines would swamp the output
+    start_logging("WARNING")
+
+    with TeensySimulator(baudrate=args.baudrate, error_rate=args.error_rate, supports_v2=not args.legacy,
+                         supports_crc=not args.no_crc, text_events=args.text_events, seed=1) as sim:
+        hub = TeensyHub()
+        if not hub.connect() or not hub.start_monitoring():
+            stop_logging()
+            print("❌ Could not connect to the simulated Teensys")
+            return
+
+        buttons = len(hub.strip_routes)
+        sim.button_teensy.schedule_presses((i / args.rate, i % buttons + 1) for i in range(args.presses))
+        deadline = time.monotonic() + args.presses / args.rate + 5
+        while time.monotonic() < deadline:
+            # Pulses the hub shed because the Teensy had no free slot for them aren't expected
+            expected = args.presses - sum(slots.shed() for slots in hub.pulse_slots.values())
+            received = sum(sum(sim[teensy_id].pulses) for teensy_id in hub.led_teensy_ids)
+            if received >= expected:
+                break
+            time.sleep(0.05)
+
+        print(f"📊 {args.presses} presses at {args.rate:.0f}/s, "
+              f"baudrate {args.baudrate or 'unlimited'}, error rate {args.error_rate}")
+        print("-" * 60)
+        # Ask for the stats in the same write as a pulse per Teensy, as a request made mid-show would be
+        hub.remote_link_stats.clear()
+        with hub.batch():
+            for teensy_id in hub.led_teensy_ids:
+                hub.send_led_pulse_command(next(strip_id for strip_id, (owner, _) in enumerate(hub.strip_routes)
+                                                if owner == teensy_id))
+            hub.request_link_stats()
+        time.sleep(0.2)
+        links = hub.link_stats()
+        writers = hub.writer_stats()
+        frames = hub.link_error_stats()
+        hub.stop_monitoring()
+        stop_logging()
+        for teensy_id, stats in writers.items():
+            print(f"  Teensy {teensy_id.upper()} writer: {stats['utilisation']:.0%} of the link, "
+                  f"{stats['dropped']} dropped, {stats['expired']} expired, {stats['throttled']} throttled")
+        for teensy_id, stats in links.items():
+            print(f"  Teensy {teensy_id.upper()} link: {stats['acked']}/{stats['sent']} acked, "
+                  f"{stats['retransmits']} retransmits, {stats['failed']} failed, "
+                  f"srtt {stats['srtt_ms'] or 0:.2f}ms")
+        for teensy_id, stats in frames.items():
+            remote = stats['teensy']
+            teensy_side = (f"; Teensy got {remote['good_frames']} good, {remote['bad_frames']} bad, "
+                           f"{remote['resyncs']} resyncs" if remote else "")
+            print(f"  Teensy {teensy_id.upper()} frames: Pi got {stats['pi']['good_frames']} good, "
+                  f"{stats['pi']['bad_frames']} bad, {stats['pi']['resyncs']} resyncs{teensy_side}")
+        for teensy in sim.teensys.values():
+            print(f"  {teensy}")
+        for teensy_id, slots in hub.pulse_slots.items():
+            print(f"  Teensy {teensy_id.upper()} pulse slots: {slots}")
+        expected = args.presses + len(hub.led_teensy_ids) - sum(slots.shed() for slots in hub.pulse_slots.values())
+        pulses = sum(sum(sim[teensy_id].pulses) for teensy_id in hub.led_teensy_ids)
+        print(f"  LED pulses delivered: {pulses}/{expected}")
+        batched = sum(sim[teensy_id].batched_link_requests for teensy_id in hub.led_teensy_ids)
+        print(f"  Link stats answered: {len(hub.remote_link_stats)}/{len(hub.led_teensy_ids)} "
+              f"({batched} of the requests arrived inside a batch)")
+
+
+if __name__ == "__main__":
+    main()
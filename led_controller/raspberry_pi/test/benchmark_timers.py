@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Decay timer benchmark
+Drives many parameters the way the whale voices' DecayingParameters are driven (a
+re-armed one second tick each, plus a timer per ramping boost), once with a
+threading.Timer per timer as before and once with a single TimerScheduler. Reports the
+threads started, CPU time and how late the callbacks ran. No hardware required
+"""
+
+import argparse
+import random
+import threading
+import time
+
+# Import centralized scheduler
+from utils.scheduler import TimerScheduler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parameters", type=int, default=32, help="Parameters (8 voices x 4 by default)")
+    parser.add_argument("--boost-rate", type=float, default=20.0, help="Ramping boosts per second, across all parameters")
+    parser.add_argument("--seconds", type=float, default=5.0, help="How long to run each mode")
+    return parser.parse_args()
+
+
+class Lateness:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = []
+
+    def callback(self, deadline):
+        late = time.monotonic() - deadline
+        with self.lock:
+            self.samples.append(late)
+
+    def summary(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return "no callbacks"
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        return f"{len(samples)} callbacks, p99 {p99 * 1000:.2f}ms late, max {samples[-1] * 1000:.2f}ms late"
+
+
+def run(args, schedule):
+    """schedule(delay, callback, *args) arms one timer"""
+    lateness = Lateness()
+    stop_at = time.monotonic() + args.seconds
+
+    def tick(deadline):
+        lateness.callback(deadline)
+        if time.monotonic() < stop_at:
+            schedule(1.0, tick, time.monotonic() + 1.0)
+
+    for _ in range(args.parameters):
+        schedule(1.0, tick, time.monotonic() + 1.0)
+
+    rng = random.Random(1)
+    while time.monotonic() < stop_at:
+        ramp = rng.choice((0.1, 0.2, 0.25, 1.0))
+        schedule(ramp, lateness.callback, time.monotonic() + ramp)
+        time.sleep(1 / args.boost_rate)
+    time.sleep(1.2)  # Let the last ticks and ramps fire
+    return lateness
+
+
+def main():
+    args = parse_args()
+    print(f"📊 {args.parameters} parameters, {args.boost_rate:.0f} ramping boosts/s, {args.seconds:.0f}s per mode")
+    print("-" * 60)
+
+    started = [0]
+
+    def timer_thread(delay, callback, *callback_args):
+        started[0] += 1
+        threading.Timer(delay, callback, callback_args).start()
+
+    cpu = time.process_time()
+    lateness = run(args, timer_thread)
+    print(f"  threading.Timer  {started[0]:6d} threads  {time.process_time() - cpu:6.2f}s CPU  {lateness.summary()}")
+
+    scheduler = TimerScheduler("benchmark-timers")
+    cpu = time.process_time()
+    lateness = run(args, scheduler.call_later)
+    print(f"  TimerScheduler   {1:6d} threads  {time.process_time() - cpu:6.2f}s CPU  {lateness.summary()}")
+    scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
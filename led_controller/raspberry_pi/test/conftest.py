@@ -0,0 +1,14 @@
+"""
+pytest setup
+
+The unit tests here need no hardware. The other test_*.py scripts drive real Teensys
+and are run one at a time with ./run_test, so pytest leaves them alone.
+"""
+
+collect_ignore = [
+    "test_both_teensys.py",
+    "test_individual_strips.py",
+    "test_teensy_a_only.py",
+    "test_teensy_b_leds.py",
+    "test_teensy_communication.py",
+]
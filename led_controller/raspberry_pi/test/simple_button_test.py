@@ -8,7 +8,9 @@ import serial
 import time
 
 # Import centralized configuration and device utilities
-from utils import find_teensy
+from utils import find_teensy, CMD_BUTTON_PRESS
+from utils.framer import StreamFramer
+from utils.protocol import decode_button_event
 
 def main():
     port = find_teensy("a")
@@ -23,13 +25,19 @@ def main():
         print("📋 Listening for button presses... (Press Ctrl+C to stop)")
         print("-" * 40)
         
+        framer = StreamFramer()
         while True:
             if teensy.in_waiting > 0:
-                line = teensy.readline().decode('utf-8').strip()
-                # print(line)
-                if "BUTTON_PRESS:" in line:
-                    button_num = line.split(":")[1]
-                    print(f"Button {button_num} pressed!")
+                for line in framer.feed(teensy.read(teensy.in_waiting)):
+                    # Binary frames (button events, heartbeats) come back as CommandPackets
+                    if isinstance(line, str):
+                        if "BUTTON_PRESS:" in line:
+                            button_num = line.split(":")[1]
+                            print(f"Button {button_num} pressed!")
+                    elif line.command == CMD_BUTTON_PRESS:
+                        event = decode_button_event(line)
+                        if event.pressed:
+                            print(f"Button {event.button_id} pressed!")
                     
             time.sleep(0.1)
             
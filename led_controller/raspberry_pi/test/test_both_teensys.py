@@ -7,7 +7,7 @@ Uses centralized DualTeensyTester for simplified and consistent testing
 import time
 
 # Import centralized configuration and utilities
-from utils import DualTeensyTester
+from utils import DualTeensyTester, start_logging, stop_logging
 
 def test_communication():
     """Test the complete communication flow using centralized DualTeensyTester"""
@@ -23,6 +23,7 @@ def test_communication():
     print("   Press Ctrl+C to stop")
     print("-" * 60)
     
+    start_logging()
     try:
         # Use centralized DualTeensyTester with context manager
         with DualTeensyTester() as tester:
@@ -41,6 +42,7 @@ def test_communication():
     except Exception as e:
         print(f"❌ Error during test: {e}")
     finally:
+        stop_logging()
         print("✅ Test complete!")
 
 def main():
@@ -0,0 +1,106 @@
+"""ClockSync against a synthetic Teensy clock with a known offset and skew"""
+
+import math
+
+import pytest
+
+from utils.clock_sync import ClockSync
+
+START_NS = 5_000_000_000
+
+
+class FakeTeensyClock:
+    """millis() of a Teensy that booted offset_ms before the Pi's clock started, running skew_ppm fast"""
+
+    def __init__(self, offset_ms, skew_ppm):
+        self.offset_ms = offset_ms
+        self.rate = 1 + skew_ppm / 1e6
+
+    def exact_ms(self, pi_ns):
+        return self.offset_ms + self.rate * pi_ns / 1e6
+
+    def millis(self, pi_ns):
+        return math.floor(self.exact_ms(pi_ns)) & 0xFFFFFFFF
+
+
+def sync(clock, teensy, sent_ns, rtt_ms=1.0, read_at=0.5):
+    """One request and its reply; the Teensy reads millis() read_at of the way through the round trip"""
+    rtt_ns = int(rtt_ms * 1e6)
+    device_ms = teensy.millis(sent_ns + int(rtt_ns * read_at))
+    return clock.handle_reply(ClockSync.stamp(sent_ns) + device_ms.to_bytes(4, 'big'), sent_ns + rtt_ns)
+
+
+def test_fit_recovers_offset_and_skew():
+    clock = ClockSync()
+    teensy = FakeTeensyClock(offset_ms=123_456, skew_ppm=80)
+    for i in range(64):
+        assert sync(clock, teensy, START_NS + i * 1_000_000_000)
+
+    now_ns = START_NS + 64_000_000_000
+    assert clock.stats(now_ns)['skew_ppm'] == pytest.approx(80, abs=10)
+    assert clock.to_device_ms(now_ns) == pytest.approx(teensy.exact_ms(now_ns), abs=1)
+    assert clock.offset_ms(now_ns) == pytest.approx(teensy.exact_ms(now_ns) - now_ns / 1e6, abs=1)
+
+
+def test_no_skew_until_the_samples_span_long_enough():
+    clock = ClockSync()
+    teensy = FakeTeensyClock(offset_ms=1000, skew_ppm=500)
+    for i in range(8):
+        sync(clock, teensy, START_NS + i * 50_000_000)
+    assert clock.slope == 1.0
+    assert clock.to_device_ms(START_NS) == pytest.approx(teensy.exact_ms(START_NS), abs=1)
+
+
+def test_slow_round_trips_are_left_out_of_the_fit():
+    clock = ClockSync()
+    teensy = FakeTeensyClock(offset_ms=50_000, skew_ppm=0)
+    for i in range(40):
+        sent_ns = START_NS + i * 100_000_000
+        if i % 4:
+            # Sat in a queue on the way out, so millis() was read 20ms after the midpoint
+            sync(clock, teensy, sent_ns, rtt_ms=50, read_at=0.9)
+        else:
+            sync(clock, teensy, sent_ns, rtt_ms=2)
+
+    assert clock.min_rtt_ms == pytest.approx(2)
+    assert clock.replies == 40
+    assert clock.residual_ms < 1
+    assert clock.to_device_ms(START_NS) == pytest.approx(teensy.exact_ms(START_NS), abs=1)
+
+
+def test_millis_wraparound():
+    clock = ClockSync()
+    # millis() wraps 30 samples in
+    teensy = FakeTeensyClock(offset_ms=2**32 - START_NS / 1e6 - 30_000, skew_ppm=-40)
+    for i in range(64):
+        assert sync(clock, teensy, START_NS + i * 1_000_000_000)
+
+    now_ns = START_NS + 64_000_000_000
+    assert clock.stats(now_ns)['skew_ppm'] == pytest.approx(-40, abs=10)
+    assert clock.to_device_ms(now_ns) == pytest.approx(teensy.millis(now_ns), abs=1)
+
+
+def test_pi_timestamp_wraparound():
+    clock = ClockSync()
+    teensy = FakeTeensyClock(offset_ms=0, skew_ppm=0)
+    # The request carries the Pi's time in microseconds, which wraps at 2**32 (~72 minutes)
+    sent_ns = (2**32 - 500) * 1000
+    assert sync(clock, teensy, sent_ns, rtt_ms=1.5)
+    assert clock.min_rtt_ms == pytest.approx(1.5)
+
+
+def test_bad_replies_are_rejected():
+    clock = ClockSync()
+    teensy = FakeTeensyClock(offset_ms=0, skew_ppm=0)
+    assert not clock.handle_reply(b'\x00\x01', START_NS)
+    assert not sync(clock, teensy, START_NS, rtt_ms=500)  # Or one from an older connection
+    assert clock.rejected == 2
+    assert not clock.synced
+    assert clock.to_device_ms(START_NS) is None
+
+
+def test_request_is_stamped_by_the_caller():
+    clock = ClockSync()
+    stamp = clock.request()
+    assert clock.requests == 1
+    assert stamp(START_NS) == (START_NS // 1000).to_bytes(4, 'big')
@@ -0,0 +1,74 @@
+"""Port detection and the by-id checked port cache, on a fake /dev under tmp_path"""
+
+import os
+from collections import namedtuple
+
+import pytest
+
+from utils.device_utils import build_port_index, cached_ports, save_port_cache, set_port_lister
+
+FakePort = namedtuple('FakePort', ['device', 'description', 'serial_number', 'hwid'])
+
+SERIALS = ("111", "222")
+
+
+@pytest.fixture
+def dev(tmp_path):
+    """A device node per serial number, each with its by-id link, listed by a fake port lister"""
+    by_id = tmp_path / "by-id"
+    by_id.mkdir()
+    ports = []
+    for i, serial_number in enumerate(SERIALS):
+        device = tmp_path / f"ttyACM{i}"
+        device.touch()
+        (by_id / f"usb-Teensyduino_USB_Serial_{serial_number}-if00").symlink_to(device)
+        ports.append(FakePort(str(device), "USB Serial", serial_number, f"USB SER={serial_number}"))
+    previous = set_port_lister(lambda: ports)
+    yield tmp_path
+    set_port_lister(previous)
+
+
+def cache(dev):
+    path = str(dev / "cache.json")
+    assert save_port_cache(build_port_index(), path, str(dev / "by-id"))
+    return path
+
+
+def test_cache_holds_while_the_links_do(dev):
+    assert cached_ports(SERIALS, cache(dev)) == {serial_number: str(dev / f"ttyACM{i}")
+                                                 for i, serial_number in enumerate(SERIALS)}
+
+
+def test_entry_is_stale_once_its_link_points_elsewhere(dev):
+    path = cache(dev)
+    # Re-enumerated: the Teensy is back, but on another port
+    link = dev / "by-id" / f"usb-Teensyduino_USB_Serial_{SERIALS[0]}-if00"
+    link.unlink()
+    (dev / "ttyACM7").touch()
+    link.symlink_to(dev / "ttyACM7")
+    assert cached_ports(SERIALS, path) is None
+
+
+def test_entry_is_stale_once_its_link_is_gone(dev):
+    path = cache(dev)
+    (dev / "by-id" / f"usb-Teensyduino_USB_Serial_{SERIALS[1]}-if00").unlink()
+    assert cached_ports(SERIALS, path) is None
+
+
+def test_dangling_link_is_stale(dev):
+    path = cache(dev)
+    # Unplugged: udev hasn't removed the link yet, but the device node is gone
+    os.remove(dev / "ttyACM0")
+    assert cached_ports(SERIALS, path) is None
+
+
+def test_unknown_serial_number_misses_the_cache(dev):
+    assert cached_ports(SERIALS + ("333",), cache(dev)) is None
+
+
+def test_ports_without_a_link_are_not_cached(dev, tmp_path):
+    path = str(dev / "cache.json")
+    empty = tmp_path / "empty-by-id"
+    empty.mkdir()
+    assert not save_port_cache(build_port_index(), path, str(empty))
+    assert cached_ports(SERIALS, path) is None
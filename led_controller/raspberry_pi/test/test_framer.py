@@ -0,0 +1,144 @@
+"""StreamFramer: checksums, resyncing and the mid-read wire format switch"""
+
+import pytest
+
+from utils.config import (
+    CMD_BUTTON_PRESS,
+    CMD_HEARTBEAT,
+    CMD_HELLO,
+    CMD_LED_PULSE,
+    CMD_TIME_SYNC,
+    FRAME_SYNC,
+    WIRE_FORMAT_LEGACY,
+    WIRE_FORMAT_V2,
+    WIRE_FORMAT_V2_CRC8,
+)
+from utils.framer import StreamFramer
+from utils.protocol import CommandPacket, encode_command
+
+V2_FORMATS = (WIRE_FORMAT_V2, WIRE_FORMAT_V2_CRC8)
+
+
+def packets(events):
+    return [(event.command, bytes(event.data[:event.data_length]))
+            for event in events if isinstance(event, CommandPacket)]
+
+
+@pytest.mark.parametrize("wire_format", (WIRE_FORMAT_LEGACY,) + V2_FORMATS)
+def test_round_trip(wire_format):
+    commands = [(CMD_LED_PULSE, bytes([3])), (CMD_TIME_SYNC, bytes(range(8))), (CMD_LED_PULSE, b'')]
+    framer = StreamFramer(wire_format=wire_format)
+    stream = b''.join(encode_command(command, data, wire_format) for command, data in commands)
+    assert packets(framer.feed(stream)) == commands
+    assert framer.bad_frames == framer.resyncs == 0
+
+
+@pytest.mark.parametrize("wire_format", (WIRE_FORMAT_LEGACY,) + V2_FORMATS)
+def test_round_trip_one_byte_at_a_time(wire_format):
+    frame = encode_command(CMD_TIME_SYNC, bytes(range(8)), wire_format)
+    framer = StreamFramer(wire_format=wire_format)
+    events = []
+    for byte in frame:
+        events += framer.feed(bytes([byte]))
+    assert packets(events) == [(CMD_TIME_SYNC, bytes(range(8)))]
+
+
+def test_text_and_frames_interleaved():
+    framer = StreamFramer()
+    events = framer.feed(b"Wire format: v2\r\n" + encode_command(CMD_LED_PULSE, bytes([1]), WIRE_FORMAT_V2)
+                         + b"BUTTON_PRESS:4\n")
+    assert events[0] == "Wire format: v2"
+    assert packets(events) == [(CMD_LED_PULSE, bytes([1]))]
+    assert events[2] == "BUTTON_PRESS:4"
+
+
+@pytest.mark.parametrize("wire_format", V2_FORMATS)
+def test_corrupt_frame_is_rejected_and_the_next_one_kept(wire_format):
+    bad = bytearray(encode_command(CMD_LED_PULSE, bytes([2]), wire_format))
+    bad[3] ^= 0x10  # Strip byte
+    good = encode_command(CMD_BUTTON_PRESS, bytes([4, 1, 0, 0, 0, 9, 0, 8]), wire_format)
+    framer = StreamFramer(wire_format=wire_format)
+    # The bad frame holds legacy command bytes (0x01, 0x02); on a v2 link they mustn't
+    # make the framer wait for a legacy packet's worth of bytes
+    assert packets(framer.feed(bytes(bad) + good)) == [(CMD_BUTTON_PRESS, bytes([4, 1, 0, 0, 0, 9, 0, 8]))]
+    assert framer.bad_frames == 1
+    assert framer.resyncs == 1
+
+
+@pytest.mark.parametrize("wire_format", V2_FORMATS)
+def test_legacy_command_bytes_are_text_on_a_v2_link(wire_format):
+    framer = StreamFramer(wire_format=wire_format)
+    good = encode_command(CMD_LED_PULSE, bytes([7]), wire_format)
+    assert packets(framer.feed(bytes([CMD_LED_PULSE, CMD_HEARTBEAT]) + good)) == [(CMD_LED_PULSE, bytes([7]))]
+    assert framer.resyncs == 0
+
+
+def test_crc8_catches_what_xor_misses():
+    # Swapping two data bytes leaves the XOR unchanged but not the CRC
+    frame = bytearray(encode_command(CMD_TIME_SYNC, bytes([1, 2, 3, 4]), WIRE_FORMAT_V2_CRC8))
+    frame[3], frame[4] = frame[4], frame[3]
+    framer = StreamFramer(wire_format=WIRE_FORMAT_V2_CRC8)
+    assert packets(framer.feed(bytes(frame))) == []
+
+    frame = bytearray(encode_command(CMD_TIME_SYNC, bytes([1, 2, 3, 4]), WIRE_FORMAT_V2))
+    frame[3], frame[4] = frame[4], frame[3]
+    framer = StreamFramer(wire_format=WIRE_FORMAT_V2)
+    assert packets(framer.feed(bytes(frame))) == [(CMD_TIME_SYNC, bytes([2, 1, 3, 4]))]
+
+
+def test_corrupt_legacy_packet_is_rejected():
+    bad = bytearray(encode_command(CMD_LED_PULSE, bytes([2]), WIRE_FORMAT_LEGACY))
+    bad[2] ^= 0x01
+    good = encode_command(CMD_LED_PULSE, bytes([5]), WIRE_FORMAT_LEGACY)
+    framer = StreamFramer(wire_format=WIRE_FORMAT_LEGACY)
+    assert packets(framer.feed(bytes(bad) + good)) == [(CMD_LED_PULSE, bytes([5]))]
+    assert framer.bad_frames >= 1
+
+
+def test_resync_after_garbage():
+    good = encode_command(CMD_LED_PULSE, bytes([7]), WIRE_FORMAT_V2)
+    # Sync bytes with a zero and an oversized length ahead of the real frame
+    garbage = bytes([FRAME_SYNC, 0, FRAME_SYNC, FRAME_SYNC, 0x7F])
+    framer = StreamFramer(wire_format=WIRE_FORMAT_V2)
+    assert packets(framer.feed(garbage + good)) == [(CMD_LED_PULSE, bytes([7]))]
+    assert framer.resyncs == 3
+    assert framer.bad_frames == 0
+
+
+def test_truncated_frame_waits_for_the_rest():
+    frame = encode_command(CMD_TIME_SYNC, bytes(range(8)), WIRE_FORMAT_V2)
+    framer = StreamFramer(wire_format=WIRE_FORMAT_V2)
+    assert framer.feed(frame[:5]) == []
+    assert packets(framer.feed(frame[5:])) == [(CMD_TIME_SYNC, bytes(range(8)))]
+
+
+def test_buffer_is_bounded():
+    framer = StreamFramer(capacity=64)
+    framer.feed(b"x" * 200)
+    assert framer.dropped_bytes == 136
+    assert framer.feed(b"\n") == ["x" * 64]
+
+
+def test_hello_reply_switches_format_within_the_same_read():
+    # The Teensy answers HELLO in legacy format and everything after it in the new one
+    reply = encode_command(CMD_HELLO, bytes([WIRE_FORMAT_V2, 0]), WIRE_FORMAT_LEGACY)
+    after = encode_command(CMD_LED_PULSE, bytes([1]), WIRE_FORMAT_V2)
+    framer = StreamFramer(wire_format=WIRE_FORMAT_LEGACY, max_wire_format=WIRE_FORMAT_V2)
+    assert packets(framer.feed(reply + after)) == [(CMD_HELLO, bytes([WIRE_FORMAT_V2, 0])),
+                                                   (CMD_LED_PULSE, bytes([1]))]
+    assert framer.wire_format == WIRE_FORMAT_V2
+    assert framer.bad_frames == 0
+
+
+def test_hello_reply_is_capped_at_max_wire_format():
+    reply = encode_command(CMD_HELLO, bytes([WIRE_FORMAT_V2 + 1, 0]), WIRE_FORMAT_LEGACY)
+    framer = StreamFramer(wire_format=WIRE_FORMAT_LEGACY, max_wire_format=WIRE_FORMAT_V2)
+    framer.feed(reply)
+    assert framer.wire_format == WIRE_FORMAT_V2
+
+
+def test_hello_reply_leaves_format_alone_without_max_wire_format():
+    reply = encode_command(CMD_HELLO, bytes([WIRE_FORMAT_V2, 0]), WIRE_FORMAT_LEGACY)
+    framer = StreamFramer(wire_format=WIRE_FORMAT_LEGACY)
+    framer.feed(reply)
+    assert framer.wire_format == WIRE_FORMAT_LEGACY
@@ -0,0 +1,126 @@
+"""FrameEncoder: diffs against acknowledged frames and paced writes"""
+
+import pytest
+
+from utils.config import CMD_LED_BATCH, CMD_LED_FRAME_COMMIT, FRAME_SYNC, WIRE_FORMAT_LEGACY, WIRE_FORMAT_V2
+from utils.frames import FrameEncoder
+from utils.protocol import PACKET_SIZE, V2_CHECKSUMS, CommandPacket
+
+NUM_STRIPS = 2
+NUM_LEDS = 40
+
+
+def frame(color=0, changes=()):
+    pixels = [color] * (NUM_STRIPS * NUM_LEDS)
+    for index, changed in changes:
+        pixels[index] = changed
+    return pixels
+
+
+def split_commands(data, wire_format):
+    """(command, data) of every frame in data, which must be whole, valid frames"""
+    commands = []
+    offset = 0
+    while offset < len(data):
+        if wire_format >= WIRE_FORMAT_V2:
+            assert data[offset] == FRAME_SYNC
+            end = offset + data[offset + 1] + 3
+            assert end <= len(data)
+            assert V2_CHECKSUMS[wire_format](data, offset + 1, end - 1) == data[end - 1]
+            command, entry = data[offset + 2], data[offset + 3:end - 1]
+        else:
+            end = offset + PACKET_SIZE
+            packet = CommandPacket.from_bytes(data[offset:end])
+            command, entry = packet.command, bytes(packet.data[:packet.data_length])
+        commands.append((command, bytes(entry)))
+        offset = end
+    return commands
+
+
+@pytest.fixture
+def encoder():
+    return FrameEncoder(num_strips=NUM_STRIPS, num_leds=NUM_LEDS)
+
+
+def test_first_frame_is_sent_in_full(encoder):
+    encoder.encode(frame(0x00FF0000))
+    assert encoder.last_stats.changed_pixels == NUM_STRIPS * NUM_LEDS
+
+
+def test_unchanged_frame_after_ack_only_commits(encoder):
+    encoder.encode(frame(0x00FF0000))
+    encoder.acknowledge(encoder.last_stats.frame_id)
+    data = encoder.encode(frame(0x00FF0000))
+    stats = encoder.last_stats
+    assert stats.changed_pixels == 0
+    assert stats.commands == 1
+    assert split_commands(data, WIRE_FORMAT_LEGACY) == [(CMD_LED_FRAME_COMMIT, bytes([stats.frame_id, 0]))]
+
+
+def test_one_changed_pixel_sends_a_small_frame(encoder):
+    pixels = [i * 0x010203 for i in range(NUM_STRIPS * NUM_LEDS)]
+    encoder.encode(pixels)
+    full = encoder.last_stats.wire_bytes
+    encoder.acknowledge(encoder.last_stats.frame_id)
+    pixels[NUM_LEDS + 3] = 0x000000FF
+    encoder.encode(pixels)
+    assert encoder.last_stats.changed_pixels == 1
+    assert encoder.last_stats.wire_bytes < full / 4
+
+
+def test_unacked_frames_are_diffed_against_too(encoder):
+    encoder.encode(frame(0))
+    encoder.acknowledge(encoder.last_stats.frame_id)
+    # Frame 1 (not yet acked) changed pixel 5; the Teensy may have it, so frame 2 resends it
+    encoder.encode(frame(0, [(5, 1)]))
+    encoder.encode(frame(0))
+    assert encoder.last_stats.changed_pixels == 1
+
+
+def test_incomplete_ack_sends_the_next_frame_in_full(encoder):
+    encoder.encode(frame(0))
+    encoder.acknowledge(encoder.last_stats.frame_id, complete=False)
+    encoder.encode(frame(0))
+    assert encoder.last_stats.changed_pixels == NUM_STRIPS * NUM_LEDS
+
+
+def test_reset_sends_the_next_frame_in_full(encoder):
+    encoder.encode(frame(0))
+    encoder.acknowledge(encoder.last_stats.frame_id)
+    encoder.reset()
+    encoder.encode(frame(0))
+    assert encoder.last_stats.changed_pixels == NUM_STRIPS * NUM_LEDS
+
+
+def test_wrong_pixel_count_is_rejected(encoder):
+    with pytest.raises(ValueError):
+        encoder.encode([0] * 3)
+
+
+@pytest.mark.parametrize("wire_format", (WIRE_FORMAT_LEGACY, WIRE_FORMAT_V2))
+@pytest.mark.parametrize("max_write", (40, 100, 256))
+def test_writes_stay_within_max_write(wire_format, max_write):
+    pixels = [(i * 2654435761) & 0xFFFFFFFF for i in range(NUM_STRIPS * NUM_LEDS)]
+    whole = FrameEncoder(num_strips=NUM_STRIPS, num_leds=NUM_LEDS, wire_format=wire_format).encode(pixels)
+    split = FrameEncoder(num_strips=NUM_STRIPS, num_leds=NUM_LEDS, wire_format=wire_format)
+    writes = split.encode_writes(pixels, max_write)
+    assert len(writes) > 1
+    assert all(len(write) <= max_write for write in writes)
+    assert split.last_stats.wire_bytes == sum(len(write) for write in writes)
+
+    # Each write is whole packets, and together they carry the same commands as one write
+    def unbatched(data):
+        commands = []
+        for command, entry in split_commands(data, wire_format):
+            if command != CMD_LED_BATCH:
+                commands.append((command, entry))
+                continue
+            offset = 0
+            while offset < len(entry):
+                length = entry[offset + 1]
+                commands.append((entry[offset], entry[offset + 2:offset + 2 + length]))
+                offset += 2 + length
+        return commands
+
+    assert [command for write in writes for command in unbatched(write)] == unbatched(whole)
+    assert unbatched(whole)[-1][0] == CMD_LED_FRAME_COMMIT
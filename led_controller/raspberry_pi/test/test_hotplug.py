@@ -0,0 +1,133 @@
+"""HotplugMonitor: uevent parsing, sysfs serial numbers and add/remove over a socketpair"""
+
+import socket
+import threading
+
+import pytest
+
+from utils.hotplug import (
+    UDEV_HEADER,
+    UEVENT_GROUP_UDEV,
+    HotplugMonitor,
+    encode_uevent,
+    parse_uevent,
+    set_uevent_source,
+)
+
+DEVPATH = "/devices/pci0000:00/0000:00:14.0/usb1/1-1/1-1:1.0/tty/ttyACM0"
+
+
+def tty_event(action, devname="ttyACM0", devpath=DEVPATH, **extra):
+    return {'ACTION': action, 'DEVPATH': devpath, 'SUBSYSTEM': 'tty', 'DEVNAME': devname, **extra}
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    """A sysfs tree with one USB device, serial 12345, and a tty under its interface"""
+    (tmp_path / DEVPATH.lstrip('/')).mkdir(parents=True)
+    (tmp_path / "devices/pci0000:00/0000:00:14.0/usb1/1-1/serial").write_text("12345\n")
+    return tmp_path
+
+
+@pytest.mark.parametrize("udev", [True, False])
+def test_parse_round_trip(udev):
+    properties = tty_event('add', ID_SERIAL_SHORT="12345")
+    assert parse_uevent(encode_uevent(properties, udev=udev)) == properties
+
+
+def test_parse_udev_header_points_at_the_properties():
+    body = b"ACTION=remove\0DEVNAME=/dev/ttyACM0\0"
+    padding = b"\xAA" * 16  # libudev may leave a gap between the header and the properties
+    header = UDEV_HEADER.pack(b"libudev\0", socket.htonl(0xFEEDCAFE), UDEV_HEADER.size,
+                              UDEV_HEADER.size + len(padding), len(body), 0, 0, 0, 0)
+    assert parse_uevent(header + padding + body) == {'ACTION': 'remove', 'DEVNAME': '/dev/ttyACM0'}
+
+
+def test_parse_rejects_what_isnt_a_uevent():
+    message = bytearray(encode_uevent(tty_event('add')))
+    message[8:12] = b"\0\0\0\0"  # Bad magic
+    assert parse_uevent(bytes(message)) is None
+    assert parse_uevent(b"libudev\0short") is None
+    assert parse_uevent(b"no header\0ACTION=add\0") is None
+    assert parse_uevent(b"add@/devices/x\0DEVPATH=/devices/x\0") is None  # No ACTION
+
+
+def test_sysfs_serial_walks_up_to_the_usb_device(sysfs):
+    monitor = HotplugMonitor(sysfs_root=str(sysfs))
+    assert monitor._sysfs_serial(DEVPATH) == "12345"
+    assert monitor._sysfs_serial("/devices/virtual/tty/ttyS0") is None
+    # Never looks above sysfs_root/devices
+    assert monitor._sysfs_serial("/../../etc") is None
+
+
+def test_add_and_remove(sysfs):
+    added, removed = [], []
+    monitor = HotplugMonitor(lambda *args: added.append(args), lambda *args: removed.append(args),
+                             sysfs_root=str(sysfs), dev_root="/dev")
+
+    # A kernel add carries no serial number, so it comes from sysfs
+    assert monitor.handle_message(encode_uevent(tty_event('add'), udev=False)) == ('add', "12345", "/dev/ttyACM0")
+    assert monitor.index == {"12345": "/dev/ttyACM0"}
+    # Once sysfs is gone, a remove goes by the device recorded at add
+    assert monitor.handle_message(encode_uevent(tty_event('remove'))) == ('remove', "12345", "/dev/ttyACM0")
+    assert added == [("12345", "/dev/ttyACM0")]
+    assert removed == [("12345", "/dev/ttyACM0")]
+    assert monitor.index == {}
+    assert (monitor.added, monitor.removed, monitor.ignored) == (1, 1, 0)
+
+
+def test_udev_serial_number_wins_over_sysfs(sysfs):
+    monitor = HotplugMonitor(sysfs_root=str(sysfs))
+    event = tty_event('add', devname="/dev/ttyACM3", ID_SERIAL_SHORT="999")
+    assert monitor.handle_message(encode_uevent(event)) == ('add', "999", "/dev/ttyACM3")
+
+
+def test_ignored_events(sysfs):
+    added = []
+    monitor = HotplugMonitor(lambda *args: added.append(args), serial_numbers={"999"}, sysfs_root=str(sysfs))
+    ignored = [
+        {'ACTION': 'add', 'DEVPATH': "/devices/x/input/event3", 'SUBSYSTEM': 'input', 'DEVNAME': "input/event3"},
+        {'ACTION': 'add', 'DEVPATH': "/devices/pci0000:00/0000:00:14.0/usb1/1-1", 'SUBSYSTEM': 'usb'},
+        tty_event('add'),  # Serial 12345 isn't one we were asked about
+        tty_event('remove', devname="ttyACM9"),  # Never seen added
+        tty_event('change', ID_SERIAL_SHORT="999"),
+    ]
+    for event in ignored:
+        assert monitor.handle_message(encode_uevent(event)) is None
+    assert monitor.handle_message(b"garbage") is None
+    assert monitor.ignored == len(ignored) + 1
+    assert added == []
+    assert monitor.index == {}
+
+
+def test_monitor_thread_reads_the_uevent_source(sysfs):
+    pi_end, kernel_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    groups = []
+
+    def source(requested):
+        groups.append(requested)
+        return pi_end
+
+    added = threading.Event()
+    previous = set_uevent_source(source)
+    try:
+        monitor = HotplugMonitor(lambda *args: added.set(), sysfs_root=str(sysfs))
+        assert monitor.start(index={})
+        kernel_end.send(encode_uevent({'ACTION': 'add', 'SUBSYSTEM': 'usb', 'DEVPATH': "/devices/x"}))
+        kernel_end.send(encode_uevent(tty_event('add'), udev=False))
+        assert added.wait(2)
+        monitor.stop()
+    finally:
+        set_uevent_source(previous)
+        kernel_end.close()
+    assert groups == [UEVENT_GROUP_UDEV]
+    assert monitor.index == {"12345": "/dev/ttyACM0"}
+    assert monitor.ignored == 1
+
+
+def test_no_uevent_source():
+    previous = set_uevent_source(lambda groups: None)
+    try:
+        assert not HotplugMonitor().start(index={})
+    finally:
+        set_uevent_source(previous)
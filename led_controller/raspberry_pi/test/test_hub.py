@@ -0,0 +1,105 @@
+"""TeensyHub and AsyncTeensyHub against simulated Teensys: connecting and the wire format handshake"""
+
+import asyncio
+import time
+
+import pytest
+
+from utils import AsyncTeensyHub, CommandPacket, TeensyHub
+from utils.config import CAP_SEQUENCED, CAP_TIME_SYNC, CMD_BUTTON_PRESS, WIRE_FORMAT_LEGACY, WIRE_FORMAT_V2, WIRE_FORMAT_V2_CRC8
+from utils.simulator import TeensySimulator
+
+
+@pytest.fixture
+def sim():
+    with TeensySimulator(heartbeat_interval=None) as sim:
+        yield sim
+
+
+@pytest.fixture
+def hub(sim):
+    hub = TeensyHub()
+    yield hub
+    hub.close_ports()
+
+
+def test_negotiates_each_teensys_best_format(sim, hub):
+    sim['c'].supports_crc = False
+    sim['c'].supports_sequencing = False
+    assert hub.connect()
+    assert hub.wire_formats == {'a': WIRE_FORMAT_V2_CRC8, 'b': WIRE_FORMAT_V2_CRC8, 'c': WIRE_FORMAT_V2}
+    assert hub.capabilities['b'] == CAP_SEQUENCED | CAP_TIME_SYNC
+    assert hub.capabilities['c'] == CAP_TIME_SYNC
+    assert set(hub.clocks) == {'b', 'c'}
+
+
+def test_legacy_firmware_handshakes_share_one_timeout(sim, hub):
+    for teensy in sim.teensys.values():
+        teensy.supports_v2 = False
+    start = time.monotonic()
+    assert hub.connect()
+    elapsed = time.monotonic() - start
+    assert hub.wire_formats == {'a': WIRE_FORMAT_LEGACY, 'b': WIRE_FORMAT_LEGACY, 'c': WIRE_FORMAT_LEGACY}
+    assert not hub.clocks
+    assert elapsed < 1.0  # One 0.5s timeout, not one per Teensy
+
+
+def test_framers_follow_the_handshake(sim, hub):
+    sim['b'].supports_v2 = False
+    assert hub.connect()
+    assert hub.framers['a'].wire_format == WIRE_FORMAT_V2_CRC8
+    assert hub.framers['b'].wire_format == WIRE_FORMAT_LEGACY
+
+
+def test_ports_never_block_the_io_loop(hub):
+    assert hub.connect()
+    assert all(port.timeout == 0 for port in hub.ports.values())
+
+
+def test_hub_offers_its_capabilities(sim, hub):
+    assert hub.connect()
+    assert sim['b'].host_capabilities == CAP_SEQUENCED | CAP_TIME_SYNC
+
+
+def test_async_hub_offers_the_same_capabilities(sim):
+    async def connect():
+        hub = AsyncTeensyHub()
+        assert await hub.connect()
+        await hub.close()
+    asyncio.run(connect())
+    assert sim['b'].host_capabilities == CAP_SEQUENCED | CAP_TIME_SYNC
+
+
+def test_async_hub_reconnect_ignores_the_failed_attempts_end_marker(sim):
+    async def first_event():
+        hub = AsyncTeensyHub()
+        sim['c'].unplug()
+        assert not await hub.connect()
+        sim['c'].plug()
+        assert await hub.connect()
+        sim['a'].press(3)
+        try:
+            async for teensy_id, event in hub:
+                if isinstance(event, CommandPacket) and event.command == CMD_BUTTON_PRESS:
+                    return teensy_id
+        finally:
+            await hub.close()
+    assert asyncio.run(asyncio.wait_for(first_event(), 2)) == 'a'
+
+
+def test_pulse_slots_start_over_with_each_connection(sim, hub):
+    assert hub.connect()
+    slots = hub.pulse_slots['b']
+    now = time.perf_counter_ns()
+
+    def fill():
+        for strip in range(slots.slots):
+            assert slots.admit(strip, now, now)
+        assert slots.active(now) == slots.slots
+
+    fill()
+    hub.handle_disconnect('b', hub.ports['b'], "unplugged")
+    assert slots.active(now) == 0
+    fill()
+    assert hub.reconnect('b')
+    assert slots.active(now) == 0
@@ -10,6 +10,7 @@ import time
 
 # Import centralized configuration and utilities
 from utils import LED_STRIP_PIN_MAPPING, find_teensy, print_available_ports, create_led_pulse_packet
+from utils.framer import StreamFramer
 
 # Pin mapping for reference (now imported from config)
 PIN_MAPPING = LED_STRIP_PIN_MAPPING
@@ -52,6 +53,7 @@ def test_individual_strips():
     print("-" * 60)
     
     working_strips = []
+    framer = StreamFramer()
     
     try:
         for strip_id in range(8):
@@ -70,12 +72,12 @@ def test_individual_strips():
             
             # Read debug output
             response_received = False
-            while teensy_b.in_waiting > 0:
-                response = teensy_b.readline().decode('utf-8').strip()
-                if response:
-                    print(f"   🅱️  {response}")
-                    if "Triggered pulse" in response:
-                        response_received = True
+            if teensy_b.in_waiting > 0:
+                for response in framer.feed(teensy_b.read(teensy_b.in_waiting)):
+                    if isinstance(response, str):
+                        print(f"   🅱️  {response}")
+                        if "Triggered pulse" in response:
+                            response_received = True
             
             if response_received:
                 print(f"   ✅ Command sent successfully to strip {strip_id}")
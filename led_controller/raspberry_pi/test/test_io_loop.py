@@ -0,0 +1,89 @@
+"""SerialEventLoop over real ptys"""
+
+import os
+import threading
+import time
+import tty
+
+import pytest
+import serial
+
+from utils.io_loop import SerialEventLoop
+
+
+@pytest.fixture
+def pty_port():
+    """(master fd, serial.Serial on the slave side opened the way the hub opens ports)"""
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    port = serial.Serial(os.ttyname(slave), 115200, timeout=0)
+    yield master, port
+    port.close()
+    os.close(slave)
+    try:
+        os.close(master)
+    except OSError:
+        pass
+
+
+@pytest.fixture
+def loop():
+    loop = SerialEventLoop()
+    loop.start()
+    yield loop
+    loop.stop()
+    loop.close()
+
+
+def test_chunks_reach_the_handler(loop, pty_port):
+    master, port = pty_port
+    chunks = []
+    received = threading.Event()
+
+    def handler(chunk, received_ns):
+        chunks.append(chunk)
+        if b''.join(chunks) == b"hello":
+            received.set()
+
+    loop.register("b", port, handler)
+    os.write(master, b"hello")
+    assert received.wait(1.0)
+
+
+def test_disconnect_unregisters_the_port(loop, pty_port):
+    master, port = pty_port
+    gone = threading.Event()
+    loop.register("b", port, lambda chunk, received: None, disconnect_handler=lambda error: gone.set())
+    os.close(master)
+    assert gone.wait(1.0)
+    assert "b" not in loop._ports
+
+
+def test_spurious_wakeup_does_not_block():
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    loop = SerialEventLoop()
+    try:
+        # Ports are opened like the hub opens them; reading the 1 byte a readable port with
+        # nothing waiting is asked for must return at once, not after a read timeout
+        port = serial.Serial(os.ttyname(slave), 115200, timeout=0)
+        chunks = []
+        start = time.monotonic()
+        loop._read(port, "b", lambda chunk, received: chunks.append(chunk), None, None, 0)
+        assert time.monotonic() - start < 0.05
+        assert chunks == [b'']
+        port.close()
+    finally:
+        loop.close()
+        os.close(slave)
+        os.close(master)
+
+
+def test_stop_right_after_start():
+    for _ in range(50):
+        loop = SerialEventLoop()
+        loop.start()
+        loop.stop()
+        assert not loop.running
+        loop.close()
@@ -0,0 +1,87 @@
+"""Latency histograms: bucket precision and percentiles"""
+
+import random
+
+import pytest
+
+from utils.dual_teensy import LATENCY_STAGES, TeensyHub, link_rtt_stage
+from utils.latency import (
+    FOLD_BATCH_SIZE,
+    SUB_BUCKET_COUNT,
+    SUB_BUCKET_HALF,
+    LatencyHistogram,
+    LatencyRecorder,
+    bucket_index,
+    bucket_value,
+)
+
+
+def test_small_values_are_exact():
+    for value in range(SUB_BUCKET_COUNT):
+        assert bucket_value(bucket_index(value)) == value
+
+
+def test_bucket_round_trip_error_is_bounded():
+    values = [SUB_BUCKET_COUNT, 1000, 123_456, 10**9, 3 * 10**12]
+    values += random.Random(1).sample(range(SUB_BUCKET_COUNT, 10**10), 1000)
+    for value in values:
+        top = bucket_value(bucket_index(value))
+        assert value <= top
+        assert top - value < value / SUB_BUCKET_HALF, value
+
+
+def test_buckets_are_contiguous():
+    for index in range(1, 20 * SUB_BUCKET_HALF):
+        assert bucket_index(bucket_value(index - 1) + 1) == index
+        assert bucket_index(bucket_value(index)) == index
+
+
+def test_percentiles():
+    histogram = LatencyHistogram()
+    values = list(range(1000, 1_001_000, 1000))  # 1µs to 1ms
+    random.Random(2).shuffle(values)
+    for value in values:
+        histogram.record(value)
+
+    assert histogram.percentile(50) == pytest.approx(500_000, rel=1 / SUB_BUCKET_HALF)
+    assert histogram.percentile(99) == pytest.approx(990_000, rel=1 / SUB_BUCKET_HALF)
+    assert histogram.percentile(100) == 1_000_000  # Capped at the real maximum
+    snapshot = histogram.snapshot()
+    assert snapshot.count == 1000
+    assert snapshot.max_us == 1000
+    assert snapshot.p50_us == pytest.approx(500, rel=1 / SUB_BUCKET_HALF)
+
+
+def test_samples_are_folded_in_batches():
+    histogram = LatencyHistogram()
+    for _ in range(FOLD_BATCH_SIZE - 1):
+        histogram.record(10)
+    assert histogram.count == 0
+    histogram.record(10)
+    assert histogram.count == FOLD_BATCH_SIZE
+
+
+def test_negative_samples_are_dropped():
+    histogram = LatencyHistogram()
+    histogram.record(-5)
+    histogram.record(100)
+    assert histogram.snapshot().count == 1
+    assert histogram.dropped == 1
+    assert histogram.percentile(50) == 100
+
+
+def test_empty_histogram():
+    assert LatencyHistogram().percentile(99) == 0
+
+
+def test_recorder_keeps_listed_stages_in_order():
+    recorder = LatencyRecorder(('first', 'second'))
+    recorder.record('later', 0)
+    assert list(recorder.snapshot()) == ['first', 'second', 'later']
+    assert recorder.snapshot()['first'].count == 0
+    assert recorder.snapshot()['later'].count == 1
+
+
+def test_hub_lists_a_link_stage_per_led_teensy():
+    hub = TeensyHub(teensy_mapping={'a': "A", 'b': "B", 'c': "C"})
+    assert list(hub.latency.histograms) == list(LATENCY_STAGES) + [link_rtt_stage('b'), link_rtt_stage('c')]
@@ -0,0 +1,115 @@
+"""Queued logging: levels, the bounded queue and how repeats are rate limited"""
+
+import io
+
+import pytest
+
+from utils import log as log_module
+from utils.config import LOG_REPEAT_LIMIT
+from utils.log import INFO, WARNING, LogWriter, get_logger, start_logging, stop_logging
+
+
+@pytest.fixture(autouse=True)
+def state(monkeypatch):
+    """A fresh queue and level for each test, whatever the process-wide logger is doing"""
+    state = log_module._LogState()
+    state.level = INFO
+    monkeypatch.setattr(log_module, "_state", state)
+    return state
+
+
+@pytest.fixture
+def writer(state):
+    """LogWriter that only writes when flushed, with messages queued for it"""
+    writer = LogWriter(io.StringIO(), window=1.0, limit=3)
+    state.writer = writer
+    return writer
+
+
+def queue(state, created, msg, *args, name="test"):
+    """Queue a message with a given timestamp, as Logger.log() would have at that time"""
+    state.pending.append((created, INFO, name, msg, args))
+
+
+def lines(writer):
+    return writer.stream.getvalue().splitlines()
+
+
+def test_messages_are_queued_until_flushed(writer):
+    get_logger("test").info("Button %d pressed", 3)
+    assert lines(writer) == []
+    writer.flush()
+    assert len(lines(writer)) == 1
+    assert lines(writer)[0].endswith("] Button 3 pressed")
+
+
+def test_repeats_over_the_limit_are_summarised(state, writer):
+    for button in range(10):
+        queue(state, 100.0 + button * 0.01, "Button %d pressed", button)
+    writer.flush(final=True)
+    assert [line.split("] ", 1)[1] for line in lines(writer)] == [
+        "Button 0 pressed", "Button 1 pressed", "Button 2 pressed",
+        "Button 9 pressed (and 7 more like it)",
+    ]
+
+
+def test_repeats_are_shown_again_once_the_window_is_over(state, writer):
+    for button in range(5):
+        queue(state, 100.0 + button * 0.1, "Button %d pressed", button)
+    queue(state, 101.5, "Button %d pressed", 7)
+    writer.flush(final=True)
+    assert [line.split("] ", 1)[1] for line in lines(writer)] == [
+        "Button 0 pressed", "Button 1 pressed", "Button 2 pressed",
+        "Button 4 pressed (and 2 more like it)",
+        "Button 7 pressed",
+    ]
+
+
+def test_messages_are_limited_separately(state, writer):
+    for i in range(5):
+        queue(state, 100.0, "Pressed %d", i)
+        queue(state, 100.0, "Released %d", i)
+        queue(state, 100.0, "Pressed %d", i, name="other")
+    writer.flush(final=True)
+    assert len(lines(writer)) == 3 * (3 + 1)
+
+
+def test_full_queue_drops_and_counts(monkeypatch, state, writer):
+    monkeypatch.setattr(log_module, "LOG_QUEUE_SIZE", 2)
+    logger = get_logger("test")
+    for i in range(5):
+        logger.warning("Lost %d", i)
+    assert len(state.pending) == 2
+    assert state.dropped == 3
+
+
+def test_level_filters_before_queueing(state, writer):
+    state.level = WARNING
+    logger = get_logger("test")
+    logger.info("Hidden")
+    logger.warning("Shown")
+    assert [entry[3] for entry in state.pending] == ["Shown"]
+
+
+def test_printed_straight_away_without_the_log_thread(capsys):
+    get_logger("test").info("Connected to %s", "Teensy A")
+    assert capsys.readouterr().out.endswith("] Connected to Teensy A\n")
+
+
+def test_bad_arguments_are_logged_anyway(state, writer):
+    queue(state, 100.0, "Button %d", "three")
+    writer.flush()
+    assert "Button %d ('three',) (bad log arguments" in lines(writer)[0]
+
+
+def test_stop_logging_writes_out_everything(state):
+    stream = io.StringIO()
+    start_logging(stream=stream)
+    logger = get_logger("test")
+    for i in range(20):
+        logger.info("Message %d", i)
+    stop_logging()
+    written = stream.getvalue().splitlines()
+    assert len(written) == LOG_REPEAT_LIMIT + 1
+    assert written[-1].endswith(f"Message 19 (and {20 - LOG_REPEAT_LIMIT} more like it)")
+    assert state.writer is None
@@ -0,0 +1,87 @@
+"""Batch packets: packing commands into as few frames as they fit in"""
+
+import pytest
+
+from utils.config import (
+    CMD_LED_BATCH,
+    CMD_LED_EFFECT,
+    CMD_LED_PULSE,
+    WIRE_FORMAT_LEGACY,
+    WIRE_FORMAT_V2,
+    WIRE_FORMAT_V2_CRC8,
+)
+from utils.protocol import (
+    MAX_BATCH_ENTRY_DATA,
+    PACKET_DATA_SIZE,
+    PACKET_SIZE,
+    BurstSize,
+    CommandPacket,
+    create_batch_packet,
+    encode_command,
+    encode_command_burst,
+)
+
+
+def legacy_packets(data):
+    assert len(data) % PACKET_SIZE == 0
+    return [CommandPacket.from_bytes(data[i:i + PACKET_SIZE]) for i in range(0, len(data), PACKET_SIZE)]
+
+
+def batch_entries(packet):
+    data = bytes(packet.data[:packet.data_length])
+    entries = []
+    offset = 0
+    while offset < len(data):
+        command, length = data[offset], data[offset + 1]
+        entries.append((command, data[offset + 2:offset + 2 + length]))
+        offset += 2 + length
+    return entries
+
+
+def test_burst_of_pulses_is_one_batch():
+    commands = [(CMD_LED_PULSE, bytes([strip])) for strip in range(8)]
+    (packet,) = legacy_packets(encode_command_burst(commands))
+    assert packet.command == CMD_LED_BATCH
+    assert batch_entries(packet) == commands
+
+
+def test_single_command_is_sent_as_itself():
+    assert encode_command_burst([(CMD_LED_PULSE, b'\x03')]) == encode_command(CMD_LED_PULSE, b'\x03')
+
+
+def test_burst_splits_into_batches_that_fit():
+    commands = [(CMD_LED_PULSE, bytes([strip % 8])) for strip in range(25)]
+    packets = legacy_packets(encode_command_burst(commands))
+    assert len(packets) == 3  # 10 entries of 3 bytes per packet
+    assert [entry for packet in packets for entry in batch_entries(packet)] == commands
+
+
+def test_long_command_goes_on_its_own_in_order():
+    long_data = bytes(range(MAX_BATCH_ENTRY_DATA + 1))
+    commands = [(CMD_LED_PULSE, b'\x00'), (CMD_LED_EFFECT, long_data), (CMD_LED_PULSE, b'\x01'), (CMD_LED_PULSE, b'\x02')]
+    packets = legacy_packets(encode_command_burst(commands))
+    assert [packet.command for packet in packets] == [CMD_LED_PULSE, CMD_LED_EFFECT, CMD_LED_BATCH]
+    assert bytes(packets[1].data[:packets[1].data_length]) == long_data
+    assert batch_entries(packets[2]) == commands[2:]
+
+
+def test_batch_packet_too_big():
+    with pytest.raises(ValueError):
+        create_batch_packet([(CMD_LED_PULSE, bytes(PACKET_DATA_SIZE))])
+
+
+def test_empty_burst():
+    assert encode_command_burst([]) == b''
+
+
+@pytest.mark.parametrize("wire_format", (WIRE_FORMAT_LEGACY, WIRE_FORMAT_V2, WIRE_FORMAT_V2_CRC8))
+def test_burst_size_tracks_encode_command_burst(wire_format):
+    lengths = [1, 1, 0, 12, 30, 1, 31, 2, 2, 28, 1, 32, 5, 5, 5, 5, 5, 0, 1]
+    commands = [(CMD_LED_EFFECT, bytes(range(length))) for length in lengths]
+    size = BurstSize(wire_format)
+    assert size.size == 0
+    for i, (_, data) in enumerate(commands):
+        expected = len(encode_command_burst(commands[:i + 1], wire_format))
+        assert size.size_with(len(data)) == expected
+        size.add(len(data))
+        assert size.size == expected
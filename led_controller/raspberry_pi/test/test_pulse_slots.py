@@ -0,0 +1,92 @@
+"""PulseSlots: admitting, merging and releasing pulses"""
+
+from utils.pulse_slots import PulseSlots
+
+MS = 1_000_000
+DURATION = 0.5
+HOLD_NS = int(DURATION * 1e9)
+
+
+def slots(count=2):
+    return PulseSlots(slots=count, duration=DURATION, margin=0, merge_window=0.01)
+
+
+def test_admits_until_every_slot_is_busy():
+    model = slots(2)
+    assert model.admit(0, 0, 0)
+    assert model.admit(1, 0, 0)
+    assert not model.admit(2, 0, 0)
+    assert model.discarded == 1
+    assert model.active(0) == 2
+
+
+def test_slots_free_up_once_the_pulse_is_done():
+    model = slots(1)
+    assert model.admit(0, 0, 0)
+    assert not model.admit(1, 0, HOLD_NS - 1)
+    assert model.admit(1, HOLD_NS, HOLD_NS)
+    assert model.active(HOLD_NS) == 1
+
+
+def test_pulses_close_together_on_one_strip_merge():
+    model = slots(4)
+    assert model.admit(3, 0, 0)
+    assert not model.admit(3, 5 * MS, 0)
+    assert model.merged == 1
+    # Further apart, or on another strip, they don't
+    assert model.admit(3, 20 * MS, 0)
+    assert model.admit(4, 20 * MS, 0)
+
+
+def test_release_gives_the_slot_back():
+    model = slots(1)
+    assert model.admit(0, 0, 0)
+    model.release(0, 0)
+    assert model.released == 1
+    assert model.active(0) == 0
+    # The strip no longer has a pulse to merge into either
+    assert model.admit(0, 0, 0)
+    assert model.shed() == 1
+    assert model.stats() == {'admitted': 2, 'merged': 0, 'discarded': 0, 'released': 1}
+
+
+def test_release_keeps_merging_with_the_strips_other_pulses():
+    model = slots(4)
+    assert model.admit(0, 0, 0)
+    assert model.admit(0, 100 * MS, 0)
+    model.release(0, 100 * MS)
+    assert not model.admit(0, 5 * MS, 0)
+    assert model.merged == 1
+
+
+def test_release_of_an_expired_pulse_does_nothing():
+    model = slots(1)
+    assert model.admit(0, 0, 0)
+    assert model.admit(1, HOLD_NS, HOLD_NS)
+    model.release(0, 0)
+    assert model.released == 0
+    assert model.active(HOLD_NS) == 1
+
+
+def test_reset_frees_every_slot():
+    model = slots(2)
+    assert model.admit(0, 0, 0)
+    assert model.admit(1, 0, 0)
+    model.reset()
+    assert model.active(0) == 0
+    assert model.admit(0, 0, 0)  # Nothing left to merge into either
+    assert model.admit(1, 0, 0)
+    model.release(2, 0)
+    assert model.released == 0
+
+
+def test_release_of_a_pulse_already_released_does_nothing():
+    model = slots(1)
+    assert model.admit(0, 0, 0)
+    model.release(0, 0)
+    model.release(0, 0)
+    assert model.released == 1
+    # Its stale entry in the release heap doesn't free the next pulse's slot early
+    assert model.admit(0, 10 * MS, 0)
+    assert not model.admit(1, 10 * MS, HOLD_NS)
+    assert model.active(HOLD_NS) == 1
@@ -0,0 +1,93 @@
+"""SequencedLink: numbering, acks and retransmission"""
+
+from utils.config import CMD_LED_PULSE, CMD_SEQUENCED
+from utils.reliable import INITIAL_RTO_NS, SequencedLink, acked_sequences
+
+MS = 1_000_000
+
+
+def ack(latest, *earlier):
+    """CMD_ACK data for latest plus the earlier sequence numbers in its history"""
+    history = 0
+    for seq in earlier:
+        history |= 1 << ((latest - 1 - seq) & 0xFF)
+    return bytes((latest, history >> 8, history & 0xFF))
+
+
+def test_wrap_numbers_commands():
+    link = SequencedLink()
+    assert link.wrap(CMD_LED_PULSE, bytes([3]), True, 0) == (CMD_SEQUENCED, bytes((0, CMD_LED_PULSE, 3)))
+    assert link.wrap(CMD_LED_PULSE, bytes([4]), True, 0) == (CMD_SEQUENCED, bytes((1, CMD_LED_PULSE, 4)))
+    assert link.in_flight == 2
+    assert link.window_free() == link.window - 2
+
+
+def test_sequence_numbers_wrap_around():
+    link = SequencedLink(window=300)
+    seqs = [link.wrap(CMD_LED_PULSE, b'', False, 0)[1][0] for _ in range(258)]
+    assert seqs[255:] == [255, 0, 1]
+
+
+def test_acked_sequences_reads_the_history():
+    assert acked_sequences(ack(5)) == [5]
+    assert sorted(acked_sequences(ack(5, 4, 2))) == [2, 4, 5]
+    assert sorted(acked_sequences(ack(1, 0, 255))) == [0, 1, 255]
+
+
+def test_ack_settles_and_samples_rtt():
+    link = SequencedLink()
+    for _ in range(3):
+        link.wrap(CMD_LED_PULSE, b'\x00', True, 0)
+    assert link.acknowledge(ack(2, 0, 1), 10 * MS) == 3
+    assert link.in_flight == 0
+    assert link.acked == 3
+    assert link.srtt_ns == 10 * MS
+    assert link.due(10 * INITIAL_RTO_NS) == []
+
+
+def test_duplicate_ack_is_stray():
+    link = SequencedLink()
+    link.wrap(CMD_LED_PULSE, b'\x00', True, 0)
+    assert link.acknowledge(ack(0), MS) == 1
+    assert link.acknowledge(ack(0), 2 * MS) == 0
+    assert link.stray_acks == 1
+
+
+def test_reliable_command_is_resent_after_rto():
+    link = SequencedLink()
+    _, wrapped = link.wrap(CMD_LED_PULSE, bytes([6]), True, 0)
+    assert link.due(INITIAL_RTO_NS - 1) == []
+    assert link.due(INITIAL_RTO_NS) == [(CMD_SEQUENCED, wrapped)]
+    assert link.retransmits == 1
+    assert link.rto_ns == 2 * INITIAL_RTO_NS  # Backed off
+
+    # An ack for a retransmitted command settles it but gives no round trip sample (Karn)
+    assert link.acknowledge(ack(0), INITIAL_RTO_NS + MS) == 1
+    assert link.srtt_ns is None
+
+
+def test_unreliable_command_is_lost_not_resent():
+    link = SequencedLink()
+    link.wrap(CMD_LED_PULSE, bytes([6]), False, 0)
+    assert link.due(INITIAL_RTO_NS) == []
+    assert link.lost == 1
+    assert link.in_flight == 0
+
+
+def test_reliable_command_fails_after_max_retries():
+    link = SequencedLink(max_retries=2)
+    link.wrap(CMD_LED_PULSE, bytes([6]), True, 0)
+    now = 0
+    resent = 0
+    while link.in_flight:
+        now += link.rto_ns
+        resent += len(link.due(now))
+    assert resent == 2
+    assert link.failed == 1
+
+
+def test_next_deadline():
+    link = SequencedLink()
+    assert link.next_deadline_ns() is None
+    link.wrap(CMD_LED_PULSE, b'\x00', True, 5 * MS)
+    assert link.next_deadline_ns() == 5 * MS + INITIAL_RTO_NS
@@ -0,0 +1,83 @@
+"""TimerScheduler: ordering, cancelling and stopping"""
+
+import threading
+import time
+
+import pytest
+
+from utils.scheduler import TimerScheduler, next_tick
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = TimerScheduler("test-timers")
+    yield scheduler
+    scheduler.stop()
+
+
+def test_calls_run_in_deadline_order(scheduler):
+    fired = []
+    done = threading.Event()
+    scheduler.call_later(0.03, fired.append, 3)
+    scheduler.call_later(0.01, fired.append, 1)
+    scheduler.call_later(0.02, fired.append, 2)
+    scheduler.call_later(0.04, done.set)
+    assert done.wait(1.0)
+    assert fired == [1, 2, 3]
+    assert scheduler.fired == 4
+
+
+def test_equal_deadlines_keep_call_order(scheduler):
+    fired = []
+    done = threading.Event()
+    deadline = time.monotonic() + 0.01
+    for i in range(5):
+        scheduler.call_at(deadline, fired.append, i)
+    scheduler.call_at(deadline, done.set)
+    assert done.wait(1.0)
+    assert fired == list(range(5))
+
+
+def test_earlier_call_wakes_the_thread(scheduler):
+    done = threading.Event()
+    scheduler.call_later(10.0, done.set)
+    start = time.monotonic()
+    scheduler.call_later(0.01, done.set)
+    assert done.wait(1.0)
+    assert time.monotonic() - start < 1.0
+
+
+def test_cancelled_call_never_runs(scheduler):
+    fired = []
+    done = threading.Event()
+    call = scheduler.call_later(0.01, fired.append, "cancelled")
+    call.cancel()
+    scheduler.call_later(0.02, done.set)
+    assert done.wait(1.0)
+    assert fired == []
+    assert scheduler.cancelled == 1
+    assert scheduler.pending == 0
+
+
+def test_failing_callback_does_not_stop_the_thread(scheduler):
+    done = threading.Event()
+    scheduler.call_later(0, lambda: 1 / 0)
+    scheduler.call_later(0.01, done.set)
+    assert done.wait(1.0)
+
+
+def test_stop_drops_waiting_calls():
+    scheduler = TimerScheduler("test-timers")
+    fired = []
+    scheduler.call_later(0.05, fired.append, 1)
+    scheduler.stop()
+    time.sleep(0.1)
+    assert fired == []
+    assert scheduler.thread is None
+
+
+def test_next_tick():
+    assert next_tick(10.0, 1.0, 10.0) == 11.0  # Never the start itself
+    assert next_tick(10.0, 1.0, 12.3) == 13.0
+    assert next_tick(10.0, 1.0, 13.0) == 13.0  # On a tick counts as at or after it
+    assert next_tick(10.0, 0.5, 10.2) == 10.5
@@ -0,0 +1,132 @@
+"""
+SimulatedTeensy's batch handling, over its pty like the Pi talks to it
+
+BATCH_CASES follow handleBatchCommand() in src/led_controllers/octo_led_strips.cpp entry
+for entry: anything a Teensy answers on its own (clock sync, link stats, sequenced
+commands) must be answered the same inside a CMD_LED_BATCH, because the writer batches
+whatever is queued together. Keep the two in step when either changes.
+"""
+
+import os
+import selectors
+import time
+
+import pytest
+
+from utils.config import (
+    CMD_ACK,
+    CMD_HELLO,
+    CMD_LED_BATCH,
+    CMD_LED_PULSE,
+    CMD_LINK_STATS,
+    CMD_SEQUENCED,
+    CMD_TIME_SYNC,
+    WIRE_FORMAT_LEGACY,
+    WIRE_FORMAT_V2_CRC8,
+)
+from utils.framer import StreamFramer
+from utils.protocol import CommandPacket, encode_command
+from utils.simulator import SimulatedTeensy
+
+REPLY_TIMEOUT = 1.0
+
+
+def batch(*entries):
+    """CMD_LED_BATCH data for (command, data) entries"""
+    return b''.join(bytes((command, len(data))) + bytes(data) for command, data in entries)
+
+
+def sequenced(seq, command, data=b''):
+    return CMD_SEQUENCED, bytes((seq, command)) + bytes(data)
+
+
+# (name, batch data, reply commands in order, {strip: pulses}, link requests answered from the batch)
+BATCH_CASES = [
+    ("time sync", batch((CMD_TIME_SYNC, b'\x01\x02\x03\x04'), (CMD_LED_PULSE, b'\x01')),
+     [CMD_TIME_SYNC], {1: 1}, 1),
+    ("link stats", batch((CMD_LED_PULSE, b'\x02'), (CMD_LINK_STATS, b'')),
+     [CMD_LINK_STATS], {2: 1}, 1),
+    ("both link requests", batch((CMD_LINK_STATS, b''), (CMD_TIME_SYNC, b'\x00\x00\x00\x09')),
+     [CMD_LINK_STATS, CMD_TIME_SYNC], {}, 2),
+    ("sequenced entries", batch(sequenced(0, CMD_LED_PULSE, b'\x03'), sequenced(1, CMD_TIME_SYNC, b'\x00\x00\x00\x01')),
+     [CMD_TIME_SYNC, CMD_ACK], {3: 1}, 1),
+    ("repeated sequence", batch(sequenced(0, CMD_LED_PULSE, b'\x04'), sequenced(0, CMD_LED_PULSE, b'\x04')),
+     [CMD_ACK], {4: 1}, 0),
+    ("nested batch", batch((CMD_LED_BATCH, batch((CMD_LED_PULSE, b'\x05'))), (CMD_LED_PULSE, b'\x06')),
+     [], {5: 0, 6: 1}, 0),
+    ("truncated entry", batch((CMD_LED_PULSE, b'\x00')) + bytes((CMD_LED_PULSE, 5, 1)),
+     [], {0: 1, 1: 0}, 0),
+]
+
+
+class PiSide:
+    """The Pi's end of a simulated Teensy's pty"""
+
+    def __init__(self, teensy):
+        self.fd = os.open(teensy.path, os.O_RDWR | os.O_NOCTTY)
+        self.framer = StreamFramer(wire_format=WIRE_FORMAT_LEGACY, max_wire_format=WIRE_FORMAT_V2_CRC8)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.fd, selectors.EVENT_READ)
+
+    def send(self, command, data):
+        os.write(self.fd, encode_command(command, data, self.framer.wire_format))
+
+    def replies(self, count, timeout=REPLY_TIMEOUT):
+        """Packets that arrive until count have, or timeout runs out"""
+        packets = []
+        deadline = time.monotonic() + timeout
+        while len(packets) < count and time.monotonic() < deadline:
+            if self.selector.select(deadline - time.monotonic()):
+                events = self.framer.feed(os.read(self.fd, 4096))
+                packets += [event for event in events if isinstance(event, CommandPacket)]
+        return packets
+
+    def close(self):
+        self.selector.close()
+        os.close(self.fd)
+
+
+@pytest.fixture(params=[WIRE_FORMAT_LEGACY, WIRE_FORMAT_V2_CRC8], ids=["legacy", "v2-crc8"])
+def link(request):
+    teensy = SimulatedTeensy("b", heartbeat_interval=None)
+    teensy.start()
+    pi = PiSide(teensy)
+    if request.param != WIRE_FORMAT_LEGACY:
+        pi.send(CMD_HELLO, bytes([request.param, 0]))
+        assert [packet.command for packet in pi.replies(1)] == [CMD_HELLO]
+        assert pi.framer.wire_format == request.param
+    yield teensy, pi
+    pi.close()
+    teensy.stop()
+
+
+@pytest.mark.parametrize("name, data, reply_commands, pulses, link_requests", BATCH_CASES,
+                         ids=[case[0] for case in BATCH_CASES])
+def test_batch(link, name, data, reply_commands, pulses, link_requests):
+    teensy, pi = link
+    pi.send(CMD_LED_BATCH, data)
+    replies = pi.replies(len(reply_commands))
+    # Anything extra would be right behind the expected replies
+    replies += pi.replies(1, timeout=0.05)
+    assert [packet.command for packet in replies] == reply_commands
+    for strip, count in pulses.items():
+        assert teensy.pulses[strip] == count
+    assert teensy.batched_link_requests == link_requests
+    assert teensy.checksum_errors == 0
+
+
+def test_time_sync_reply_echoes_the_request(link):
+    teensy, pi = link
+    pi.send(CMD_LED_BATCH, batch((CMD_LED_PULSE, b'\x00'), (CMD_TIME_SYNC, b'\xAA\xBB\xCC\xDD')))
+    (reply,) = pi.replies(1)
+    assert bytes(reply.data[:4]) == b'\xAA\xBB\xCC\xDD'
+    assert reply.data_length == 8
+
+
+def test_link_stats_reply_counts_frames(link):
+    teensy, pi = link
+    pi.send(CMD_LED_PULSE, b'\x01')
+    pi.send(CMD_LED_BATCH, batch((CMD_LED_PULSE, b'\x02'), (CMD_LINK_STATS, b'')))
+    (reply,) = pi.replies(1)
+    good_frames = int.from_bytes(reply.data[:4], 'big')
+    assert good_frames == 2
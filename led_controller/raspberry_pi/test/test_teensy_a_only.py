@@ -8,7 +8,9 @@ import serial
 import time
 
 # Import centralized configuration and device utilities
-from utils import find_teensy, print_available_ports
+from utils import find_teensy, print_available_ports, CMD_BUTTON_PRESS
+from utils.framer import StreamFramer
+from utils.protocol import decode_button_event
 
 def test_teensy_a_buttons():
     """Test up to 16 buttons on Teensy A with detailed tracking"""
@@ -42,30 +44,34 @@ def test_teensy_a_buttons():
         print("-" * 60)
         
         # Monitor for button presses with detailed debugging
+        framer = StreamFramer()
         for i in range(100):  # Test for ~50 seconds
             try:
                 if teensy_a.in_waiting > 0:
-                    # Read one line at a time
-                    raw_line = teensy_a.readline()
-                    
-                    try:
-                        line = raw_line.decode('utf-8').strip()
-                        if line:
-                            current_time = time.strftime("%H:%M:%S")
-                            print(f"[{current_time}] RAW: '{line}'")
-                            
-                            # Check for button press
-                            if "BUTTON_PRESS:" in line:
-                                try:
-                                    button_id = int(line.split(":")[1])
-                                    print(f"   ✅ CLEAN BUTTON PRESS: Button {button_id}")
-                                except:
-                                    print(f"   ⚠️  CORRUPTED BUTTON PRESS: {line}")
+                    # Split everything received into text lines and binary packets
+                    for line in framer.feed(teensy_a.read(teensy_a.in_waiting)):
+                        if not isinstance(line, str):
+                            if line.command == CMD_BUTTON_PRESS:
+                                event = decode_button_event(line)
+                                action = "PRESS" if event.pressed else "RELEASE"
+                                print(f"   ✅ BINARY BUTTON {action}: Button {event.button_id} "
+                                      f"at {event.timestamp_ms}ms, pressed={event.pressed_bitmap:016b}")
                             else:
-                                print(f"   ℹ️  Other message: {line}")
-                                
-                    except UnicodeDecodeError as e:
-                        print(f"   ❌ DECODE ERROR: {raw_line}")
+                                print(f"   📦 Packet: {line}")
+                            continue
+
+                        current_time = time.strftime("%H:%M:%S")
+                        print(f"[{current_time}] RAW: '{line}'")
+                        
+                        # Check for button press
+                        if "BUTTON_PRESS:" in line:
+                            try:
+                                button_id = int(line.split(":")[1])
+                                print(f"   ✅ CLEAN BUTTON PRESS: Button {button_id}")
+                            except:
+                                print(f"   ⚠️  CORRUPTED BUTTON PRESS: {line}")
+                        else:
+                            print(f"   ℹ️  Other message: {line}")
                         
                 time.sleep(0.5)
                 
@@ -9,6 +9,7 @@ import time
 
 # Import centralized configuration and protocol
 from utils import find_teensy, create_led_pulse_packet
+from utils.framer import StreamFramer
 
 def test_teensy_b_leds():
     """Test LED strips on Teensy B"""
@@ -32,6 +33,7 @@ def test_teensy_b_leds():
     print("Each strip will show a bright white pulse")
     print("-" * 50)
     
+    framer = StreamFramer()
     try:
         # Test each strip
         for strip_id in range(8):
@@ -49,9 +51,9 @@ def test_teensy_b_leds():
             
             # Read any debug output from Teensy B
             if teensy_b.in_waiting > 0:
-                response = teensy_b.readline().decode('utf-8').strip()
-                if response:
-                    print(f"   🅱️ Teensy B: {response}")
+                for response in framer.feed(teensy_b.read(teensy_b.in_waiting)):
+                    if isinstance(response, str):
+                        print(f"   🅱️ Teensy B: {response}")
         
         print("\n🎉 LED test complete!")
         print("💡 Did you see white pulses traveling down your LED strips?")
@@ -24,6 +24,7 @@ from utils import (
     CommandPacket,
     create_button_led_packet
 )
+from utils.framer import StreamFramer
 
 class TeensyAMonitor:
     def __init__(self, port='/dev/ttyACM0', baudrate=9600):
@@ -31,6 +32,7 @@ class TeensyAMonitor:
         self.baudrate = baudrate
         self.ser = None
         self.running = False
+        self.framer = StreamFramer()
     
     def connect(self):
         """Connect to Teensy A"""
@@ -90,12 +92,14 @@ class TeensyAMonitor:
         
         try:
             while self.running:
-                # Read text output from Teensy
+                # Read text and binary output from Teensy
                 if self.ser.in_waiting > 0:
                     try:
-                        line = self.ser.readline().decode('utf-8').strip()
-                        if line:
-                            self.handle_text_command(line)
+                        for event in self.framer.feed(self.ser.read(self.ser.in_waiting)):
+                            if isinstance(event, str):
+                                self.handle_text_command(event)
+                            else:
+                                self.handle_packet(event)
                     except Exception as e:
                         print(f"Error reading line: {e}")
                 
@@ -106,6 +110,16 @@ class TeensyAMonitor:
         finally:
             self.running = False
     
+    def handle_packet(self, packet):
+        """Handle binary packets from Teensy A"""
+        current_time = time.strftime("%H:%M:%S")
+        
+        if packet.command == CMD_HEARTBEAT:
+            millis = int.from_bytes(packet.data[:4], 'big')
+            print(f"[{current_time}] 💓 HEARTBEAT: {millis}ms")
+        else:
+            print(f"[{current_time}] 📦 {packet}")
+    
     def handle_text_command(self, line):
         """Handle text commands from Teensy A"""
         current_time = time.strftime("%H:%M:%S")
@@ -0,0 +1,44 @@
+"""TraceRecorder/TraceReader round trips"""
+
+import pytest
+
+from utils.trace import TRACE_BUTTON, TRACE_HEADER, TRACE_LED_COMMAND, TRACE_RECORD, TraceReader, TraceRecorder
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "run.trace"
+    with TraceRecorder(path) as recorder:
+        recorder.record(TRACE_BUTTON, 0, 5, timestamp_ns=1_000)
+        recorder.record(TRACE_LED_COMMAND, "b", 0x101, 3, timestamp_ns=2_500_001_000)
+    reader = TraceReader(path)
+    assert len(reader) == 2
+    assert list(reader) == [(1_000, TRACE_BUTTON, 0, 5, 0), (2_500_001_000, TRACE_LED_COMMAND, ord("b"), 0x01, 3)]
+    assert reader[-1] == reader[1]
+    assert reader.duration() == 2.5
+    assert reader.counts() == {'button': 1, 'led': 1}
+
+
+def test_records_span_several_buffers(tmp_path):
+    path = tmp_path / "run.trace"
+    with TraceRecorder(path, buffer_records=8) as recorder:
+        for i in range(100):
+            recorder.record(TRACE_BUTTON, 0, i % 12, timestamp_ns=i)
+    reader = TraceReader(path)
+    assert [record[0] for record in reader] == list(range(100))
+
+
+def test_truncated_trace_drops_the_partial_record(tmp_path):
+    path = tmp_path / "run.trace"
+    with TraceRecorder(path) as recorder:
+        for i in range(3):
+            recorder.record(TRACE_BUTTON, 0, i, timestamp_ns=i)
+    data = path.read_bytes()
+    path.write_bytes(data[:TRACE_HEADER.size + 2 * TRACE_RECORD.size + 3])
+    assert len(TraceReader(path)) == 2
+
+
+def test_not_a_trace(tmp_path):
+    path = tmp_path / "run.trace"
+    path.write_bytes(b"x" * 64)
+    with pytest.raises(ValueError):
+        TraceReader(path)
@@ -0,0 +1,241 @@
+"""DeviceWriter: token bucket pacing, priorities, deadlines and what a full queue sheds"""
+
+import threading
+from functools import partial
+
+import pytest
+
+from utils import writer as writer_module
+from utils.clock_sync import ClockSync
+from utils.config import CMD_LED_EFFECT, CMD_TIME_SYNC, WIRE_FORMAT_LEGACY, WIRE_FORMAT_V2
+from utils.protocol import PACKET_SIZE, get_led_pulse_command
+from utils.writer import DeviceWriter, DROP_NEWEST, MERGE, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK
+
+
+class FakeClock:
+    """Stands in for the time module in utils.writer"""
+
+    def __init__(self):
+        self.now_ns = 0
+
+    def perf_counter_ns(self):
+        return self.now_ns
+
+    def advance(self, seconds):
+        self.now_ns += int(seconds * 1e9)
+
+
+class FakePort:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(writer_module, "time", clock)
+    return clock
+
+
+def make_writer(**kwargs):
+    kwargs.setdefault('wire_format', WIRE_FORMAT_V2)
+    writer = DeviceWriter(FakePort(), "test", **kwargs)
+    # What start() does, minus the thread: pump() stands in for it
+    writer._running = True
+    writer.started_ns = writer._window_start_ns = 0
+    return writer
+
+
+def pump(writer):
+    """One pass of the writer thread, run here against the fake clock; returns what was written"""
+    with writer._condition:
+        entries, fresh, oldest_queued_ns = writer._take()
+        shed = writer._take_shed()
+    writer._call_on_drops(shed)
+    if entries:
+        writer._write(entries, fresh, oldest_queued_ns)
+    return entries
+
+
+def frames(count, size, tag=0):
+    """Already encoded frames, told apart by their first byte"""
+    return [bytes([tag + i]) * size for i in range(count)]
+
+
+def test_bucket_paces_writes(clock):
+    writer = make_writer(rate=1000, burst=100, reserve=0)
+    queued = frames(4, 40)
+    for frame in queued:
+        writer.send_bytes(frame)
+
+    assert pump(writer) == [(None, frame) for frame in queued[:2]]
+    assert writer.tokens == 20
+    assert pump(writer) == []  # 20 tokens left, the next frame needs 40
+    assert writer._wait_timeout() == pytest.approx(0.02)
+
+    clock.advance(0.02)
+    assert pump(writer) == [(None, queued[2])]
+    assert writer.throttled == 1  # One hold-up, however many passes it lasted
+    clock.advance(1)
+    assert pump(writer) == [(None, queued[3])]
+    assert writer.port.writes == [queued[0] + queued[1], queued[2], queued[3]]
+
+
+def test_oversized_write_goes_once_the_bucket_is_full(clock):
+    writer = make_writer(rate=1000, burst=100, reserve=0)
+    big = frames(1, 150)[0]
+    writer.send_bytes(big)
+    assert pump(writer) == [(None, big)]
+    assert writer.tokens == -50  # Paid back before anything else goes
+    writer.send_bytes(frames(1, 10)[0])
+    assert pump(writer) == []
+
+
+def test_interactive_commands_go_first(clock):
+    writer = make_writer(rate=None)
+    bulk, normal, interactive = frames(1, 10, 0x10), frames(1, 10, 0x20), frames(1, 10, 0x30)
+    writer.send_bytes(bulk[0], priority=PRIORITY_BULK)
+    writer.send_bytes(normal[0], priority=PRIORITY_NORMAL)
+    writer.send_bytes(interactive[0], priority=PRIORITY_INTERACTIVE)
+    assert pump(writer) == [(None, interactive[0]), (None, normal[0]), (None, bulk[0])]
+
+
+def test_only_interactive_commands_spend_the_reserve(clock):
+    writer = make_writer(rate=1000, burst=100, reserve=60)
+    bulk = frames(2, 30, 0x10)
+    interactive = frames(2, 30, 0x20)
+    for frame in bulk:
+        writer.send_bytes(frame, priority=PRIORITY_BULK)
+    for frame in interactive:
+        writer.send_bytes(frame, priority=PRIORITY_INTERACTIVE)
+
+    # 40 tokens left after the pulses, but bulk may not dip below 60
+    assert pump(writer) == [(None, frame) for frame in interactive]
+    assert writer.depth == 2
+
+    clock.advance(1)
+    assert pump(writer) == [(None, bulk[0])]  # 30 of the 40 above the reserve
+    assert pump(writer) == []
+    assert writer.bulk_write_size == 40
+
+
+def test_a_held_back_command_holds_back_less_important_ones(clock):
+    writer = make_writer(rate=1000, burst=100, reserve=0)
+    writer.send_bytes(frames(1, 90)[0], priority=PRIORITY_NORMAL)
+    pump(writer)
+    big, small = frames(1, 50, 0x10)[0], frames(1, 5, 0x20)[0]
+    writer.send_bytes(big, priority=PRIORITY_NORMAL)
+    writer.send_bytes(small, priority=PRIORITY_BULK)
+    assert pump(writer) == []  # small would fit, but must not overtake big
+
+
+def test_tokens_are_charged_for_the_batched_write(clock):
+    writer = make_writer(wire_format=WIRE_FORMAT_LEGACY, rate=1000, burst=2 * PACKET_SIZE, reserve=0)
+    pulses = [get_led_pulse_command(strip) for strip in range(5)]
+    writer.send_many(pulses)
+
+    # Five pulses share one batch packet, so they all fit in what two lone packets would cost
+    assert pump(writer) == pulses
+    assert writer.port.writes[0] == writer._encode(pulses)
+    assert len(writer.port.writes[0]) == PACKET_SIZE
+    assert writer.tokens == PACKET_SIZE
+
+
+def test_expired_commands_are_dropped_unsent(clock):
+    writer = make_writer(rate=None, deadlines=(0.1, 0.5, 1.0))
+    dropped = []
+    writer.send(*get_led_pulse_command(0), priority=PRIORITY_INTERACTIVE, on_drop=lambda: dropped.append('pulse'))
+    writer.send(CMD_LED_EFFECT, b'\x00\x01', priority=PRIORITY_BULK, on_drop=lambda: dropped.append('effect'))
+
+    clock.advance(0.2)
+    assert pump(writer) == [(CMD_LED_EFFECT, b'\x00\x01')]
+    assert writer.expired == 1
+    assert dropped == ['pulse']
+
+
+def test_on_drop_is_called_without_the_lock(clock):
+    writer = make_writer(rate=None, deadlines=(0.1, 0.1, 0.1))
+    lock_free = []
+
+    def on_drop():
+        # The writer's lock is reentrant, so try it from another thread
+        other = threading.Thread(target=writer.send_many, args=((),))
+        other.start()
+        other.join(1)
+        lock_free.append(not other.is_alive())
+
+    writer.send(*get_led_pulse_command(0), on_drop=on_drop)
+    clock.advance(0.2)
+    pump(writer)
+    writer.send(*get_led_pulse_command(1), on_drop=on_drop)
+    writer.abandon()
+    assert lock_free == [True, True]
+
+
+def queued(writer):
+    return [[entry[:2] for entry in queue] for queue in writer._queues]
+
+
+def test_full_queue_drops_the_oldest(clock):
+    writer = make_writer(rate=None, max_queue=2)
+    dropped = []
+    for strip in range(3):
+        writer.send(*get_led_pulse_command(strip), on_drop=partial(dropped.append, strip))
+    assert queued(writer)[PRIORITY_NORMAL] == [get_led_pulse_command(1), get_led_pulse_command(2)]
+    assert writer.dropped == 1
+    assert dropped == [0]
+
+
+def test_full_queue_sheds_the_least_important_first(clock):
+    writer = make_writer(rate=None, max_queue=2)
+    writer.send(CMD_LED_EFFECT, b'\x00', priority=PRIORITY_NORMAL)
+    writer.send(CMD_LED_EFFECT, b'\x01', priority=PRIORITY_BULK)
+    assert writer.send(*get_led_pulse_command(0), priority=PRIORITY_INTERACTIVE)
+    assert queued(writer) == [[get_led_pulse_command(0)], [(CMD_LED_EFFECT, b'\x00')], []]
+
+
+def test_full_queue_never_sheds_more_important_commands(clock):
+    writer = make_writer(rate=None, max_queue=2)
+    for strip in range(2):
+        writer.send(*get_led_pulse_command(strip), priority=PRIORITY_INTERACTIVE)
+    assert not writer.send(CMD_LED_EFFECT, b'\x00', priority=PRIORITY_BULK)
+    assert queued(writer)[PRIORITY_INTERACTIVE] == [get_led_pulse_command(0), get_led_pulse_command(1)]
+    assert writer.dropped == 1
+
+
+def test_full_queue_drops_the_newest(clock):
+    writer = make_writer(rate=None, max_queue=2, policy=DROP_NEWEST)
+    dropped = []
+    for strip in range(3):
+        writer.send(*get_led_pulse_command(strip), on_drop=partial(dropped.append, strip))
+    assert queued(writer)[PRIORITY_NORMAL] == [get_led_pulse_command(0), get_led_pulse_command(1)]
+    assert dropped == [2]
+
+
+def test_full_queue_merges_identical_commands(clock):
+    writer = make_writer(rate=None, max_queue=2, policy=MERGE)
+    writer.send(*get_led_pulse_command(0))
+    writer.send(*get_led_pulse_command(1))
+    assert not writer.send(*get_led_pulse_command(0))
+    assert writer.merged == 1 and writer.dropped == 0
+
+    # Nothing to merge with: falls back to dropping the oldest
+    assert writer.send(*get_led_pulse_command(2))
+    assert queued(writer)[PRIORITY_NORMAL] == [get_led_pulse_command(1), get_led_pulse_command(2)]
+    assert writer.dropped == 1
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        DeviceWriter(FakePort(), "test", policy="drop_everything")
+
+
+def test_function_data_is_stamped_when_written(clock):
+    writer = make_writer(rate=None)
+    stamp = ClockSync().request()
+    writer.send(CMD_TIME_SYNC, stamp, priority=PRIORITY_INTERACTIVE)
+    clock.advance(0.03)  # Waiting in the queue is not part of the round trip
+    assert pump(writer) == [(CMD_TIME_SYNC, stamp(clock.now_ns))]
@@ -6,26 +6,65 @@ This module provides centralized access to:
 - Communication protocols (protocol)
 - Configuration settings (config)
 - Dual Teensy management (dual_teensy)
+- Non-blocking logging (log)
 """
 
-# Re-export commonly used items for convenience
+import importlib
+
+# Re-export commonly used items for convenience. config is only constants, so it is
+# imported up front; everything else is imported the first time it is used (PEP 562),
+# so a script that only encodes packets doesn't load pyserial, the hub or asyncio.
 from .config import *
-from .device_utils import find_teensy, detect_all_teensys, print_available_ports
-from .protocol import CommandPacket, create_led_pulse_packet, create_button_led_packet
-from .dual_teensy import DualTeensyTester
+
+_LAZY_EXPORTS = {
+    'find_teensy': '.device_utils',
+    'detect_all_teensys': '.device_utils',
+    'print_available_ports': '.device_utils',
+    'CommandPacket': '.protocol',
+    'create_led_pulse_packet': '.protocol',
+    'create_button_led_packet': '.protocol',
+    'get_led_pulse_frame': '.protocol',
+    'TeensyHub': '.dual_teensy',
+    'DualTeensyTester': '.dual_teensy',
+    'AsyncTeensyHub': '.dual_teensy',
+    'get_logger': '.log',
+    'start_logging': '.log',
+    'stop_logging': '.log',
+}
+
+
+def __getattr__(name):
+    module = _LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value  # Later lookups don't come back here
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_EXPORTS))
+
 
 __all__ = [
     # From config
-    'TEENSY_A_SERIAL', 'TEENSY_B_SERIAL', 'TEENSY_MAPPING',
-    'CMD_LED_PULSE', 'CMD_LED_EFFECT', 'CMD_BUTTON_PRESS', 
+    'TEENSY_A_SERIAL', 'TEENSY_B_SERIAL', 'TEENSY_MAPPING', 'BUTTON_TEENSY_ID',
+    'RECONNECT_INITIAL_DELAY', 'RECONNECT_MAX_DELAY', 'LOG_LEVEL', 'PULSE_LEAD_TIME',
+    'CMD_LED_PULSE', 'CMD_LED_EFFECT', 'CMD_LED_BATCH', 'CMD_LED_FRAME_SPAN',
+    'CMD_LED_FRAME_COMMIT', 'CMD_HELLO', 'CMD_SEQUENCED', 'CMD_ACK',
+    'CMD_TIME_SYNC', 'CMD_LED_PULSE_AT', 'CMD_LINK_STATS', 'CMD_BUTTON_PRESS',
     'CMD_BUTTON_LED', 'CMD_SENSOR_DATA', 'CMD_HEARTBEAT',
+    'WIRE_FORMAT_LEGACY', 'WIRE_FORMAT_V2', 'WIRE_FORMAT_V2_CRC8', 'FRAME_SYNC', 'CAP_SEQUENCED', 'CAP_TIME_SYNC',
     
     # From device_utils
     'find_teensy', 'detect_all_teensys', 'print_available_ports',
     
     # From protocol
-    'CommandPacket', 'create_led_pulse_packet', 'create_button_led_packet',
+    'CommandPacket', 'create_led_pulse_packet', 'create_button_led_packet', 'get_led_pulse_frame',
     
     # From dual_teensy
-    'DualTeensyTester',
+    'TeensyHub', 'DualTeensyTester', 'AsyncTeensyHub',
+    
+    # From log
+    'get_logger', 'start_logging', 'stop_logging',
 ]
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+NTP-style estimate of each Teensy's millis() clock against the Pi's perf_counter
+
+The Pi sends CMD_TIME_SYNC carrying the low 32 bits of its clock in microseconds; the
+firmware echoes that back with its millis() at the moment it handled the request. The
+round trip brackets the Teensy's reading, so each reply is a sample
+
+    device ms  ~  Pi ms at the midpoint of the round trip
+
+good to within half the round trip. As in NTP, samples with a long round trip (the
+request sat in a queue, or the reply did) are the least trustworthy, so only those close
+to the shortest recent round trip are used. A straight line is fitted through them: its
+slope is the skew of the Teensy's crystal and its value now is the offset.
+
+With a fit, Pi times convert to the Teensy's millis() so a pulse can be scheduled for the
+same moment on every Teensy.
+"""
+
+from collections import deque
+
+from .config import TIME_SYNC_WINDOW
+
+MAX_SYNC_RTT_US = 200_000  # Replies slower than this (or to an older connection) are ignored
+RTT_SLACK_MS = 1.0  # millis() ticks once a ms, so allow this much above the best round trip
+MIN_SKEW_SPAN_MS = 2000  # Samples must span this long before a slope is fitted
+
+
+class ClockSync:
+    """Offset and skew of one Teensy's millis() clock"""
+
+    def __init__(self, window=TIME_SYNC_WINDOW):
+        self._samples = deque(maxlen=window)  # (Pi ms, unwrapped device ms, round trip ms)
+        self._device_wraps = 0
+        self._last_device_ms = None
+        self.requests = 0
+        self.replies = 0
+        self.rejected = 0
+
+        # device_ms = intercept + slope * (pi_ms - origin_ms), from _fit()
+        self.origin_ms = None
+        self.intercept_ms = None
+        self.slope = 1.0
+        self.residual_ms = None  # RMS distance of the fitted samples from the line
+        self.min_rtt_ms = None
+
+    @property
+    def synced(self):
+        return self.intercept_ms is not None
+
+    def request(self):
+        """
+        Count one more CMD_TIME_SYNC request; returns stamp() to queue as its data
+
+        The writer calls it as it writes the request, so time spent in the write queue
+        doesn't count towards the round trip.
+        """
+        self.requests += 1
+        return self.stamp
+
+    @staticmethod
+    def stamp(now_ns):
+        """Data for a CMD_TIME_SYNC sent at now_ns (perf_counter_ns)"""
+        return ((now_ns // 1000) & 0xFFFFFFFF).to_bytes(4, 'big')
+
+    def handle_reply(self, data, received_ns):
+        """
+        Add the sample from a CMD_TIME_SYNC reply
+
+        Args:
+            data: [echoed Pi time (u32 us), Teensy millis() (u32)]
+            received_ns: perf_counter_ns() when the reply was read
+
+        Returns:
+            True if the sample was used
+        """
+        if len(data) < 8:
+            self.rejected += 1
+            return False
+        sent_us = int.from_bytes(data[0:4], 'big')
+        device_ms = int.from_bytes(data[4:8], 'big')
+        received_us = received_ns // 1000
+        rtt_us = (received_us - sent_us) & 0xFFFFFFFF
+        if rtt_us > MAX_SYNC_RTT_US:
+            self.rejected += 1
+            return False
+
+        # millis() is a u32 that wraps every ~49.7 days
+        if self._last_device_ms is not None and device_ms < self._last_device_ms - 0x80000000:
+            self._device_wraps += 1
+        self._last_device_ms = device_ms
+        # millis() truncates, so the true time is on average half a tick later
+        device_ms += (self._device_wraps << 32) + 0.5
+
+        self.replies += 1
+        pi_ms = (received_us - rtt_us / 2) / 1000
+        self._samples.append((pi_ms, device_ms, rtt_us / 1000))
+        self._fit()
+        return True
+
+    def to_device_ms(self, pi_ns):
+        """The Teensy's millis() at perf_counter_ns() pi_ns, or None before the first sample"""
+        if self.intercept_ms is None:
+            return None
+        device_ms = self.intercept_ms + self.slope * (pi_ns / 1e6 - self.origin_ms)
+        return int(round(device_ms)) & 0xFFFFFFFF
+
+    def offset_ms(self, pi_ns):
+        """Teensy clock minus Pi clock at pi_ns, in ms (ignoring millis() wraps)"""
+        if self.intercept_ms is None:
+            return None
+        return self.intercept_ms + self.slope * (pi_ns / 1e6 - self.origin_ms) - pi_ns / 1e6
+
+    def stats(self, now_ns=None):
+        """Snapshot of the estimate; offset is given at now_ns (or the latest sample)"""
+        if now_ns is None and self._samples:
+            now_ns = int(self._samples[-1][0] * 1e6)
+        return {
+            'requests': self.requests,
+            'replies': self.replies,
+            'rejected': self.rejected,
+            'offset_ms': self.offset_ms(now_ns) if now_ns is not None else None,
+            'skew_ppm': (self.slope - 1.0) * 1e6,
+            'min_rtt_ms': self.min_rtt_ms,
+            'residual_ms': self.residual_ms,
+        }
+
+    def __str__(self):
+        if not self.synced:
+            return f"not synced ({self.requests} requests, {self.replies} replies)"
+        stats = self.stats()
+        return (f"offset {stats['offset_ms']:.1f}ms, skew {stats['skew_ppm']:.0f}ppm, "
+                f"min rtt {self.min_rtt_ms:.2f}ms, residual {self.residual_ms:.2f}ms "
+                f"({self.replies} samples)")
+
+    def _fit(self):
+        samples = self._samples
+        self.min_rtt_ms = min(rtt for _, _, rtt in samples)
+        cutoff = self.min_rtt_ms + RTT_SLACK_MS
+        good = [(pi, device) for pi, device, rtt in samples if rtt <= cutoff]
+
+        # Fit relative to the first good sample to keep the sums small
+        origin = good[0][0]
+        xs = [pi - origin for pi, _ in good]
+        ys = [device for _, device in good]
+        n = len(good)
+        mean_x = sum(xs) / n
+        mean_y = sum(ys) / n
+        sxx = sum((x - mean_x) ** 2 for x in xs)
+        if n >= 3 and xs[-1] - xs[0] >= MIN_SKEW_SPAN_MS and sxx > 0:
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sxx
+        else:
+            # Too little to see drift: assume the crystals agree
+            slope = 1.0
+        self.origin_ms = origin
+        self.slope = slope
+        self.intercept_ms = mean_y - slope * mean_x
+        self.residual_ms = (sum((y - self.intercept_ms - slope * x) ** 2 for x, y in zip(xs, ys)) / n) ** 0.5
@@ -24,26 +24,99 @@ TEENSY_MAPPING = {
     "c": TEENSY_C_SERIAL,
 }
 
+# Teensy A reads the buttons. Every other Teensy in TEENSY_MAPPING drives NUM_STRIPS_PER_TEENSY
+# LED strips, numbered in mapping order (B has strips 0-7, C has 8-15, ...), so adding an LED
+# controller only needs its serial number added above.
+BUTTON_TEENSY_ID = "a"
+
+# A Teensy that drops off USB is retried in the background, waiting RECONNECT_INITIAL_DELAY
+# seconds after the first failed attempt and doubling up to RECONNECT_MAX_DELAY
+RECONNECT_INITIAL_DELAY = 0.5
+RECONNECT_MAX_DELAY = 10.0
+
 # Communication Protocol Constants
 # ===============================
 
 # Command codes for Teensy communication
 CMD_LED_PULSE = 0x01
 CMD_LED_EFFECT = 0x02
+CMD_LED_BATCH = 0x03  # Several commands packed into one packet
+CMD_LED_FRAME_SPAN = 0x04  # Changed pixels of a pushed frame
+CMD_LED_FRAME_COMMIT = 0x05  # Show a pushed frame (echoed back by the Teensy as the ack)
+CMD_HELLO = 0x06  # Wire format handshake: [max version, capabilities]
+CMD_SEQUENCED = 0x07  # [seq, command, data...]: a command the Teensy acks (see utils/reliable.py)
+CMD_ACK = 0x08  # Teensy -> Pi: [latest seq, bitmap of the 16 seqs before it, big-endian]
+CMD_TIME_SYNC = 0x0B  # Pi -> Teensy: [Pi time in us, u32]; echoed back as [Pi time, millis() u32] (see utils/clock_sync.py)
+CMD_LED_PULSE_AT = 0x0C  # [strip, start time in the Teensy's millis(), u32 big-endian]
+CMD_LINK_STATS = 0x0E  # Pi -> Teensy: []; answered with [good frames, bad frames, resyncs], u32 big-endian each
 CMD_BUTTON_PRESS = 0x10
 CMD_BUTTON_LED = 0x11
 CMD_SENSOR_DATA = 0x20
 CMD_HEARTBEAT = 0xFF
 
+# Wire formats (must match include/config.h)
+# Legacy: every command is a fixed 35 byte CommandPacket
+# V2: [FRAME_SYNC, length, command, data..., checksum], length counts command + data and the
+# checksum is the XOR of length, command and data. Negotiated per connection with CMD_HELLO
+# V2 CRC-8: V2 framing with a CRC-8 (polynomial 0x07) of the same bytes instead of the XOR,
+# which also catches swapped bytes and most burst errors
+WIRE_FORMAT_LEGACY = 1
+WIRE_FORMAT_V2 = 2
+WIRE_FORMAT_V2_CRC8 = 3
+FRAME_SYNC = 0xFE
+
+# CMD_HELLO capability bits, sent by the Teensy in its reply
+CAP_SEQUENCED = 0x01  # Understands CMD_SEQUENCED and acks it
+CAP_TIME_SYNC = 0x02  # Answers CMD_TIME_SYNC and takes CMD_LED_PULSE_AT
+
 # Serial Communication Settings
 # ============================
 
 DEFAULT_BAUDRATE = 9600
 SERIAL_TIMEOUT = 1.0
 
+# Per-Teensy write queue (see utils/writer.py)
+WRITER_QUEUE_SIZE = 64  # Commands waiting to be written before the full policy kicks in
+WRITER_FULL_POLICY = "drop_oldest"  # "drop_oldest", "drop_newest" or "merge"
+# Writes are paced with a token bucket sized to the link. The Teensys are USB serial devices,
+# which ignore the baud rate; what limits them is loop() draining the USB receive buffers
+# between frames, so the rate is what a Teensy reads comfortably rather than DEFAULT_BAUDRATE.
+# None turns pacing off
+LINK_BYTES_PER_SECOND = 100_000
+LINK_BURST_BYTES = 2048  # Bytes that may go out back to back after a quiet spell
+LINK_INTERACTIVE_RESERVE_BYTES = 256  # Kept in the bucket for pulses: other commands never spend it
+# Seconds a queued command stays worth sending, by priority (interactive, normal, bulk); older ones are dropped
+COMMAND_DEADLINES = (0.25, 1.0, 2.0)
+
+# Sequenced commands (see utils/reliable.py), used with firmware that reports CAP_SEQUENCED
+SEQUENCED_WINDOW = 16  # Commands in flight before the writer waits for acks (the Teensy tracks 16)
+SEQUENCED_MAX_RETRIES = 3  # Retransmits of a reliable command before it is given up on
+
+# Clock sync (see utils/clock_sync.py), used with firmware that reports CAP_TIME_SYNC
+TIME_SYNC_INTERVAL = 1.0  # Seconds between sync requests to each Teensy once it is synced
+TIME_SYNC_BURST = 8  # Requests sent TIME_SYNC_BURST_INTERVAL apart after connecting, for a quick first estimate
+TIME_SYNC_BURST_INTERVAL = 0.05
+TIME_SYNC_WINDOW = 64  # Recent samples the offset and skew are fitted to
+# Pulses are scheduled this far after the button press, so every Teensy has the command
+# before it is due and they all start it on the same frame
+PULSE_LEAD_TIME = 0.03
+
+# Logging (see utils/log.py)
+LOG_LEVEL = "INFO"  # "DEBUG" also shows every queued command and all LED Teensy output
+LOG_QUEUE_SIZE = 10000  # Records waiting for the log thread; more are dropped, never blocked on
+LOG_REPEAT_WINDOW = 1.0  # Seconds over which repeats of the same message are counted
+LOG_REPEAT_LIMIT = 10  # Repeats shown per window; the rest are summarised in one line
+
 # LED Strip Configuration
 # ======================
 NUM_STRIPS_PER_TEENSY = 8
+LED_STRIP_NUM_LEDS = 50  # Must match LED_STRIP_NUM_LEDS in include/config.h
+
+# Pulse slots (see utils/pulse_slots.py); must match octo_led_strips.cpp
+MAX_ACTIVE_PULSES = 8  # Pulses an LED Teensy draws at once; it ignores any more
+PULSE_DURATION = 0.4  # Seconds a pulse takes to cross its strip (pulseDuration)
+PULSE_SLOT_MARGIN = 0.01  # The firmware frees a slot on the first frame after its pulse ends
+PULSE_MERGE_WINDOW = 0.008  # Pulses on one strip closer together than one LED step look like one
 
 # Pin mapping for LED strips on Teensy B
 # Maps strip index to physical pin number
@@ -76,3 +149,11 @@ TEENSY_USB_VID_PID = "16C0:0487"  # Teensy USB vendor:product ID
 
 # Timeout for device detection (seconds)
 DEVICE_DETECTION_TIMEOUT = 5.0
+
+# udev (see 00-teensy.rules) links every USB serial port here under a name that includes its
+# serial number, e.g. usb-Teensyduino_USB_Serial_14094100-if00
+SERIAL_BY_ID_DIR = "/dev/serial/by-id"
+
+# Last good serial number -> port mapping. On startup each entry is trusted only while its
+# /dev/serial/by-id link still points at the same port, so a restart skips the full scan
+DEVICE_CACHE_PATH = "~/.cache/gourd_led_controller/teensy_ports.json"
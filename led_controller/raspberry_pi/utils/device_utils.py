@@ -4,16 +4,145 @@ Centralized utility functions for detecting and connecting to Teensy devices
 Provides multiple detection methods for different use cases
 """
 
-import serial
-import serial.tools.list_ports
-from typing import Optional, Dict, List
+import os
+from typing import Optional, Dict, List, Iterable
 from .config import (
     TEENSY_A_SERIAL,
     TEENSY_B_SERIAL,
-    TEENSY_MAPPING
+    TEENSY_MAPPING,
+    SERIAL_BY_ID_DIR,
+    DEVICE_CACHE_PATH,
 )
 
 
+def _system_list_ports():
+    """serial.tools.list_ports.comports(), imported on first use since it pulls in most of pyserial"""
+    import serial.tools.list_ports
+    return serial.tools.list_ports.comports()
+
+
+# Where serial ports are listed from; the simulator swaps in its own (see utils/simulator.py)
+_list_ports = _system_list_ports
+
+
+def set_port_lister(lister=None):
+    """
+    Replace how serial ports are listed, e.g. with simulated Teensys
+
+    Args:
+        lister: Callable returning objects with device, description, serial_number and
+                hwid attributes, like serial.tools.list_ports.comports(); None restores that
+
+    Returns:
+        The lister that was in use before
+    """
+    global _list_ports
+    previous = _list_ports
+    _list_ports = lister or _system_list_ports
+    return previous
+
+
+def build_port_index(verbose: bool = False) -> Dict[str, str]:
+    """
+    List the serial ports once and index them by serial number
+
+    Args:
+        verbose: Whether to print every port as it is checked
+
+    Returns:
+        {serial_number: device path} for every port that reports a serial number
+    """
+    index = {}
+    for port in _list_ports():
+        if verbose:
+            print(f"   Checking {port.device}: {port.description}")
+        if port.serial_number:
+            index.setdefault(port.serial_number, port.device)
+    return index
+
+
+def serial_by_id_links(by_id_dir: str = SERIAL_BY_ID_DIR) -> Dict[str, str]:
+    """{device path: its /dev/serial/by-id link} for every port udev has linked"""
+    try:
+        names = os.listdir(by_id_dir)
+    except OSError:
+        return {}
+    links = {}
+    for name in names:
+        link = os.path.join(by_id_dir, name)
+        links[os.path.realpath(link)] = link
+    return links
+
+
+def load_port_cache(path: str = DEVICE_CACHE_PATH) -> Dict[str, Dict[str, str]]:
+    """
+    Read the cached port mapping
+
+    Returns:
+        {serial_number: {'device': path, 'by_id': link}}; empty if there is no usable cache
+    """
+    import json  # Only needed when detecting, so not paid by scripts that just import this module
+    try:
+        with open(os.path.expanduser(path)) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_port_cache(index: Dict[str, str], path: str = DEVICE_CACHE_PATH,
+                    by_id_dir: str = SERIAL_BY_ID_DIR) -> bool:
+    """
+    Remember where each serial number in index was found
+
+    Ports without a /dev/serial/by-id link are left out, since there would be no cheap
+    way to check them later.
+
+    Returns:
+        True if the cache was written
+    """
+    links = serial_by_id_links(by_id_dir)
+    cache = {serial_number: {'device': device, 'by_id': links[os.path.realpath(device)]}
+             for serial_number, device in index.items() if os.path.realpath(device) in links}
+    if not cache:
+        return False
+    import json
+    path = os.path.expanduser(path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a crash never leaves half a file behind
+        with open(path + ".tmp", "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        return False
+    return True
+
+
+def cached_ports(serial_numbers: Iterable[str], path: str = DEVICE_CACHE_PATH) -> Optional[Dict[str, str]]:
+    """
+    Where the cache says each serial number is, if that still holds
+
+    Costs one readlink per Teensy rather than a port scan: an entry holds while its
+    /dev/serial/by-id link exists and resolves to the cached device.
+
+    Returns:
+        {serial_number: device path}, or None unless every serial number checks out
+    """
+    cache = load_port_cache(path)
+    ports = {}
+    for serial_number in serial_numbers:
+        try:
+            by_id, device = cache[serial_number]['by_id'], cache[serial_number]['device']
+        except (TypeError, KeyError):
+            return None
+        # A dangling link resolves to where the port used to be, hence the exists check
+        if os.path.realpath(by_id) != os.path.realpath(device) or not os.path.exists(device):
+            return None
+        ports[serial_number] = device
+    return ports
+
+
 def find_teensy_by_serial(target_serial: str, verbose: bool = True) -> Optional[str]:
     """
     Find a Teensy device by its serial number using pyserial
@@ -28,7 +157,7 @@ def find_teensy_by_serial(target_serial: str, verbose: bool = True) -> Optional[
     if verbose:
         print(f"🔍 Searching for Teensy with serial number: {target_serial}")
     
-    ports = serial.tools.list_ports.comports()
+    ports = _list_ports()
     
     for port in ports:
         if verbose:
@@ -88,27 +217,48 @@ def find_teensy(teensy_id: str, verbose: bool = True) -> Optional[str]:
 # Removed find_teensy_a() and find_teensy_b() - use find_teensy("a") and find_teensy("b") instead
 
 
-def detect_all_teensys(verbose: bool = True) -> Dict[str, str]:
+def detect_all_teensys(verbose: bool = True, use_cache: bool = True) -> Dict[str, str]:
     """
     Detect all connected Teensy devices using pyserial
-    
+
+    The ports are listed once for every configured Teensy. With use_cache, the last
+    good mapping is tried first and the scan skipped if every Teensy is still where it
+    was; after a scan the mapping is cached again. The cache is only used with the
+    system's port list, never with simulated ports.
+
     Args:
         verbose: Whether to print search progress
-        
+        use_cache: Whether to read and update DEVICE_CACHE_PATH
+
     Returns:
         Dictionary with detected devices: {'teensy_a': '/dev/ttyACM0', 'teensy_b': '/dev/ttyACM1'}
     """
-    ports = {}
-    
+    use_cache = use_cache and _list_ports is _system_list_ports
+    if use_cache:
+        cached = cached_ports(TEENSY_MAPPING.values())
+        if cached is not None:
+            if verbose:
+                print(f"⚡ Using cached Teensy ports (checked against {SERIAL_BY_ID_DIR})")
+            return {f'teensy_{teensy_id}': cached[serial_number] for teensy_id, serial_number in TEENSY_MAPPING.items()}
+
     if verbose:
         print("🔍 Detecting Teensy devices...")
-    
-    # Dynamically detect all configured Teensys
-    for teensy_id in TEENSY_MAPPING.keys():
-        port = find_teensy(teensy_id, verbose)
+    index = build_port_index(verbose)
+
+    ports = {}
+    found = {}
+    for teensy_id, serial_number in TEENSY_MAPPING.items():
+        port = index.get(serial_number)
         if port:
             ports[f'teensy_{teensy_id}'] = port
-    
+            found[serial_number] = port
+            if verbose:
+                print(f"   ✅ Found Teensy {teensy_id.upper()} at {port}")
+        elif verbose:
+            print(f"   ❌ Teensy {teensy_id.upper()} (SER={serial_number}) not found")
+
+    if use_cache and found:
+        save_port_cache(found)
     return ports
 
 
@@ -121,7 +271,7 @@ def get_all_serial_ports() -> List[Dict[str, str]]:
         List of dictionaries with port information
     """
     ports = []
-    for port in serial.tools.list_ports.comports():
+    for port in _list_ports():
         port_info = {
             'device': port.device,
             'description': port.description,
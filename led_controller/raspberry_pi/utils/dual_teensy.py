@@ -2,240 +2,877 @@
 """
 High-level Teensy communication manager
 
-Provides the DualTeensyTester class for managing connections to both
-Teensy A (button controller) and Teensy B (LED controller) simultaneously.
+Provides the TeensyHub class (formerly DualTeensyTester) for managing connections
+to Teensy A (button controller) and every LED controller in TEENSY_MAPPING at once,
+and AsyncTeensyHub for doing the same from asyncio code.
 """
 
+import os
+import selectors
 import serial
 import time
 import threading
-from typing import Optional, Callable
+from contextlib import contextmanager
+from functools import partial
 
 from .config import (
-    TEENSY_A_SERIAL,
-    TEENSY_B_SERIAL,
-    TEENSY_C_SERIAL,
+    TEENSY_MAPPING,
+    BUTTON_TEENSY_ID,
     DEFAULT_BAUDRATE,
+    RECONNECT_INITIAL_DELAY,
+    RECONNECT_MAX_DELAY,
+    TIME_SYNC_INTERVAL,
+    TIME_SYNC_BURST,
+    TIME_SYNC_BURST_INTERVAL,
+    PULSE_LEAD_TIME,
     NUM_STRIPS_PER_TEENSY,
+    CMD_LED_EFFECT,
+    CMD_LED_FRAME_COMMIT,
+    CMD_HELLO,
+    CMD_ACK,
+    CMD_TIME_SYNC,
+    CMD_LINK_STATS,
+    CMD_BUTTON_PRESS,
+    CMD_HEARTBEAT,
+    WIRE_FORMAT_LEGACY,
+    WIRE_FORMAT_V2_CRC8,
+    CAP_SEQUENCED,
+    CAP_TIME_SYNC,
 )
-from .device_utils import detect_all_teensys
-from .protocol import CommandPacket, create_led_pulse_packet, create_led_effect_packet
+from .clock_sync import ClockSync
+from .device_utils import detect_all_teensys, find_teensy_by_serial
+from .framer import StreamFramer
+from .frames import FrameEncoder
+from .hotplug import HotplugMonitor
+from .io_loop import SerialEventLoop
+from .latency import LatencyRecorder
+from .pulse_slots import PulseSlots
+from .reliable import SequencedLink
+from .trace import TRACE_BUTTON, TRACE_LED_COMMAND
+from .log import get_logger
+from .writer import DeviceWriter, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK
+from .protocol import (
+    CommandPacket,
+    WIRE_FORMAT_NAMES,
+    create_hello_packet,
+    decode_button_event,
+    encode_command,
+    get_led_pulse_command,
+    get_led_pulse_at_command,
+)
+
+TEENSY_ICONS = {'a': "🅰️ ", 'b': "🅱️ ", 'c': "🅲"}
+DEFAULT_TEENSY_ICON = "📟"
+
+log = get_logger("teensy")
+
+# Latency stages, all measured from the moment the I/O loop woke up with the button event
+# except led_write, which runs from a command being queued to its write() returning
+LATENCY_STAGES = ('dispatch_text', 'dispatch_binary', 'led_queued', 'sound_triggered', 'led_write')
+
+
+def link_rtt_stage(teensy_id):
+    """
+    Latency stage for one LED Teensy's sequenced command round trips (write to ack)
+
+    Kept per Teensy, since one slow link would otherwise hide in the others' percentiles.
+    TeensyHub lists one for every LED Teensy after LATENCY_STAGES.
+    """
+    return f'link_rtt_{teensy_id}'
 
 
-class DualTeensyTester:
+def get_led_teensy_ids(teensy_mapping=TEENSY_MAPPING):
+    """Every configured Teensy except the button controller, in strip order"""
+    return tuple(teensy_id for teensy_id in teensy_mapping if teensy_id != BUTTON_TEENSY_ID)
+
+
+def build_strip_routes(led_teensy_ids, strips_per_teensy=NUM_STRIPS_PER_TEENSY):
     """
-    Manages communication with Teensy A sending to Teensy B and C
+    Flat routing table for global strip ids
+
+    Returns:
+        Tuple where entry strip_id is (teensy_id, local_strip): strips 0-7 on the first
+        LED Teensy, 8-15 on the second, and so on
+    """
+    return tuple((teensy_id, local_strip)
+                 for teensy_id in led_teensy_ids
+                 for local_strip in range(strips_per_teensy))
+
+
+class TeensyHub:
+    """
+    Manages communication with the button Teensy and any number of LED Teensys
     
     This class handles:
-    - Auto-detection and connection to both Teensy devices
-    - Monitoring Teensy A for button presses
-    - Sending LED commands to Teensy B and C
+    - Auto-detection and connection to every Teensy in TEENSY_MAPPING
+    - Monitoring the button Teensy (A) for button presses
+    - Sending LED commands to the LED Teensys (B, C, ...)
     - Coordinating communication between devices
+    - Reconnecting Teensys that drop off USB, as soon as they come back where USB hot-plug
+      events are available and with exponential backoff otherwise
+
+    Only the button Teensy has to be present to start. Commands for an LED Teensy that is
+    disconnected are dropped (and counted) while it is retried in the background, so
+    button presses and sound keep working.
+
+    LED Teensys whose firmware supports it have their clocks tracked, and button presses
+    become pulses scheduled pulse_lead_time seconds after the press on every Teensy's own
+    clock, so they start on the same frame everywhere.
     """
     
-    def __init__(self, baudrate=DEFAULT_BAUDRATE, sound_callback=None):
+    def __init__(self, baudrate=DEFAULT_BAUDRATE, sound_callback=None, teensy_mapping=TEENSY_MAPPING,
+                 pulse_lead_time=PULSE_LEAD_TIME):
         self.baudrate = baudrate
-        self.teensy_a_port = None
-        self.teensy_b_port = None
-        self.teensy_c_port = None
-        self.teensy_a = None
-        self.teensy_b = None
-        self.teensy_c = None
+        self.teensy_mapping = teensy_mapping
+        self.teensy_ids = tuple(teensy_mapping)
+        self.led_teensy_ids = get_led_teensy_ids(teensy_mapping)
+        self.port_paths = {}  # teensy_id -> device path
+        self.ports = {}  # teensy_id -> open serial.Serial
         self.running = False
         self.sound_callback = sound_callback
+        # Global strip id -> (teensy_id, local strip), built once so a send is one index lookup
+        self.strip_routes = build_strip_routes(self.led_teensy_ids)
+        # One framer per port; each keeps the partial line/frame left over from the last read
+        self.framers = {teensy_id: StreamFramer(max_wire_format=WIRE_FORMAT_V2_CRC8) for teensy_id in self.teensy_ids}
+        self.last_heartbeat = {}
+        # Negotiated per connection; every port starts out legacy
+        self.wire_formats = {teensy_id: WIRE_FORMAT_LEGACY for teensy_id in self.teensy_ids}
+        # CMD_HELLO capability bits each Teensy reported (CAP_SEQUENCED, ...)
+        self.capabilities = {teensy_id: 0 for teensy_id in self.teensy_ids}
+        # Frame counters each Teensy last reported for its receive side (request_link_stats())
+        self.remote_link_stats = {}
+        # ClockSync per connected LED Teensy that answers CMD_TIME_SYNC, kept fresh by the sync thread
+        self.clocks = {}
+        self.pulse_lead_time = pulse_lead_time
+        # Model of each LED Teensy's pulse slots, so pulses it would ignore aren't sent
+        self.pulse_slots = {teensy_id: PulseSlots() for teensy_id in self.led_teensy_ids}
+        self.clock_sync_thread = None
+        # Per-thread commands collected by batch(), keyed by Teensy id
+        self._batch_state = threading.local()
+        # Delta state for frames pushed to each LED Teensy
+        self.frame_encoders = {teensy_id: FrameEncoder() for teensy_id in self.led_teensy_ids}
+        # Per-stage latency histograms for button press handling
+        self.latency = LatencyRecorder(LATENCY_STAGES + tuple(map(link_rtt_stage, self.led_teensy_ids)))
+        self.pressed_buttons = 0  # Bitmap from the latest binary button event
+        # Optional TraceRecorder; button presses and LED commands are recorded to it
+        self.trace = None
+        self.io_loop = None
+        # Non-blocking writer per connected LED Teensy, created on first use
+        self.writers = {}
+
+        # Reconnection: Teensys missing from self.ports are retried at reconnect_at[teensy_id]
+        self._connection_lock = threading.Lock()
+        self.reconnect_at = {}
+        self.reconnect_delays = {}
+        self.disconnects = {teensy_id: 0 for teensy_id in self.teensy_ids}
+        self.dropped_while_disconnected = {teensy_id: 0 for teensy_id in self.teensy_ids}
+        self._reconnect_wakeup = threading.Event()
+        self.reconnect_thread = None
+        self._clock_sync_wakeup = threading.Event()  # Set when there is a new clock to sync
+        # USB hot-plug events while monitoring, if the system delivers them
+        self.teensy_ids_by_serial = {serial_number: teensy_id for teensy_id, serial_number in teensy_mapping.items()}
+        self.hotplug = None
     
     def connect(self):
-        """Connect to all Teensys using auto-detection"""
-        print("🔍 Auto-detecting Teensy devices...")
+        """
+        Connect to all Teensys using auto-detection
+
+        Returns:
+            True if the button Teensy is connected. LED Teensys that aren't found are
+            retried in the background once monitoring starts.
+        """
+        log.info("🔍 Auto-detecting Teensy devices...")
         ports = detect_all_teensys()
-        
-        if 'teensy_a' not in ports:
-            print(f"❌ Teensy A (SER={TEENSY_A_SERIAL}) not found!")
-            return False
-        if 'teensy_b' not in ports:
-            print(f"❌ Teensy B (SER={TEENSY_B_SERIAL}) not found!")
-            return False
-        if 'teensy_c' not in ports:
-            print(f"❌ Teensy C (SER={TEENSY_C_SERIAL}) not found!")
-            return False
-            
-        self.teensy_a_port = ports['teensy_a']
-        self.teensy_b_port = ports['teensy_b']
-        self.teensy_c_port = ports['teensy_c']
-        
-        # TODO: Make this less fragile - if teensy B or C are not found, we should still send sound signals from Teensy A.
-        try:
-            self.teensy_a = serial.Serial(self.teensy_a_port, self.baudrate, timeout=0.1)
-            print(f"✅ Connected to Teensy A on {self.teensy_a_port}")
-        except Exception as e:
-            print(f"❌ Failed to connect to Teensy A: {e}")
+
+        paths = {}
+        for teensy_id in self.teensy_ids:
+            path = ports.get(f"teensy_{teensy_id}")
+            if path is None:
+                log.error("❌ Teensy %s (SER=%s) not found!", teensy_id.upper(), self.teensy_mapping[teensy_id])
+                self.schedule_reconnect(teensy_id)
+            else:
+                paths[teensy_id] = path
+        connected = self.open_ports(paths)
+        for teensy_id in paths:
+            if teensy_id not in connected:
+                self.schedule_reconnect(teensy_id)
+
+        if BUTTON_TEENSY_ID not in self.ports:
+            log.error("❌ Button Teensy %s is required", BUTTON_TEENSY_ID.upper())
+            self.close_ports()
             return False
-            
+        return True
+
+    def open_port(self, teensy_id, path):
+        """
+        Open, handshake with and (if monitoring) start watching one Teensy
+
+        Returns:
+            True if the Teensy is now connected
+        """
+        return teensy_id in self.open_ports({teensy_id: path})
+
+    def open_ports(self, paths):
+        """
+        Open, handshake with and (if monitoring) start watching several Teensys at once
+
+        The handshakes run side by side, so however many Teensys have firmware that never
+        replies, connecting only waits out one handshake timeout.
+
+        Args:
+            paths: {teensy_id: device path}
+
+        Returns:
+            Ids of the Teensys now connected
+        """
+        opened = {}
+        for teensy_id, path in paths.items():
+            try:
+                # Non-blocking reads: the I/O loop reads every port from one thread
+                opened[teensy_id] = serial.Serial(path, self.baudrate, timeout=0)
+            except Exception as e:
+                log.error("❌ Failed to connect to Teensy %s: %s", teensy_id.upper(), e)
+                continue
+            log.info("✅ Connected to Teensy %s on %s", teensy_id.upper(), path)
+
+            # Nothing from the previous connection carries over
+            self.framers[teensy_id] = StreamFramer(max_wire_format=WIRE_FORMAT_V2_CRC8)
+            if teensy_id in self.frame_encoders:
+                self.frame_encoders[teensy_id].reset()
+            if teensy_id in self.pulse_slots:
+                self.pulse_slots[teensy_id].reset()
+            self.clocks.pop(teensy_id, None)
+
+        self.negotiate_wire_formats(opened)
+        for teensy_id, teensy in opened.items():
+            if teensy_id in self.led_teensy_ids and self.capabilities[teensy_id] & CAP_TIME_SYNC:
+                # The Teensy may have rebooted, so its clock starts over
+                self._track_clock(teensy_id)
+
+            with self._connection_lock:
+                self.port_paths[teensy_id] = paths[teensy_id]
+                self.ports[teensy_id] = teensy
+                self.reconnect_at.pop(teensy_id, None)
+                self.reconnect_delays.pop(teensy_id, None)
+                if self.io_loop:
+                    self.watch_port(teensy_id, teensy)
+        return list(opened)
+
+    def negotiate_wire_format(self, teensy_id, teensy=None, timeout=0.5):
+        """
+        Offer the compact v2 wire format to a freshly opened Teensy (see negotiate_wire_formats)
+
+        Args:
+            teensy_id: Teensy to negotiate with ("a", "b", ...)
+            teensy: Its port, if it isn't in self.ports yet
+            timeout: How long to wait for the reply, in seconds
+
+        Returns:
+            The wire format now in use
+        """
+        return self.negotiate_wire_formats({teensy_id: teensy or self.ports[teensy_id]}, timeout)[teensy_id]
+
+    def negotiate_wire_formats(self, ports, timeout=0.5):
+        """
+        Offer the compact v2 wire format to freshly opened Teensys, all at once
+
+        The offer goes out as a legacy packet. Firmware that understands it replies with its
+        own CMD_HELLO and switches to v2; older firmware ignores it and the port stays on
+        fixed size CommandPackets. The reply also says whether the firmware acks sequenced
+        commands. The framer switches to the new format as soon as it parses the reply; a
+        reply that only arrives after the timeout is applied by handle_packet().
+
+        The offers are sent to every port first, then one selector waits for the replies,
+        so the ports share a single timeout and nothing polls.
+
+        Args:
+            ports: {teensy_id: open port}
+            timeout: How long to wait for the replies, in seconds
+
+        Returns:
+            {teensy_id: the wire format now in use}
+        """
+        replies = {}  # teensy_id -> (wire format, capabilities)
+        selector = selectors.DefaultSelector()
+        hello = create_hello_packet(capabilities=CAP_SEQUENCED | CAP_TIME_SYNC).to_bytes()
+        for teensy_id, teensy in ports.items():
+            try:
+                teensy.write(hello)
+                selector.register(teensy.fileno(), selectors.EVENT_READ, teensy_id)
+            except Exception as e:
+                log.error("❌ Wire format handshake with Teensy %s failed: %s", teensy_id.upper(), e)
+
+        deadline = time.monotonic() + timeout
         try:
-            self.teensy_b = serial.Serial(self.teensy_b_port, self.baudrate, timeout=0.1)
-            print(f"✅ Connected to Teensy B on {self.teensy_b_port}")
-        except Exception as e:
-            print(f"❌ Failed to connect to Teensy B: {e}")
-            if self.teensy_a:
-                self.teensy_a.close()
-            return False
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                for key, _ in selector.select(remaining):
+                    teensy_id = key.data
+                    try:
+                        events = self.read_events(ports[teensy_id], self.framers[teensy_id])
+                    except Exception as e:
+                        log.error("❌ Wire format handshake with Teensy %s failed: %s", teensy_id.upper(), e)
+                        selector.unregister(key.fd)
+                        continue
+                    for event in events:
+                        if isinstance(event, str):
+                            log.info("   Teensy %s: %s", teensy_id.upper(), event)
+                        elif event.command == CMD_HELLO and teensy_id not in replies:
+                            replies[teensy_id] = (min(event.data[0], WIRE_FORMAT_V2_CRC8), event.data[1])
+                        else:
+                            self.handle_packet(teensy_id, event)
+                    if teensy_id in replies:
+                        selector.unregister(key.fd)
+        finally:
+            selector.close()
+
+        wire_formats = {}
+        for teensy_id in ports:
+            wire_format, capabilities = replies.get(teensy_id, (WIRE_FORMAT_LEGACY, 0))
+            self.remote_link_stats.pop(teensy_id, None)
+            self.apply_wire_format(teensy_id, wire_format, capabilities)
+            wire_formats[teensy_id] = wire_format
+        return wire_formats
+
+    def apply_wire_format(self, teensy_id, wire_format, capabilities):
+        """Switch everything that encodes or decodes for a Teensy to the wire format it agreed to"""
+        self.wire_formats[teensy_id] = wire_format
+        self.capabilities[teensy_id] = capabilities
+        self.framers[teensy_id].wire_format = wire_format
+        if teensy_id in self.frame_encoders:
+            self.frame_encoders[teensy_id].wire_format = wire_format
+        if teensy_id in self.writers:
+            self.writers[teensy_id].wire_format = wire_format
+        log.info("🔗 Teensy %s wire format: %s%s%s", teensy_id.upper(), WIRE_FORMAT_NAMES.get(wire_format, wire_format),
+                 ", sequenced" if capabilities & CAP_SEQUENCED else "",
+                 ", clock sync" if capabilities & CAP_TIME_SYNC else "")
+
+    def get_writer(self, teensy_id):
+        """
+        Get the writer for a Teensy, starting one if needed
+
+        Returns None (and counts the drop) while the Teensy is disconnected, without
+        printing, since this is called for every command.
+        """
+        writer = self.writers.get(teensy_id)
+        if writer is not None:
+            return writer
+
+        with self._connection_lock:
+            teensy = self.ports.get(teensy_id)
+            if not teensy:
+                self.dropped_while_disconnected[teensy_id] += 1
+                return None
+            # Each writer belongs to one connection, so errors from a stale one can be told apart
+            link = None
+            if self.capabilities[teensy_id] & CAP_SEQUENCED:
+                link = SequencedLink(latency=self.latency, latency_stage=link_rtt_stage(teensy_id))
+            writer = DeviceWriter(teensy, f"Teensy {teensy_id.upper()}", wire_format=self.wire_formats[teensy_id],
+                                  on_error=partial(self.handle_write_error, teensy_id, teensy),
+                                  latency=self.latency, link=link)
+            writer.start()
+            self.writers[teensy_id] = writer
+        return writer
+
+    def handle_write_error(self, teensy_id, teensy, error):
+        """Handle an error writing to a Teensy (called on its writer thread)"""
+        log.error("❌ Error sending to Teensy %s: %s", teensy_id.upper(), error)
+        self.handle_disconnect(teensy_id, teensy, error)
+
+    def handle_disconnect(self, teensy_id, teensy, error):
+        """
+        Drop a Teensy whose port failed and schedule it for reconnection
 
+        Called from the I/O loop or a writer thread; only does a few dict updates and a
+        close() so the button Teensy's events aren't held up. Errors from a connection that
+        was already replaced are ignored.
+        """
+        with self._connection_lock:
+            if self.ports.get(teensy_id) is not teensy:
+                return
+            del self.ports[teensy_id]
+            self.clocks.pop(teensy_id, None)
+            self.disconnects[teensy_id] += 1
+            writer = self.writers.pop(teensy_id, None)
+            if self.io_loop:
+                self.io_loop.unregister(teensy_id)
+
+        if self.running:
+            log.warning("🔌 Teensy %s disconnected: %s", teensy_id.upper(), error)
+        if writer:
+            writer.abandon()
+            self.log_writer_stats(writer)
+        if teensy_id in self.pulse_slots:
+            # Unplugged or failed: whatever it was drawing is gone with it
+            self.pulse_slots[teensy_id].reset()
         try:
-            self.teensy_c = serial.Serial(self.teensy_c_port, self.baudrate, timeout=0.1)
-            print(f"✅ Connected to Teensy C on {self.teensy_c_port}")
-        except Exception as e:
-            print(f"❌ Failed to connect to Teensy C: {e}")
-            if self.teensy_a:
-                self.teensy_a.close()
-            if self.teensy_b:
-                self.teensy_b.close()
+            teensy.close()
+        except Exception:
+            pass
+        if self.running:
+            self.schedule_reconnect(teensy_id)
+
+    def schedule_reconnect(self, teensy_id):
+        """Retry a Teensy after its current backoff delay, doubling the delay for next time"""
+        with self._connection_lock:
+            delay = self.reconnect_delays.get(teensy_id, RECONNECT_INITIAL_DELAY)
+            self.reconnect_delays[teensy_id] = min(delay * 2, RECONNECT_MAX_DELAY)
+            self.reconnect_at[teensy_id] = time.monotonic() + delay
+        self._reconnect_wakeup.set()
+
+    def reconnect(self, teensy_id):
+        """Look for a disconnected Teensy again; returns True if it is back"""
+        serial_number = self.teensy_mapping[teensy_id]
+        # The hot-plug index saves a port scan; it can only miss events, so scan if it has nothing
+        path = self.hotplug.device_for(serial_number) if self.hotplug else None
+        path = path or find_teensy_by_serial(serial_number, verbose=False)
+        if path is None or not self.open_port(teensy_id, path):
+            self.schedule_reconnect(teensy_id)
             return False
-            
+
+        dropped = self.dropped_while_disconnected[teensy_id]
+        self.dropped_while_disconnected[teensy_id] = 0
+        log.warning("🔌 Teensy %s reconnected (%d command(s) dropped while it was away)", teensy_id.upper(), dropped)
         return True
 
-    def get_teensy_and_name_for_strip_id(self, strip_id):
-        if strip_id < NUM_STRIPS_PER_TEENSY:
-            teensy_to_write_to = self.teensy_b
-            teensy_name = "Teensy B"
-        else:
-            teensy_to_write_to = self.teensy_c
-            teensy_name = "Teensy C"
-        
-        # TODO: Is this check sufficient?
-        if not teensy_to_write_to:
-            print(f"❌ {teensy_name} not connected.")
-            return [None, None]
-        return [teensy_to_write_to, teensy_name]
+    def handle_hotplug_add(self, serial_number, device):
+        """A Teensy's port appeared (on the hot-plug thread): retry it now, with the backoff reset"""
+        teensy_id = self.teensy_ids_by_serial.get(serial_number)
+        if teensy_id is None or teensy_id in self.ports:
+            return
+        log.info("🔌 Teensy %s plugged in at %s", teensy_id.upper(), device)
+        with self._connection_lock:
+            self.reconnect_delays.pop(teensy_id, None)
+            self.reconnect_at[teensy_id] = time.monotonic()
+        self._reconnect_wakeup.set()
+
+    def handle_hotplug_remove(self, serial_number, device):
+        """A Teensy's port went away (on the hot-plug thread): drop it now rather than on the next failed I/O"""
+        teensy_id = self.teensy_ids_by_serial.get(serial_number)
+        teensy = self.ports.get(teensy_id)
+        if teensy is not None and self.port_paths.get(teensy_id) == device:
+            self.handle_disconnect(teensy_id, teensy, "unplugged")
+
+    def _reconnect_loop(self):
+        """Reconnect thread: retry each missing Teensy when its backoff expires"""
+        while self.running:
+            self._reconnect_wakeup.clear()
+            now = time.monotonic()
+            with self._connection_lock:
+                due = [teensy_id for teensy_id, at in self.reconnect_at.items() if at <= now]
+                for teensy_id in due:
+                    del self.reconnect_at[teensy_id]
+            for teensy_id in due:
+                if self.running:
+                    self.reconnect(teensy_id)
 
+            with self._connection_lock:
+                next_at = min(self.reconnect_at.values(), default=None)
+            self._reconnect_wakeup.wait(None if next_at is None else max(0, next_at - time.monotonic()))
+
+    def _clock_sync_loop(self):
+        """Clock sync thread: a quick burst of requests to each new Teensy, then one every TIME_SYNC_INTERVAL"""
+        next_sync = {}  # ClockSync -> time.monotonic() its next request is due
+        while self.running:
+            self._clock_sync_wakeup.clear()
+            now = time.monotonic()
+            clocks = list(self.clocks.items())
+            # A reconnected Teensy gets a new ClockSync, so this also forgets old connections
+            next_sync = {clock: next_sync.get(clock, now) for _, clock in clocks}
+            for teensy_id, clock in clocks:
+                if next_sync[clock] > now:
+                    continue
+                writer = self.get_writer(teensy_id)
+                if writer is not None:
+                    # Not reliable: a retransmit would carry a stale send time
+                    # Interactive so it doesn't wait behind bulk traffic and spoil the round trip
+                    writer.send(CMD_TIME_SYNC, clock.request(), priority=PRIORITY_INTERACTIVE)
+                interval = TIME_SYNC_BURST_INTERVAL if clock.requests < TIME_SYNC_BURST else TIME_SYNC_INTERVAL
+                next_sync[clock] = now + interval
+
+            # New clocks, and stop_monitoring(), wake it early
+            next_at = min(next_sync.values(), default=None)
+            self._clock_sync_wakeup.wait(None if next_at is None else max(0, next_at - time.monotonic()))
+
+    def _track_clock(self, teensy_id):
+        """Start a fresh clock estimate for a Teensy; the sync thread sends its first request right away"""
+        self.clocks[teensy_id] = ClockSync()
+        self._clock_sync_wakeup.set()
+
+    def clock_stats(self):
+        """{teensy_id: ClockSync.stats()} for every connected Teensy whose clock is tracked"""
+        now = time.perf_counter_ns()
+        return {teensy_id: clock.stats(now) for teensy_id, clock in list(self.clocks.items())}
+
+    def connection_states(self):
+        """{teensy_id: True if connected} for every configured Teensy"""
+        return {teensy_id: teensy_id in self.ports for teensy_id in self.teensy_ids}
     
-    def send_led_pulse_command(self, strip_id):
-        """Send LED pulse command to Teensy B or C, depending on strip_id"""
-        teensy_to_write_to, teensy_name = self.get_teensy_and_name_for_strip_id(strip_id)
-        if not teensy_to_write_to or not teensy_name:
+    def send_command(self, teensy_id, command, data, description, reliable=False, priority=PRIORITY_NORMAL,
+                     on_drop=None):
+        """
+        Queue a (command, data) pair for an LED Teensy
+
+        Returns straight away; the Teensy's writer thread does the actual write. Inside
+        batch() the command is held until the block ends. reliable commands are
+        retransmitted until acked, if the Teensy supports sequenced commands. priority
+        decides what goes first, and what is shed first, when the link is busy. on_drop
+        is called if the command ends up never being written (see DeviceWriter).
+        """
+        if self.trace is not None:
+            self.trace.record(TRACE_LED_COMMAND, teensy_id, command, data[0] if data else 0)
+        writer = self.get_writer(teensy_id)
+        if writer is None:
+            if on_drop is not None:
+                on_drop()
             return
 
-        packet = create_led_pulse_packet(strip_id)
-        packet_bytes = packet.to_bytes()
-        
+        pending = getattr(self._batch_state, 'pending', None)
+        if pending is not None:
+            pending.setdefault(teensy_id, []).append((command, data, reliable, priority, on_drop))
+            return
+
+        if writer.send(command, data, reliable, priority, on_drop):
+            log.debug("📤 Queued %s for %s", description, writer.name)
+        else:
+            log.warning("⚠️  Dropped %s for %s, write queue full", description, writer.name)
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect the commands sent inside the block and queue them together per Teensy
+
+        Wrapped around each chunk of button events, so presses that arrive together go
+        out in a single write() per Teensy instead of one per strip.
+        """
+        if getattr(self._batch_state, 'pending', None) is not None:
+            # Already batching on this thread; the outermost block flushes
+            yield
+            return
+
+        self._batch_state.pending = {}
         try:
-            teensy_to_write_to.write(packet_bytes)
-            print(f"📤 Sent LED pulse command to {teensy_name} (strip {strip_id})")
-        except Exception as e:
-            print(f"❌ Error sending to {teensy_name}: {e}")
+            yield
+        finally:
+            pending = self._batch_state.pending
+            self._batch_state.pending = None
+            for teensy_id, commands in pending.items():
+                writer = self.writers.get(teensy_id)
+                if writer is None:
+                    # Disconnected since the commands were collected
+                    self.dropped_while_disconnected[teensy_id] += len(commands)
+                    for *_, on_drop in commands:
+                        if on_drop is not None:
+                            on_drop()
+                    continue
+                queued = writer.send_many(commands)
+                log.debug("📤 Queued %d command(s) for %s", queued, writer.name)
+                if queued < len(commands):
+                    log.warning("⚠️  %d command(s) for %s dropped, write queue full", len(commands) - queued, writer.name)
+    
+    def send_led_pulse_command(self, strip_id, start_ns=None):
+        """
+        Send LED pulse command to the LED Teensy that owns strip_id
+
+        Args:
+            strip_id: Global strip id
+            start_ns: perf_counter_ns() at which the pulse should start. Only honoured by a
+                      Teensy whose clock is synced; otherwise it starts when it arrives.
+        """
+        teensy_id, local_strip = self.strip_routes[strip_id % len(self.strip_routes)]
+        clock = self.clocks.get(teensy_id)
+        now = time.perf_counter_ns()
+        scheduled = start_ns is not None and clock is not None and clock.synced
+        # Pulses the Teensy would drop (every slot busy) or draw on top of another aren't sent
+        slots = self.pulse_slots[teensy_id]
+        start = start_ns if scheduled else now
+        if not slots.admit(local_strip, start, now):
+            log.debug("🎯 Shed pulse for strip %d, Teensy %s has no free slot", strip_id, teensy_id.upper())
+            return
+        if scheduled:
+            command, data = get_led_pulse_at_command(local_strip, clock.to_device_ms(start_ns))
+        else:
+            command, data = get_led_pulse_command(local_strip)
+        # A pulse the writer sheds never takes a slot on the Teensy, so hand it back
+        self.send_command(teensy_id, command, data, f"LED pulse command (strip {strip_id})", reliable=True,
+                          priority=PRIORITY_INTERACTIVE, on_drop=partial(slots.release, local_strip, start))
 
     # Unused for now. 
-    # TODO: Could dedupe some code between this and send_led_pulse_command via functools.partial but keeping it simple.
     def send_led_effect_command(self, strip_id, effect_type, params):
-        """Send LED effect command to Teensy B or C, depending on strip_id"""
-        teensy_to_write_to, teensy_name = self.get_teensy_and_name_for_strip_id(strip_id)
-        if not teensy_to_write_to or not teensy_name:
-            return
+        """Send LED effect command to the LED Teensy that owns strip_id"""
+        teensy_id, local_strip = self.strip_routes[strip_id % len(self.strip_routes)]
+        data = bytes([local_strip, effect_type, *params])
+        self.send_command(teensy_id, CMD_LED_EFFECT, data, f"LED effect command (strip {strip_id})", reliable=True,
+                          priority=PRIORITY_BULK)
 
-        packet = create_led_effect_packet(strip_id=strip_id, effect_type=effect_type, *params)
-        packet_bytes = packet.to_bytes()
-        
-        try:
-            teensy_to_write_to.write(packet_bytes)
-            print(f"📤 Sent LED effect command to {teensy_name} (strip {strip_id})")
-        except Exception as e:
-            print(f"❌ Error sending to {teensy_name}: {e}")
+    def push_led_frame(self, teensy_id, pixels):
+        """
+        Push a full frame of pixels to an LED Teensy, replacing its built-in animation
+
+        Only pixels that changed since the last frame the Teensy acknowledged are sent.
+        The Teensy goes back to its own animation if frames stop arriving for a second.
+
+        Args:
+            teensy_id: LED Teensy to draw on ("b", "c", ...)
+            pixels: NUM_STRIPS_PER_TEENSY * LED_STRIP_NUM_LEDS colors as 0xWWRRGGBB ints
+
+        Returns:
+            FrameStats for the frame, or None if it couldn't be sent
+        """
+        writer = self.get_writer(teensy_id)
+        if writer is None:
+            return None
+
+        encoder = self.frame_encoders[teensy_id]
+        # In writes the bucket can pay for without dipping into what pulses need
+        writes = encoder.encode_writes(pixels, writer.bulk_write_size)
+        if writer.send_many([(None, data, False, PRIORITY_BULK) for data in writes]) < len(writes):
+            # The encoder notices the missing ack (or the incomplete commit) and falls back to a full frame
+            log.warning("⚠️  Frame for %s dropped, write queue full", writer.name)
+            return None
+        return encoder.last_stats
 
-    def handle_button_press(self, button_id):
-        # Forward as LED command to the corresponding receiver Teensy.
+    def handle_button_press(self, button_id, received=None):
+        if self.trace is not None:
+            self.trace.record(TRACE_BUTTON, BUTTON_TEENSY_ID, button_id, timestamp_ns=received)
+
+        # Forward as LED command to the corresponding receiver Teensy, due a fixed lead
+        # time after the press so every Teensy starts it on the same frame
         strip_id = button_id - 1  # Convert to 0-based
-        self.send_led_pulse_command(strip_id)
+        pressed = received if received is not None else time.perf_counter_ns()
+        self.send_led_pulse_command(strip_id, pressed + int(self.pulse_lead_time * 1e9))
+        if received is not None:
+            self.latency.record('led_queued', received)
         
         # Trigger sound callback if provided
         if self.sound_callback:
             self.sound_callback(strip_id)
+            if received is not None:
+                self.latency.record('sound_triggered', received)
     
-    def monitor_teensy_a_and_send_commands(self):
-        """Monitor Teensy A for button presses"""
-        while self.running:
-            if self.teensy_a and self.teensy_a.in_waiting > 0:
-                try:
-                    line = self.teensy_a.readline().decode('utf-8').strip()
-                    if line:
-                        current_time = time.strftime("%H:%M:%S")
-                        print(f"[{current_time}] 🅰️  Teensy A: {line}")
-                        
-                        # Check for button press
-                        if line.startswith("BUTTON_PRESS:"):
-                            button_id = int(line.split(":")[1])
-                            print(f"[{current_time}] 🔘 Button {button_id} pressed!")
-                            self.handle_button_press(button_id)
-                except Exception as e:
-                    print(f"❌ Error reading Teensy A: {e}")
-            
-            time.sleep(0.01)
+    def read_events(self, teensy, framer):
+        """Read everything waiting on a port in one call and return the parsed lines and packets"""
+        waiting = teensy.in_waiting
+        if not waiting:
+            return []
+        return framer.feed(teensy.read(waiting))
+
+    def handle_packet(self, teensy_id, packet, received=None):
+        """Handle a binary packet received from any Teensy (received: perf_counter_ns() it was read at)"""
+        if packet.command == CMD_HEARTBEAT:
+            self.last_heartbeat[teensy_id] = time.monotonic()
+            return
+        if packet.command == CMD_HELLO and packet.data_length:
+            # A reply that came after negotiate_wire_format() gave up. The Teensy has switched
+            # already (and the framer with it), so follow rather than talk past each other
+            log.warning("⚠️  Late wire format reply from Teensy %s", teensy_id.upper())
+            capabilities = packet.data[1] if packet.data_length > 1 else 0
+            self.apply_wire_format(teensy_id, min(packet.data[0], WIRE_FORMAT_V2_CRC8), capabilities)
+            if (teensy_id in self.led_teensy_ids and capabilities & CAP_TIME_SYNC
+                    and teensy_id not in self.clocks and teensy_id in self.ports):
+                self._track_clock(teensy_id)
+            return
+        if packet.command == CMD_ACK:
+            writer = self.writers.get(teensy_id)
+            if writer is not None:
+                writer.acknowledge(packet.data[:packet.data_length])
+            return
+        if packet.command == CMD_TIME_SYNC:
+            clock = self.clocks.get(teensy_id)
+            if clock is not None:
+                clock.handle_reply(packet.data[:packet.data_length],
+                                   received if received is not None else time.perf_counter_ns())
+            return
+        if packet.command == CMD_LINK_STATS:
+            data = packet.data[:packet.data_length]
+            if len(data) >= 12:
+                good, bad, resyncs = (int.from_bytes(data[i:i + 4], 'big') for i in (0, 4, 8))
+                self.remote_link_stats[teensy_id] = {'good_frames': good, 'bad_frames': bad, 'resyncs': resyncs}
+            return
+        if packet.command == CMD_LED_FRAME_COMMIT and teensy_id in self.frame_encoders:
+            self.frame_encoders[teensy_id].acknowledge(packet.data[0], complete=bool(packet.data[1]))
+            return
+        log.info("📦 Teensy %s: %s", teensy_id.upper(), packet)
     
-    def monitor_teensy_b(self):
-        """Monitor Teensy B for debug output"""
-        while self.running:
-            if self.teensy_b and self.teensy_b.in_waiting > 0:
-                try:
-                    line = self.teensy_b.readline().decode('utf-8').strip()
-                    if line:
-                        current_time = time.strftime("%H:%M:%S")
-                        print(f"[{current_time}] 🅱️  Teensy B: {line}")
-                except Exception as e:
-                    print(f"❌ Error reading Teensy B: {e}")
-            
-            time.sleep(0.01)
+    def handle_button_teensy_data(self, chunk, received):
+        """Handle bytes read from the button Teensy: dispatch button presses, print everything else"""
+        # Every press in one read goes out as one write per LED Teensy
+        with self.batch():
+            for event in self.framers[BUTTON_TEENSY_ID].feed(chunk):
+                if not isinstance(event, str):
+                    if event.command == CMD_BUTTON_PRESS:
+                        self.handle_button_event(decode_button_event(event), received)
+                    else:
+                        self.handle_packet(BUTTON_TEENSY_ID, event)
+                    continue
+
+                log.info("🅰️  Teensy A: %s", event)
+                
+                # Check for button press
+                if event.startswith("BUTTON_PRESS:"):
+                    button_id = int(event.split(":")[1])
+                    log.info("🔘 Button %d pressed!", button_id)
+                    self.latency.record('dispatch_text', received)
+                    self.handle_button_press(button_id, received)
+
+    def handle_button_event(self, event, received):
+        """Handle a binary button event from Teensy A; no string handling before dispatch"""
+        self.pressed_buttons = event.pressed_bitmap
+        if not event.pressed:
+            return
+        self.latency.record('dispatch_binary', received)
+        self.handle_button_press(event.button_id, received)
+        log.info("🔘 Button %d pressed! (t=%dms)", event.button_id, event.timestamp_ms)
+
+    def print_latency(self):
+        """Print p50/p99/max for each stage of button press handling"""
+        self.latency.dump()
     
-    # TODO: Instead make a more general function that takes b/c as arg.
-    def monitor_teensy_c(self):
-        """Monitor Teensy C for debug output"""
-        while self.running:
-            if self.teensy_c and self.teensy_c.in_waiting > 0:
-                try:
-                    line = self.teensy_c.readline().decode('utf-8').strip()
-                    if line:
-                        current_time = time.strftime("%H:%M:%S")
-                        print(f"[{current_time}] 🅲 Teensy C: {line}")
-                except Exception as e:
-                    print(f"❌ Error reading Teensy C: {e}")
-            
-            time.sleep(0.01)
+    def handle_led_teensy_data(self, teensy_id, chunk, received):
+        """Handle bytes read from an LED Teensy: debug output and acks"""
+        icon = TEENSY_ICONS.get(teensy_id, DEFAULT_TEENSY_ICON)
+        for event in self.framers[teensy_id].feed(chunk):
+            if isinstance(event, str):
+                log.debug("%s Teensy %s: %s", icon, teensy_id.upper(), event)
+            else:
+                self.handle_packet(teensy_id, event, received)
+
+    def handle_read_error(self, teensy_id, error):
+        """Report an error handling data from a Teensy"""
+        if self.running:
+            log.error("❌ Error reading Teensy %s: %s", teensy_id.upper(), error)
+
+    def watch_port(self, teensy_id, teensy):
+        """Register a connected Teensy with the I/O loop (with the connection lock held)"""
+        if teensy_id == BUTTON_TEENSY_ID:
+            handler = self.handle_button_teensy_data
+        else:
+            handler = partial(self.handle_led_teensy_data, teensy_id)
+        self.io_loop.register(teensy_id, teensy, handler, partial(self.handle_read_error, teensy_id),
+                              partial(self.handle_disconnect, teensy_id, teensy))
     
     def start_monitoring(self):
-        """Start monitoring both Teensys in separate threads"""
-        if not self.teensy_a or not self.teensy_b:
-            print("❌ Both Teensys must be connected before starting monitoring")
+        """Start monitoring all connected Teensys from a single I/O thread"""
+        if BUTTON_TEENSY_ID not in self.ports:
+            log.error("❌ The button Teensy must be connected before starting monitoring")
             return False
         
         self.running = True
         
-        # Start monitoring threads
-        self.thread_a = threading.Thread(target=self.monitor_teensy_a_and_send_commands, daemon=True)
-        self.thread_b = threading.Thread(target=self.monitor_teensy_b, daemon=True)
-        self.thread_c = threading.Thread(target=self.monitor_teensy_c, daemon=True)
-        
-        self.thread_a.start()
-        self.thread_b.start()
-        self.thread_c.start()
+        # One selector loop wakes only when a port has data, instead of a polling thread per port
+        with self._connection_lock:
+            self.io_loop = SerialEventLoop()
+            for teensy_id, teensy in self.ports.items():
+                self.watch_port(teensy_id, teensy)
+        self.io_loop.start()
+
+        # Missing Teensys are retried off the I/O thread so reconnecting never delays button events
+        self.reconnect_thread = threading.Thread(target=self._reconnect_loop, name="teensy-reconnect", daemon=True)
+        self.reconnect_thread.start()
+        self.clock_sync_thread = threading.Thread(target=self._clock_sync_loop, name="teensy-clock-sync", daemon=True)
+        self.clock_sync_thread.start()
+
+        self.hotplug = HotplugMonitor(self.handle_hotplug_add, self.handle_hotplug_remove,
+                                      serial_numbers=self.teensy_ids_by_serial)
+        if not self.hotplug.start():
+            log.info("💡 No USB hot-plug events here; missing Teensys are only retried on a timer")
+            self.hotplug = None
         
-        print("🚀 Started monitoring all Teensys")
+        missing = [teensy_id.upper() for teensy_id in self.teensy_ids if teensy_id not in self.ports]
+        log.info("🚀 Started monitoring %d Teensys", len(self.ports))
+        if missing:
+            log.warning("⚠️  Running without Teensy %s; retrying in the background", ", ".join(missing))
         return True
     
     def stop_monitoring(self):
         """Stop monitoring and close connections"""
-        print("🛑 Stopping Teensy monitoring...")
+        log.info("🛑 Stopping Teensy monitoring...")
         self.running = False
-        
-        if self.teensy_a:
-            self.teensy_a.close()
-            self.teensy_a = None
-        
-        if self.teensy_b:
-            self.teensy_b.close()
-            self.teensy_b = None
+        if self.hotplug:
+            self.hotplug.stop()
+            log.info("🔌 Hot-plug events: %s", self.hotplug)
+            self.hotplug = None
+        self._reconnect_wakeup.set()
+        self._clock_sync_wakeup.set()
+        if self.reconnect_thread:
+            self.reconnect_thread.join()
+            self.reconnect_thread = None
+        if self.clock_sync_thread:
+            self.clock_sync_thread.join()
+            self.clock_sync_thread = None
+        for teensy_id, clock in list(self.clocks.items()):
+            log.info("🕒 Teensy %s clock: %s", teensy_id.upper(), clock)
+        for teensy_id, slots in self.pulse_slots.items():
+            if slots.shed():
+                log.info("🎯 Teensy %s pulse slots: %s", teensy_id.upper(), slots)
+        for teensy_id, framer in self.framers.items():
+            if framer.bad_frames or framer.resyncs:
+                log.info("🧮 Teensy %s frames received: %d good, %d bad, %d resyncs", teensy_id.upper(),
+                         framer.packets, framer.bad_frames, framer.resyncs)
+        if self.io_loop:
+            self.io_loop.stop()
+            self.io_loop.close()
+            self.io_loop = None
 
-        if self.teensy_c:
-            self.teensy_c.close()
-            self.teensy_c = None
+        # Let queued commands go out before the ports close
+        for writer in self.writers.values():
+            writer.stop()
+            self.log_writer_stats(writer)
+        self.writers = {}
         
-        print("✅ Teensy connections closed")
+        self.close_ports()
+        log.info("✅ Teensy connections closed")
+        self.print_latency()
+
+    def log_writer_stats(self, writer):
+        log.info("📊 %s", writer)
+        if writer.link is not None:
+            log.info("🔁 %s link: %s", writer.name, writer.link)
+
+    def pulse_slot_stats(self):
+        """{teensy_id: PulseSlots.stats()}: pulses sent, merged, discarded and released for each LED Teensy"""
+        return {teensy_id: slots.stats() for teensy_id, slots in self.pulse_slots.items()}
+
+    def writer_stats(self):
+        """{teensy_id: DeviceWriter.stats()} for every connected LED Teensy: queue depth, shed commands, utilisation"""
+        return {teensy_id: writer.stats() for teensy_id, writer in list(self.writers.items())}
+
+    def link_stats(self):
+        """{teensy_id: SequencedLink.stats()} for every connected Teensy that acks commands"""
+        return {teensy_id: writer.link.stats() for teensy_id, writer in list(self.writers.items())
+                if writer.link is not None}
+
+    def request_link_stats(self):
+        """
+        Ask every connected LED Teensy for its frame counters
+
+        The replies arrive asynchronously and land in self.remote_link_stats; read them
+        with link_error_stats() a moment later.
+        """
+        for teensy_id in list(self.writers):
+            if self.wire_formats.get(teensy_id, WIRE_FORMAT_LEGACY) != WIRE_FORMAT_LEGACY:
+                self.send_command(teensy_id, CMD_LINK_STATS, b'', "link stats request")
+
+    def link_error_stats(self):
+        """
+        Frame counters for both directions of every port
+
+        Returns:
+            {teensy_id: {'pi': StreamFramer.stats() for what the Pi received,
+                         'teensy': good/bad frames and resyncs the Teensy last reported, or None}}
+        """
+        return {teensy_id: {'pi': framer.stats(), 'teensy': self.remote_link_stats.get(teensy_id)}
+                for teensy_id, framer in self.framers.items()}
+
+    def close_ports(self):
+        with self._connection_lock:
+            ports, self.ports = self.ports, {}
+            self.reconnect_at.clear()
+            self.reconnect_delays.clear()
+        for teensy in ports.values():
+            teensy.close()
     
     def __enter__(self):
         """Context manager entry"""
@@ -247,3 +884,244 @@ class DualTeensyTester:
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit"""
         self.stop_monitoring()
+
+
+# Old name, kept for existing scripts
+DualTeensyTester = TeensyHub
+
+
+
+class AsyncTeensyHub:
+    """
+    asyncio interface to the Teensys, for code that already runs an event loop
+
+    Ports are opened non-blocking and their file descriptors registered with the running
+    loop, so nothing here sleeps or needs a thread:
+
+        async with AsyncTeensyHub() as hub:
+            async for teensy_id, event in hub:
+                ...
+
+    Events are (teensy_id, event) pairs, where event is a str for text lines and a
+    CommandPacket for binary frames, in the order they were received.
+    """
+
+    def __init__(self, baudrate=DEFAULT_BAUDRATE, teensy_ids=tuple(TEENSY_MAPPING), max_events=1000):
+        self.baudrate = baudrate
+        self.teensy_ids = teensy_ids
+        self.strip_routes = build_strip_routes(get_led_teensy_ids(teensy_ids))
+        self.ports = {}  # teensy_id -> serial.Serial
+        self.framers = {teensy_id: StreamFramer(max_wire_format=WIRE_FORMAT_V2_CRC8) for teensy_id in teensy_ids}
+        self.wire_formats = {teensy_id: WIRE_FORMAT_LEGACY for teensy_id in teensy_ids}
+        self.last_heartbeat = {}
+        self.dropped_events = 0  # Events discarded because nobody was consuming them
+        import asyncio  # Only imported here so that TeensyHub users don't pay for it
+        self._events = asyncio.Queue(maxsize=max_events)
+        self._write_buffers = {}  # teensy_id -> bytes not yet accepted by the port
+        self._drained = {}  # teensy_id -> futures waiting for the write buffer to empty
+        self._hello_waiters = {}
+        self._loop = None
+        self._closed = False
+
+    async def connect(self):
+        """Detect, open and negotiate a wire format with every Teensy in teensy_ids"""
+        import asyncio
+        self._loop = asyncio.get_running_loop()
+        self._closed = False
+        # Drop what an earlier connection left behind; a failed attempt's end marker would
+        # otherwise end the next events() right away
+        while not self._events.empty():
+            self._events.get_nowait()
+        log.info("🔍 Auto-detecting Teensy devices...")
+        ports = await self._loop.run_in_executor(None, detect_all_teensys)
+
+        for teensy_id in self.teensy_ids:
+            port = ports.get(f"teensy_{teensy_id}")
+            if port is None:
+                log.error("❌ Teensy %s not found!", teensy_id.upper())
+                await self.close()
+                return False
+            try:
+                self.ports[teensy_id] = serial.Serial(port, self.baudrate, timeout=0)
+            except Exception as e:
+                log.error("❌ Failed to connect to Teensy %s: %s", teensy_id.upper(), e)
+                await self.close()
+                return False
+            log.info("✅ Connected to Teensy %s on %s", teensy_id.upper(), port)
+
+            # Until the handshake says otherwise
+            self.wire_formats[teensy_id] = WIRE_FORMAT_LEGACY
+            self.framers[teensy_id].wire_format = WIRE_FORMAT_LEGACY
+
+            fd = self.ports[teensy_id].fileno()
+            os.set_blocking(fd, False)
+            self._write_buffers[teensy_id] = bytearray()
+            self._drained[teensy_id] = []
+            self._loop.add_reader(fd, self._on_readable, teensy_id)
+
+        await asyncio.gather(*(self.negotiate_wire_format(teensy_id) for teensy_id in self.ports))
+        return True
+
+    async def negotiate_wire_format(self, teensy_id, timeout=0.5):
+        """
+        Offer the v2 wire format (see TeensyHub.negotiate_wire_format)
+
+        The reply is applied where it is parsed, in _on_readable(), so frames after it in
+        the same read, and a reply that only comes after the timeout, use the new format.
+        """
+        import asyncio
+        future = self._loop.create_future()
+        self._hello_waiters[teensy_id] = future
+        try:
+            await self._write(teensy_id, create_hello_packet(capabilities=CAP_SEQUENCED | CAP_TIME_SYNC).to_bytes())
+            await asyncio.wait_for(future, timeout)
+        except TimeoutError:
+            pass
+        except Exception as e:
+            log.error("❌ Wire format handshake with Teensy %s failed: %s", teensy_id.upper(), e)
+        finally:
+            self._hello_waiters.pop(teensy_id, None)
+
+        wire_format = self.wire_formats[teensy_id]
+        log.info("🔗 Teensy %s wire format: %s", teensy_id.upper(), WIRE_FORMAT_NAMES.get(wire_format, wire_format))
+        return wire_format
+
+    async def send(self, packet, teensy_id):
+        """
+        Send a CommandPacket to a Teensy in its negotiated wire format
+
+        Returns once the port has accepted all of it.
+        """
+        data = bytes(packet.data[:packet.data_length])
+        await self._write(teensy_id, encode_command(packet.command, data, self.wire_formats[teensy_id]))
+
+    async def send_led_pulse(self, strip_id):
+        """Pulse a strip, numbered across all LED Teensys (0-7 on B, 8-15 on C, ...)"""
+        teensy_id, local_strip = self.strip_routes[strip_id % len(self.strip_routes)]
+        command, data = get_led_pulse_command(local_strip)
+        await self._write(teensy_id, encode_command(command, data, self.wire_formats[teensy_id]))
+
+    async def events(self):
+        """Yield (teensy_id, event) pairs until the hub is closed"""
+        while True:
+            item = await self._events.get()
+            if item is None:
+                # Put the marker back for any other iterator
+                self._end_events()
+                return
+            yield item
+
+    def __aiter__(self):
+        return self.events()
+
+    async def close(self):
+        """Unregister and close every port, and end any events() iterators"""
+        for teensy_id in list(self.ports):
+            self._disconnect(teensy_id)
+        self._closed = True
+        self._end_events()
+
+    async def __aenter__(self):
+        if await self.connect():
+            return self
+        raise ConnectionError("Failed to connect to Teensy devices")
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _write(self, teensy_id, frame):
+        if teensy_id not in self.ports:
+            raise ConnectionError(f"Teensy {teensy_id.upper()} not connected")
+        self._write_buffers[teensy_id] += frame
+        self._flush(teensy_id)
+        if self._write_buffers.get(teensy_id):
+            future = self._loop.create_future()
+            self._drained[teensy_id].append(future)
+            await future
+
+    def _flush(self, teensy_id):
+        """Write as much of the buffer as the port takes; wait for writability for the rest"""
+        port = self.ports[teensy_id]
+        buffer = self._write_buffers[teensy_id]
+        try:
+            del buffer[:os.write(port.fileno(), buffer)]
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            log.error("❌ Error sending to Teensy %s: %s", teensy_id.upper(), e)
+            self._disconnect(teensy_id)
+            return
+
+        if buffer:
+            self._loop.add_writer(port.fileno(), self._flush, teensy_id)
+            return
+        self._loop.remove_writer(port.fileno())
+        for future in self._drained[teensy_id]:
+            if not future.done():
+                future.set_result(None)
+        self._drained[teensy_id].clear()
+
+    def _on_readable(self, teensy_id):
+        try:
+            chunk = os.read(self.ports[teensy_id].fileno(), 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            log.error("❌ Error reading Teensy %s: %s", teensy_id.upper(), e)
+            self._disconnect(teensy_id)
+            return
+        if not chunk:
+            log.error("❌ Teensy %s disconnected", teensy_id.upper())
+            self._disconnect(teensy_id)
+            return
+
+        framer = self.framers[teensy_id]
+        for event in framer.feed(chunk):
+            if isinstance(event, CommandPacket):
+                if event.command == CMD_HELLO:
+                    # The framer switched as it parsed the reply; writes follow from here on,
+                    # whether or not negotiate_wire_format() is still waiting for it
+                    self.wire_formats[teensy_id] = framer.wire_format
+                    future = self._hello_waiters.get(teensy_id)
+                    if future and not future.done():
+                        future.set_result(framer.wire_format)
+                    else:
+                        log.warning("⚠️  Late wire format reply from Teensy %s", teensy_id.upper())
+                    continue
+                if event.command == CMD_HEARTBEAT:
+                    self.last_heartbeat[teensy_id] = time.monotonic()
+            self._put_event((teensy_id, event))
+
+    def _put_event(self, item):
+        import asyncio
+        if self._closed:
+            return
+        try:
+            self._events.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped_events += 1
+
+    def _end_events(self):
+        """Queue the end marker for events(), evicting the oldest event if the queue is full"""
+        if self._events.full():
+            self._events.get_nowait()
+            self.dropped_events += 1
+        self._events.put_nowait(None)
+
+    def _fail_drain_waiters(self, teensy_id, error):
+        for future in self._drained.get(teensy_id, []):
+            if not future.done():
+                future.set_exception(ConnectionError(f"Teensy {teensy_id.upper()}: {error}"))
+        self._drained.get(teensy_id, []).clear()
+
+    def _disconnect(self, teensy_id):
+        port = self.ports.pop(teensy_id, None)
+        if port is None:
+            return
+        fd = port.fileno()
+        self._loop.remove_reader(fd)
+        self._loop.remove_writer(fd)
+        self._fail_drain_waiters(teensy_id, "port closed")
+        self._write_buffers.pop(teensy_id, None)
+        port.close()
+        self.framers[teensy_id].reset()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Incremental stream framing for Teensy serial output
+
+Teensys print text lines (debug output, BUTTON_PRESS:n) and write binary frames on the
+same port, either legacy 35 byte CommandPackets or v2 frames once the handshake has
+upgraded the link. StreamFramer takes whatever chunk serial.read(in_waiting) returned and
+splits it into complete text lines and checksummed packets, resyncing after corruption.
+"""
+
+import re
+
+from .config import (
+    CMD_LED_PULSE,
+    CMD_LED_EFFECT,
+    CMD_LED_FRAME_COMMIT,
+    CMD_HELLO,
+    CMD_ACK,
+    CMD_TIME_SYNC,
+    CMD_LINK_STATS,
+    CMD_BUTTON_PRESS,
+    CMD_BUTTON_LED,
+    CMD_HEARTBEAT,
+    FRAME_SYNC,
+    WIRE_FORMAT_LEGACY,
+    WIRE_FORMAT_V2,
+)
+from .protocol import (
+    CommandPacket,
+    PACKET_SIZE,
+    PACKET_DATA_SIZE,
+    PACKET_STRUCT,
+    MAX_V2_LENGTH,
+    V2_CHECKSUMS,
+)
+
+# Command codes that mark the start of a binary frame. These bytes never appear in the
+# UTF-8 text the firmware prints, which is what lets text and frames share one stream.
+# CMD_SENSOR_DATA (0x20) and CMD_RING_LED_TEST (0x30) are ASCII ' ' and '0', so frames
+# using them can't be told apart from text and are read as text. V2 frames all start with
+# FRAME_SYNC, so once a link is on v2 that is the only frame start looked for.
+FRAME_START_COMMANDS = (
+    CMD_LED_PULSE,
+    CMD_LED_EFFECT,
+    CMD_LED_FRAME_COMMIT,
+    CMD_HELLO,
+    CMD_ACK,
+    CMD_TIME_SYNC,
+    CMD_LINK_STATS,
+    CMD_BUTTON_PRESS,
+    CMD_BUTTON_LED,
+    CMD_HEARTBEAT,
+)
+
+# Everything the scanner needs to stop at: a line ending or a possible legacy/v2 frame start
+_BOUNDARY = re.compile(b'[\n' + b''.join(re.escape(bytes([c])) for c in FRAME_START_COMMANDS + (FRAME_SYNC,)) + b']')
+# The same once the link is on v2. A legacy command byte inside a corrupt v2 frame would
+# otherwise hold the scan until a whole legacy packet's worth of bytes had arrived.
+_V2_BOUNDARY = re.compile(b'[\n' + re.escape(bytes([FRAME_SYNC])) + b']')
+
+NEWLINE = 0x0A
+DEFAULT_BUFFER_CAPACITY = 4096
+
+
+class StreamFramer:
+    """
+    Splits a mixed text/binary byte stream into lines and CommandPackets
+
+    Feed it arbitrary chunks; it keeps the unfinished tail in a bounded buffer between calls.
+    A candidate frame that fails its checksum only costs its first byte, so scanning resumes
+    inside the damaged region and the next good frame is never swallowed.
+
+    wire_format says which checksum v2 frames carry. Legacy packets always use the XOR
+    checksum, and are only looked for while wire_format is WIRE_FORMAT_LEGACY; after
+    that, a frame starts at FRAME_SYNC and nowhere else. With max_wire_format set, a CMD_HELLO reply switches wire_format to
+    min(its version, max_wire_format) as soon as it is parsed, because the Teensy sends
+    everything after the reply in the new format, including the rest of the same read.
+    Otherwise the owner updates wire_format after the handshake.
+    """
+
+    def __init__(self, capacity=DEFAULT_BUFFER_CAPACITY, wire_format=WIRE_FORMAT_LEGACY, max_wire_format=None):
+        self.capacity = capacity
+        self.wire_format = wire_format
+        self.max_wire_format = max_wire_format
+        self._buffer = bytearray()
+        self._scan_pos = 0  # Bytes before this offset are known to be plain text
+
+        # Counters
+        self.lines = 0
+        self.packets = 0  # Good frames
+        self.bad_frames = 0  # Well-formed frames whose checksum didn't match
+        self.resyncs = 0  # Frame start bytes skipped, bad frames included
+        self.dropped_bytes = 0
+
+    def feed(self, chunk):
+        """
+        Add received bytes to the stream
+
+        Args:
+            chunk: Bytes as returned by serial.read()
+
+        Returns:
+            List of complete events in arrival order: str for text lines, CommandPacket for frames
+        """
+        buffer = self._buffer
+        buffer += chunk
+        events = []
+        line_start = 0
+        pos = self._scan_pos
+
+        while True:
+            boundary = _V2_BOUNDARY if self.wire_format >= WIRE_FORMAT_V2 else _BOUNDARY
+            match = boundary.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+
+            i = match.start()
+            if buffer[i] == NEWLINE:
+                line = buffer[line_start:i].decode('utf-8', errors='replace').strip()
+                if line:
+                    events.append(line)
+                    self.lines += 1
+                line_start = pos = i + 1
+                continue
+
+            # Possible binary frame; wait until all of it has arrived
+            if buffer[i] == FRAME_SYNC:
+                frame_size = self._v2_frame_size(buffer, i)
+            else:
+                frame_size = PACKET_SIZE
+            if frame_size is None or len(buffer) - i < frame_size:
+                pos = i
+                break
+
+            packet = self._decode(buffer, i, frame_size)
+            if packet is not None:
+                events.append(packet)
+                self.packets += 1
+                del buffer[i:i + frame_size]
+                if packet.command == CMD_HELLO and packet.data_length and self.max_wire_format is not None:
+                    self.wire_format = min(packet.data[0], self.max_wire_format)
+            else:
+                # Corrupt or not a frame after all: drop just the marker byte and rescan from there
+                del buffer[i]
+                self.resyncs += 1
+            pos = i
+
+        # Keep only the unfinished line/frame
+        del buffer[:line_start]
+        pos -= line_start
+
+        overflow = len(buffer) - self.capacity
+        if overflow > 0:
+            del buffer[:overflow]
+            pos = max(0, pos - overflow)
+            self.dropped_bytes += overflow
+
+        self._scan_pos = pos
+        return events
+
+    @staticmethod
+    def _v2_frame_size(buffer, i):
+        """Size of the v2 frame starting at i, 0 if the length byte is invalid, None if it hasn't arrived"""
+        if len(buffer) - i < 2:
+            return None
+        length = buffer[i + 1]
+        if length == 0 or length > MAX_V2_LENGTH:
+            return 0
+        return length + 3
+
+    def _decode(self, buffer, i, frame_size):
+        """Decode and validate the frame at i, or return None if it isn't one"""
+        if frame_size == 0:
+            return None
+        if buffer[i] != FRAME_SYNC:
+            command, data_length, data, checksum = PACKET_STRUCT.unpack_from(buffer, i)
+            if data_length > PACKET_DATA_SIZE:
+                return None
+            packet = CommandPacket(command, data_length, data, checksum)
+            if packet.calculate_checksum() == checksum:
+                return packet
+            self.bad_frames += 1
+            return None
+
+        end = i + frame_size - 1
+        if V2_CHECKSUMS.get(self.wire_format, V2_CHECKSUMS[WIRE_FORMAT_V2])(buffer, i + 1, end) != buffer[end]:
+            self.bad_frames += 1
+            return None
+        packet = CommandPacket(buffer[i + 2], frame_size - 4, buffer[i + 3:end])
+        packet.checksum = packet.calculate_checksum()
+        return packet
+
+    def stats(self):
+        """Snapshot of the counters"""
+        return {
+            'lines': self.lines,
+            'good_frames': self.packets,
+            'bad_frames': self.bad_frames,
+            'resyncs': self.resyncs,
+            'dropped_bytes': self.dropped_bytes,
+        }
+
+    def reset(self):
+        """Discard any partially received data (e.g. after reopening the port)"""
+        self._buffer.clear()
+        self._scan_pos = 0
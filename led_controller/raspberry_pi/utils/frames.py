@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Frame push encoding for LED Teensys
+
+Lets the Pi drive every pixel of an LED Teensy instead of only triggering pulses.
+Each frame is sent as the spans of pixels that changed since the last frame the
+Teensy acknowledged, run-length encoded, followed by a commit that shows it.
+
+Wire format (CMD_LED_FRAME_SPAN data):
+    frame_id, strip, then segments of
+        start, count            - raw: followed by count RGBW pixels (4 bytes each)
+        start, count | RUN      - run: followed by one RGBW pixel repeated count times
+CMD_LED_FRAME_COMMIT data: frame_id, number of span packets sent for the frame.
+The Teensy echoes the commit back with [frame_id, complete] once the frame is shown.
+"""
+
+import threading
+from dataclasses import dataclass
+
+from .config import (
+    CMD_LED_FRAME_SPAN,
+    CMD_LED_FRAME_COMMIT,
+    NUM_STRIPS_PER_TEENSY,
+    LED_STRIP_NUM_LEDS,
+    WIRE_FORMAT_LEGACY,
+)
+from .protocol import PACKET_DATA_SIZE, BurstSize, encode_command_burst, frame_size
+
+FRAME_SPAN_RUN = 0x80  # Set in a segment's count byte for run-length segments
+SPAN_HEADER_SIZE = 2  # frame_id, strip
+SEGMENT_HEADER_SIZE = 2  # start, count
+BYTES_PER_PIXEL = 4  # RGBW, sent as 0xWWRRGGBB big-endian
+MAX_RAW_PIXELS_PER_PACKET = (PACKET_DATA_SIZE - SPAN_HEADER_SIZE - SEGMENT_HEADER_SIZE) // BYTES_PER_PIXEL
+MIN_RUN_LENGTH = 2  # A run of 2 (6 bytes) already beats 2 raw pixels (8 bytes)
+MAX_SEGMENT_PIXELS = FRAME_SPAN_RUN - 1
+
+
+@dataclass
+class FrameStats:
+    """What it cost to send one frame"""
+    frame_id: int
+    changed_pixels: int
+    commands: int  # Span and commit commands, before batching
+    wire_bytes: int
+    full_frame_bytes: int  # What sending every pixel raw would have cost
+
+    @property
+    def compression_ratio(self):
+        return self.full_frame_bytes / self.wire_bytes if self.wire_bytes else float('inf')
+
+    def __str__(self):
+        return (f"frame {self.frame_id}: {self.changed_pixels} px changed, {self.commands} commands, "
+                f"{self.wire_bytes} bytes ({self.compression_ratio:.1f}x)")
+
+
+def pixel_bytes(color):
+    """Wire bytes for one 0xWWRRGGBB pixel"""
+    return color.to_bytes(BYTES_PER_PIXEL, 'big')
+
+
+class FrameEncoder:
+    """
+    Delta/RLE encoder for pushing frames to one LED Teensy
+
+    Pixels are diffed against the last frame the Teensy acknowledged and every frame
+    still in flight, since the Teensy may have applied any of those. Until the first
+    ack (or after an incomplete one) the whole frame is sent.
+    """
+
+    def __init__(self, num_strips=NUM_STRIPS_PER_TEENSY, num_leds=LED_STRIP_NUM_LEDS,
+                 max_in_flight=4, encode_burst=encode_command_burst, wire_format=WIRE_FORMAT_LEGACY):
+        self.num_strips = num_strips
+        self.num_leds = num_leds
+        self.max_in_flight = max_in_flight
+        self.encode_burst = encode_burst
+        self.wire_format = wire_format  # Updated by the owner once the handshake settles
+        self._acked = None
+        self._in_flight = {}  # frame_id -> pixels, in send order
+        self._next_frame_id = 0
+        self._lock = threading.Lock()  # Acks arrive on the reader thread
+        self.last_stats = None
+
+    @property
+    def full_frame_bytes(self):
+        """Bytes to send every pixel raw, one full span packet per MAX_RAW_PIXELS_PER_PACKET pixels"""
+        headers = SPAN_HEADER_SIZE + SEGMENT_HEADER_SIZE
+        full_packets, leftover = divmod(self.num_leds, MAX_RAW_PIXELS_PER_PACKET)
+        strip_bytes = full_packets * frame_size(headers + MAX_RAW_PIXELS_PER_PACKET * BYTES_PER_PIXEL, self.wire_format)
+        if leftover:
+            strip_bytes += frame_size(headers + leftover * BYTES_PER_PIXEL, self.wire_format)
+        return self.num_strips * strip_bytes + frame_size(2, self.wire_format)  # + commit
+
+    def encode(self, pixels):
+        """
+        Encode a frame
+
+        Args:
+            pixels: num_strips * num_leds colors (0xWWRRGGBB ints), strip by strip
+
+        Returns:
+            Bytes for a single write(); stats for the frame are in last_stats
+        """
+        return b''.join(self.encode_writes(pixels))
+
+    def encode_writes(self, pixels, max_write=None):
+        """
+        Encode a frame as several writes, so it can be paced without holding up other commands
+
+        Args:
+            pixels: As for encode()
+            max_write: Most bytes per write; each write is a whole number of packets, so
+                       one packet bigger than this gets a write of its own
+
+        Returns:
+            List of bytes, to be written in order; stats for the frame are in last_stats
+        """
+        pixels = tuple(pixels)
+        if len(pixels) != self.num_strips * self.num_leds:
+            raise ValueError(f"Expected {self.num_strips * self.num_leds} pixels, got {len(pixels)}")
+
+        with self._lock:
+            if len(self._in_flight) >= self.max_in_flight:
+                # Acks have stopped coming back; assume nothing and send a full frame
+                self._acked = None
+                self._in_flight.clear()
+
+            frame_id = self._next_frame_id
+            self._next_frame_id = (frame_id + 1) & 0xFF
+            self._in_flight[frame_id] = pixels
+
+            bases = list(self._in_flight.values())[:-1]
+            acked = self._acked
+            if acked is not None:
+                bases.append(acked)
+
+        commands = []
+        changed_pixels = 0
+        for strip in range(self.num_strips):
+            offset = strip * self.num_leds
+            strip_pixels = pixels[offset:offset + self.num_leds]
+            if acked is None:
+                changed = [True] * self.num_leds
+            else:
+                changed = [any(base[offset + i] != color for base in bases)
+                           for i, color in enumerate(strip_pixels)]
+            changed_pixels += sum(changed)
+            segments = self._segments(strip_pixels, changed)
+            commands.extend(self._pack(frame_id, strip, segments))
+
+        span_packets = len(commands)
+        commands.append((CMD_LED_FRAME_COMMIT, bytes([frame_id, span_packets & 0xFF])))
+
+        writes = self._split(commands, max_write)
+        self.last_stats = FrameStats(frame_id, changed_pixels, len(commands), sum(len(write) for write in writes),
+                                     self.full_frame_bytes)
+        return writes
+
+    def acknowledge(self, frame_id, complete=True):
+        """Handle the Teensy's commit echo for frame_id"""
+        with self._lock:
+            pixels = self._in_flight.get(frame_id)
+            if pixels is None:
+                return
+
+            # Frames are shown in order, so anything sent before this one is settled too
+            for sent_id in list(self._in_flight):
+                del self._in_flight[sent_id]
+                if sent_id == frame_id:
+                    break
+
+            if complete:
+                self._acked = pixels
+            else:
+                # Some spans were lost, so the Teensy's copy is unknown until a full frame lands
+                self._acked = None
+                self._in_flight.clear()
+
+    def reset(self):
+        """Forget what the Teensy has (e.g. after it reconnects); the next frame is sent in full"""
+        with self._lock:
+            self._acked = None
+            self._in_flight.clear()
+
+    def _split(self, commands, max_write):
+        """
+        Encode commands into as few writes of at most max_write bytes as they fit in
+
+        Each write's size is tallied with BurstSize as commands join it, so encode_burst
+        must pack the way encode_command_burst() does; every group is encoded once.
+        """
+        if max_write is None:
+            return [self.encode_burst(commands, self.wire_format)]
+        groups = []
+        group = []
+        size = BurstSize(self.wire_format)
+        for command in commands:
+            if group and size.size_with(len(command[1])) > max_write:
+                groups.append(group)
+                group = []
+                size = BurstSize(self.wire_format)
+            group.append(command)
+            size.add(len(command[1]))
+        if group:
+            groups.append(group)
+        return [self.encode_burst(group, self.wire_format) for group in groups]
+
+    def _segments(self, strip_pixels, changed):
+        """Split the changed pixels of a strip into (start, colors, is_run) segments"""
+        segments = []
+        i = 0
+        while i < self.num_leds:
+            if not changed[i]:
+                i += 1
+                continue
+
+            # Extend the run of identical changed pixels starting here
+            run_end = i + 1
+            limit = min(self.num_leds, i + MAX_SEGMENT_PIXELS)
+            while run_end < limit and changed[run_end] and strip_pixels[run_end] == strip_pixels[i]:
+                run_end += 1
+            if run_end - i >= MIN_RUN_LENGTH:
+                segments.append((i, strip_pixels[i:run_end], True))
+                i = run_end
+                continue
+
+            # Raw pixels up to the end of the changed span or the start of the next run
+            raw_end = i + 1
+            while (raw_end < self.num_leds and changed[raw_end]
+                   and not (raw_end + 1 < self.num_leds and changed[raw_end + 1]
+                            and strip_pixels[raw_end] == strip_pixels[raw_end + 1])):
+                raw_end += 1
+            segments.append((i, strip_pixels[i:raw_end], False))
+            i = raw_end
+        return segments
+
+    def _pack(self, frame_id, strip, segments):
+        """Pack segments into as few span packets as fit, splitting raw segments where needed"""
+        commands = []
+        data = bytearray((frame_id, strip))
+
+        def flush():
+            nonlocal data
+            if len(data) > SPAN_HEADER_SIZE:
+                commands.append((CMD_LED_FRAME_SPAN, bytes(data)))
+            data = bytearray((frame_id, strip))
+
+        for start, colors, is_run in segments:
+            if is_run:
+                if len(data) + SEGMENT_HEADER_SIZE + BYTES_PER_PIXEL > PACKET_DATA_SIZE:
+                    flush()
+                data += bytes((start, len(colors) | FRAME_SPAN_RUN))
+                data += pixel_bytes(colors[0])
+                continue
+
+            while colors:
+                room = (PACKET_DATA_SIZE - len(data) - SEGMENT_HEADER_SIZE) // BYTES_PER_PIXEL
+                if room <= 0:
+                    flush()
+                    continue
+                chunk, colors = colors[:room], colors[room:]
+                data += bytes((start, len(chunk)))
+                for color in chunk:
+                    data += pixel_bytes(color)
+                start += len(chunk)
+        flush()
+        return commands
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+USB hot-plug events for Teensy serial ports
+
+HotplugMonitor listens for uevents on a netlink socket. As serial ports come and go, it
+keeps a serial number -> device index up to date and calls back. The hub can then
+reattach a Teensy as soon as its port exists, rather than polling comports() on a
+backoff timer.
+
+Two kinds of message arrive on the socket, and both are parsed:
+  - udev's (multicast group 2): sent once udev has applied 00-teensy.rules, so the port
+    is ready to open. They carry ID_SERIAL_SHORT.
+  - the kernel's own (group 1): sent before udev runs. The serial number is read from
+    the USB device's directory in sysfs.
+
+Nothing here needs real hardware. set_uevent_source() swaps the netlink socket for any
+datagram socket (the simulator uses one end of a socketpair), and sysfs_root can point
+at a fake tree:
+
+    monitor = HotplugMonitor(on_add, on_remove, sysfs_root="/tmp/sys")
+    monitor.handle_message(encode_uevent({'ACTION': 'add', ...}, udev=False))
+"""
+
+import os
+import selectors
+import socket
+import struct
+import threading
+
+from .device_utils import build_port_index
+from .log import get_logger
+
+log = get_logger("hotplug")
+
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_GROUP_KERNEL = 1
+UEVENT_GROUP_UDEV = 2
+UEVENT_BUFFER_SIZE = 1 << 20  # Room for a burst of events while the monitor thread is busy
+
+# Header libudev puts in front of its messages; the magic is big-endian, the rest host order
+UDEV_MONITOR_PREFIX = b"libudev\0"
+UDEV_MONITOR_MAGIC = 0xFEEDCAFE
+UDEV_HEADER = struct.Struct("=8sIIIIIIII")  # prefix, magic, header size, properties offset/length, filter hashes
+
+
+def open_uevent_socket(groups=UEVENT_GROUP_UDEV):
+    """
+    Netlink socket subscribed to uevents
+
+    Returns:
+        The bound socket, or None where netlink isn't available (not Linux, or not allowed)
+    """
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+    except (AttributeError, OSError):
+        return None
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UEVENT_BUFFER_SIZE)
+        sock.bind((0, groups))
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+# Where HotplugMonitor gets its socket; the simulator swaps in its own (see utils/simulator.py)
+_uevent_source = open_uevent_socket
+
+
+def set_uevent_source(source=None):
+    """
+    Replace where uevents come from, e.g. with simulated Teensys
+
+    Args:
+        source: Callable taking the netlink groups and returning a datagram socket (or
+                None if there is none); None restores open_uevent_socket
+
+    Returns:
+        The source that was in use before
+    """
+    global _uevent_source
+    previous = _uevent_source
+    _uevent_source = source or open_uevent_socket
+    return previous
+
+
+def parse_uevent(message):
+    """
+    Properties of a kernel or udev uevent message
+
+    Returns:
+        {KEY: value} strings, or None if the message isn't a uevent
+    """
+    if message.startswith(UDEV_MONITOR_PREFIX):
+        if len(message) < UDEV_HEADER.size:
+            return None
+        _, magic, _, properties_offset, properties_length = UDEV_HEADER.unpack_from(message)[:5]
+        if socket.ntohl(magic) != UDEV_MONITOR_MAGIC:
+            return None
+        body = message[properties_offset:properties_offset + properties_length]
+    else:
+        # The kernel's: "action@devpath\0KEY=value\0KEY=value\0..."
+        header, _, body = message.partition(b'\0')
+        if b'@' not in header:
+            return None
+
+    properties = {}
+    for field in body.split(b'\0'):
+        key, separator, value = field.partition(b'=')
+        if separator:
+            properties[key.decode(errors='replace')] = value.decode(errors='replace')
+    return properties if 'ACTION' in properties else None
+
+
+def encode_uevent(properties, udev=True):
+    """
+    Message as udev (or, with udev=False, the kernel) would send it; for simulators and tests
+
+    Args:
+        properties: {KEY: value}; needs at least ACTION and DEVPATH
+    """
+    body = b''.join(f"{key}={value}".encode() + b'\0' for key, value in properties.items())
+    if not udev:
+        return f"{properties['ACTION']}@{properties['DEVPATH']}".encode() + b'\0' + body
+    header = UDEV_HEADER.pack(UDEV_MONITOR_PREFIX, socket.htonl(UDEV_MONITOR_MAGIC), UDEV_HEADER.size,
+                              UDEV_HEADER.size, len(body), 0, 0, 0, 0)
+    return header + body
+
+
+class HotplugMonitor:
+    """
+    Watches uevents for serial ports with a serial number appearing and disappearing
+
+    Callbacks run on the monitor thread, so they should only hand the news on.
+
+    Args:
+        on_add: Called as on_add(serial_number, device) when a port appears
+        on_remove: Called as on_remove(serial_number, device) when one goes away
+        serial_numbers: Only report these (default: every port with a serial number)
+        groups: Netlink groups to listen on (UEVENT_GROUP_UDEV, UEVENT_GROUP_KERNEL or both)
+        sysfs_root: Where sysfs is mounted, for serial numbers the message doesn't carry
+        dev_root: Where device nodes are, for kernel messages that only name the node
+    """
+
+    def __init__(self, on_add=None, on_remove=None, serial_numbers=None, groups=UEVENT_GROUP_UDEV,
+                 sysfs_root="/sys", dev_root="/dev"):
+        self.on_add = on_add
+        self.on_remove = on_remove
+        self.serial_numbers = set(serial_numbers) if serial_numbers is not None else None
+        self.groups = groups
+        self.sysfs_root = sysfs_root
+        self.dev_root = dev_root
+        self.index = {}  # serial number -> device path of every port seen
+        self._sock = None
+        self._selector = None
+        self._wakeup_read = self._wakeup_write = None
+        self.running = False
+        self.thread = None
+
+        # Counters
+        self.added = 0
+        self.removed = 0
+        self.ignored = 0  # Messages that weren't about a serial port we care about
+
+    def start(self, index=None):
+        """
+        Open the uevent socket and start the monitor thread
+
+        Args:
+            index: {serial_number: device} to start from; default is one port scan
+
+        Returns:
+            False if there is no uevent socket to listen on
+        """
+        self._sock = _uevent_source(self.groups)
+        if self._sock is None:
+            return False
+        self.index = dict(index) if index is not None else build_port_index()
+
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._sock, selectors.EVENT_READ)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="teensy-hotplug", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Stop the monitor thread and close the socket"""
+        self.running = False
+        if self.thread:
+            os.write(self._wakeup_write, b'\0')
+            self.thread.join()
+            self.thread = None
+        if self._sock is not None:
+            self._selector.close()
+            self._sock.close()
+            os.close(self._wakeup_read)
+            os.close(self._wakeup_write)
+            self._sock = None
+
+    def device_for(self, serial_number):
+        """Device path the index has for serial_number, if it is still there"""
+        device = self.index.get(serial_number)
+        return device if device is not None and os.path.exists(device) else None
+
+    def handle_message(self, message):
+        """
+        Apply one uevent message to the index and call back
+
+        Returns:
+            ("add" or "remove", serial_number, device), or None if it was ignored
+        """
+        properties = parse_uevent(message)
+        if properties is None or properties.get('SUBSYSTEM') != 'tty' or not properties.get('DEVNAME'):
+            self.ignored += 1
+            return None
+        action = properties['ACTION']
+        device = properties['DEVNAME']
+        if not device.startswith('/'):
+            device = os.path.join(self.dev_root, device)
+
+        if action == 'add':
+            serial_number = properties.get('ID_SERIAL_SHORT') or self._sysfs_serial(properties.get('DEVPATH', ''))
+        elif action == 'remove':
+            # The sysfs directory is gone by now, so go by what was recorded at add
+            serial_number = next((serial for serial, path in self.index.items() if path == device), None)
+        else:
+            serial_number = None
+        if serial_number is None or (self.serial_numbers is not None and serial_number not in self.serial_numbers):
+            self.ignored += 1
+            return None
+
+        if action == 'add':
+            self.index[serial_number] = device
+            self.added += 1
+            callback = self.on_add
+        else:
+            del self.index[serial_number]
+            self.removed += 1
+            callback = self.on_remove
+        log.debug("🔌 %s %s (SER=%s)", action, device, serial_number)
+        if callback:
+            callback(serial_number, device)
+        return action, serial_number, device
+
+    def _sysfs_serial(self, devpath):
+        """Serial number of the USB device above a tty in sysfs, e.g. .../1-1/1-1:1.0/tty/ttyACM0"""
+        root = os.path.join(self.sysfs_root, 'devices')
+        path = os.path.join(self.sysfs_root, devpath.lstrip('/'))
+        while path.startswith(root + os.sep):
+            try:
+                with open(os.path.join(path, 'serial')) as f:
+                    return f.read().strip()
+            except OSError:
+                path = os.path.dirname(path)
+        return None
+
+    def _run(self):
+        while self.running:
+            for key, _ in self._selector.select():
+                if key.fileobj is not self._sock:
+                    continue
+                try:
+                    message = self._sock.recv(8192)
+                except OSError as e:
+                    # ENOBUFS: events were lost while we were busy; the hub's backoff retries cover them
+                    log.warning("⚠️  Missed hot-plug events: %s", e)
+                    continue
+                try:
+                    self.handle_message(message)
+                except Exception as e:
+                    log.error("❌ Error handling hot-plug event: %s", e)
+
+    def __str__(self):
+        return f"{self.added} added, {self.removed} removed, {self.ignored} ignored, {len(self.index)} known"
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Selector-driven serial I/O loop
+
+One thread waits on every Teensy port at once with selectors (epoll on the Pi) and only
+wakes up when bytes arrive, instead of one thread per port polling in_waiting.
+"""
+
+import os
+import selectors
+import threading
+import time
+
+
+class SerialEventLoop:
+    """
+    Waits on any number of serial ports and hands each received chunk to that port's handler
+
+    Handlers run on the loop thread as handler(chunk, received), where received is the
+    time.perf_counter_ns() at which the loop woke up for the data.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._ports = {}  # name -> port
+        self.running = False
+        self.thread = None
+
+        # Lets stop() (and registrations from other threads) interrupt a blocking select()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ, None)
+
+    def register(self, name, port, handler, error_handler=None, disconnect_handler=None):
+        """
+        Start watching a port
+
+        Args:
+            name: Unique name for the port (e.g. Teensy id)
+            port: Open serial.Serial (anything with fileno(), in_waiting and read()), opened
+                  with timeout=0 so a read can never hold up the other ports
+            handler: Called with (chunk, received) for every read
+            error_handler: Called with the exception if handling fails
+            disconnect_handler: Called with the exception if reading fails (the device is gone);
+                                the port is unregistered first. Defaults to error_handler.
+        """
+        self._ports[name] = port
+        self._selector.register(port, selectors.EVENT_READ,
+                                (name, handler, error_handler, disconnect_handler or error_handler))
+        self._wakeup()
+
+    def unregister(self, name):
+        """Stop watching a port; it is not closed"""
+        port = self._ports.pop(name, None)
+        if port is not None:
+            self._selector.unregister(port)
+            self._wakeup()
+
+    def run(self):
+        """Dispatch reads on the calling thread until stop() is called"""
+        if self.thread is None:
+            # Called directly rather than by start()
+            self.running = True
+        while self.running:
+            ready = self._selector.select()
+            received = time.perf_counter_ns()
+            for key, _ in ready:
+                if key.data is None:
+                    os.read(self._wakeup_read, 512)
+                    continue
+                self._read(key.fileobj, *key.data, received)
+
+    def start(self):
+        """Run the loop on a daemon thread"""
+        # Set here, not in run(), so a stop() right after start() can't be undone by the thread starting late
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="serial-io", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the loop and wait for the loop thread to finish"""
+        self.running = False
+        self._wakeup()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def close(self):
+        """Release the selector and wakeup pipe; registered ports are left open"""
+        self._selector.close()
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+
+    def _read(self, port, name, handler, error_handler, disconnect_handler, received):
+        try:
+            # A readable port that returns nothing has gone away; pyserial raises for that. With
+            # timeout=0, reading the 1 byte a spurious wakeup asks for doesn't block either.
+            chunk = port.read(port.in_waiting or 1)
+        except Exception as e:
+            self.unregister(name)
+            if disconnect_handler:
+                disconnect_handler(e)
+            return
+
+        try:
+            handler(chunk, received)
+        except Exception as e:
+            if error_handler:
+                error_handler(e)
+
+    def _wakeup(self):
+        try:
+            os.write(self._wakeup_write, b'\0')
+        except OSError:
+            pass  # Pipe full means a wakeup is already pending
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Low-overhead latency histograms
+
+Stages are timed with time.perf_counter_ns() stamps. Recording a sample appends it to a
+short list, which is folded into an HDR-style log-linear histogram (fixed relative
+precision, constant memory) every FOLD_BATCH_SIZE samples and when a snapshot is taken,
+so recording can stay on in production.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+# Values below 2**SUB_BUCKET_BITS ns get a bucket each; above that every power of two is
+# split into 2**(SUB_BUCKET_BITS - 1) buckets, i.e. about 3% relative precision.
+SUB_BUCKET_BITS = 6
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+FOLD_BATCH_SIZE = 64  # Samples held before they are folded into the buckets
+
+LatencySnapshot = namedtuple('LatencySnapshot', ['count', 'p50_us', 'p99_us', 'max_us', 'dropped'])
+
+
+def bucket_index(value):
+    """Histogram bucket for a value in ns"""
+    if value < SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + (value >> shift) - SUB_BUCKET_HALF
+
+
+def bucket_value(index):
+    """Highest value in ns that falls in a bucket"""
+    if index < SUB_BUCKET_COUNT:
+        return index
+    shift, sub = divmod(index - SUB_BUCKET_COUNT, SUB_BUCKET_HALF)
+    shift += 1
+    return ((sub + SUB_BUCKET_HALF + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Log-linear histogram of latencies in ns"""
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.max = 0
+        self.dropped = 0  # Negative samples (stamped with a start in the future), left out
+        self._pending = []  # Under FOLD_BATCH_SIZE samples not yet in the buckets
+        self._lock = threading.Lock()
+
+    def record(self, value):
+        """Record one latency in ns; safe to call from any thread"""
+        with self._lock:
+            pending = self._pending
+            pending.append(value)
+            if len(pending) >= FOLD_BATCH_SIZE:
+                self._fold()
+
+    def fold(self):
+        """Move recorded samples into the histogram buckets"""
+        with self._lock:
+            self._fold()
+
+    def _fold(self):
+        # Called with the lock held
+        pending, self._pending = self._pending, []
+        counts = self.counts
+        folded = 0
+        for value in pending:
+            if value < 0:
+                continue
+            index = bucket_index(value)
+            if index >= len(counts):
+                counts.extend([0] * (index + 1 - len(counts)))
+            counts[index] += 1
+            folded += 1
+        if folded:
+            self.max = max(self.max, max(pending))
+        self.count += folded
+        self.dropped += len(pending) - folded
+
+    def percentile(self, percent):
+        """Latency in ns at or below which percent of samples fall (to bucket precision)"""
+        self.fold()
+        if not self.count:
+            return 0
+        target = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(bucket_value(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        """LatencySnapshot of everything recorded so far"""
+        self.fold()
+        return LatencySnapshot(self.count, self.percentile(50) / 1e3, self.percentile(99) / 1e3, self.max / 1e3,
+                               self.dropped)
+
+    def reset(self):
+        with self._lock:
+            self.counts = []
+            self.count = 0
+            self.max = 0
+            self.dropped = 0
+            self._pending = []
+
+
+class LatencyRecorder:
+    """
+    Named latency histograms, one per pipeline stage
+
+    Usage:
+        start = time.perf_counter_ns()
+        ...
+        recorder.record('stage', start)
+    """
+
+    def __init__(self, stages=()):
+        # Stages listed up front are reported in that order, even before they see samples
+        self.histograms = {stage: LatencyHistogram() for stage in stages}
+        self.enabled = True
+
+    def record(self, stage, start_ns):
+        """Record the time from start_ns (a perf_counter_ns() stamp) until now against stage"""
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms.setdefault(stage, LatencyHistogram())
+        # Same as LatencyHistogram.record, inlined since this runs for every event
+        with histogram._lock:
+            pending = histogram._pending
+            pending.append(time.perf_counter_ns() - start_ns)
+            if len(pending) >= FOLD_BATCH_SIZE:
+                histogram._fold()
+
+    def snapshot(self):
+        """{stage: LatencySnapshot} for every stage"""
+        return {stage: histogram.snapshot() for stage, histogram in list(self.histograms.items())}
+
+    def dump(self):
+        """Print p50/p99/max for every stage that has samples, and how many were dropped"""
+        for stage, snapshot in self.snapshot().items():
+            if snapshot.count or snapshot.dropped:
+                dropped = f"  ({snapshot.dropped} dropped)" if snapshot.dropped else ""
+                print(f"⏱️  {stage:<16} {snapshot.count:>7} samples  p50 {snapshot.p50_us:>9.0f}µs  "
+                      f"p99 {snapshot.p99_us:>9.0f}µs  max {snapshot.max_us:>9.0f}µs{dropped}")
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Non-blocking logging for the serial hot paths
+
+Logging a message only appends (timestamp, level, message, args) to an in-memory queue;
+a background thread wakes every LOG_FLUSH_INTERVAL seconds, formats what queued up,
+folds repeats of the same message together and writes it all out in one go. When the
+queue is full messages are dropped (and counted), so the I/O thread never waits on
+stdout or the journal.
+
+Log with %-style arguments (log.info("Button %d pressed", button_id)) rather than
+f-strings: formatting then happens on the log thread, and repeats are grouped by the
+unformatted message.
+
+Before start_logging() (and after stop_logging()) messages are printed straight away.
+The log thread is process-wide, so only applications start and stop it (sound/main.py,
+the test scripts); library code such as TeensyHub just logs.
+The stdlib logging module is not used on purpose: creating a LogRecord costs more than
+everything else a button press does on the I/O thread.
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+
+from .config import LOG_LEVEL, LOG_QUEUE_SIZE, LOG_REPEAT_WINDOW, LOG_REPEAT_LIMIT
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+
+LOG_FLUSH_INTERVAL = 0.05  # Seconds between log thread wakeups
+
+
+def level_number(level):
+    """Level as a number, from a name ("INFO") or a number"""
+    return LEVELS[level.upper()] if isinstance(level, str) else level
+
+
+class _LogState:
+    """Settings shared by every logger"""
+
+    def __init__(self):
+        self.level = level_number(LOG_LEVEL)
+        self.pending = deque()
+        self.dropped = 0
+        self.writer = None  # LogWriter while start_logging() is in effect
+
+
+_state = _LogState()
+_lock = threading.Lock()
+
+
+class Logger:
+    """Named logger; debug/info/warning/error take a %-style message and its arguments"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def log(self, level, msg, *args):
+        if level < _state.level:
+            return
+        if _state.writer is None:
+            print(format_message(time.time(), msg, args))
+            return
+        pending = _state.pending
+        if len(pending) < LOG_QUEUE_SIZE:
+            pending.append((time.time(), level, self.name, msg, args))
+        else:
+            _state.dropped += 1
+
+    def debug(self, msg, *args):
+        self.log(DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(INFO, msg, *args)
+
+    def warning(self, msg, *args):
+        self.log(WARNING, msg, *args)
+
+    def error(self, msg, *args):
+        self.log(ERROR, msg, *args)
+
+
+_loggers = {}
+
+
+def get_logger(name):
+    """Logger for a part of the system, e.g. get_logger("teensy")"""
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers.setdefault(name, Logger(name))
+    return logger
+
+
+def format_message(created, msg, args):
+    """Timestamped line for a message, in the [HH:MM:SS] style used everywhere else"""
+    if args:
+        try:
+            msg = msg % args
+        except (TypeError, ValueError) as e:
+            msg = f"{msg} {args!r} (bad log arguments: {e})"
+    return f"[{time.strftime('%H:%M:%S', time.localtime(created))}] {msg}"
+
+
+class LogWriter:
+    """
+    Background thread that writes queued messages, at most limit per message per window
+
+    Messages are grouped by logger and unformatted message. Once a group's window is
+    over, the repeats that were held back are reported as one line.
+    """
+
+    def __init__(self, stream=None, window=LOG_REPEAT_WINDOW, limit=LOG_REPEAT_LIMIT,
+                 interval=LOG_FLUSH_INTERVAL):
+        self.stream = stream or sys.stdout
+        self.window = window
+        self.limit = limit
+        self.interval = interval
+        self._groups = {}  # (logger name, msg) -> [window start, count, suppressed, last entry]
+        self._stop = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Write out everything queued and stop the thread"""
+        self._stop.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.flush(final=True)
+
+    def flush(self, final=False):
+        """Write every queued message; with final, also summarise all held back repeats"""
+        pending = _state.pending
+        lines = []
+        while pending:
+            created, level, name, msg, args = pending.popleft()
+            self._report_expired(created, lines)
+
+            key = (name, msg)
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = [created, 0, 0, None]
+            group[1] += 1
+            if group[1] <= self.limit:
+                lines.append(format_message(created, msg, args))
+            else:
+                group[2] += 1
+                group[3] = (created, msg, args)
+
+        self._report_expired(None if final else time.time(), lines)
+        if lines:
+            try:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+            except (OSError, ValueError):
+                pass  # Nowhere left to log to
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def _report_expired(self, now, lines):
+        """Summarise and forget groups whose window ended before now (all of them if None)"""
+        for key, (start, count, suppressed, last) in list(self._groups.items()):
+            if now is not None and now - start < self.window:
+                continue
+            del self._groups[key]
+            if suppressed:
+                created, msg, args = last
+                lines.append(format_message(created, f"{msg} (and %d more like it)", args + (suppressed,)))
+
+
+def start_logging(level=None, stream=None):
+    """
+    Start the log thread; from now on messages are queued instead of printed
+
+    Safe to call more than once; later calls only change the level.
+
+    Args:
+        level: Level name or number; None keeps the current one (LOG_LEVEL from config to begin with)
+        stream: Where to write (default sys.stdout)
+    """
+    if level is not None:
+        _state.level = level_number(level)
+    with _lock:
+        if _state.writer is None:
+            _state.writer = LogWriter(stream)
+            _state.writer.start()
+
+
+def stop_logging():
+    """Write out everything queued, stop the log thread and report dropped messages"""
+    with _lock:
+        writer, _state.writer = _state.writer, None
+        if writer is None:
+            return
+        writer.stop()
+        if _state.dropped:
+            print(f"⚠️  {_state.dropped} log messages dropped, log queue full")
+            _state.dropped = 0
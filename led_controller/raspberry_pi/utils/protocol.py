@@ -7,17 +7,40 @@ communication between Raspberry Pi and Teensy devices.
 """
 
 import struct
+from collections import namedtuple
+from functools import lru_cache
 from .config import (
     CMD_LED_PULSE,
+    CMD_LED_PULSE_AT,
     CMD_LED_EFFECT,
+    CMD_LED_BATCH,
+    CMD_HELLO,
     CMD_BUTTON_PRESS,
     CMD_BUTTON_LED,
     CMD_SENSOR_DATA,
     CMD_HEARTBEAT,
     NUM_STRIPS_PER_TEENSY,
+    WIRE_FORMAT_LEGACY,
+    WIRE_FORMAT_V2,
+    WIRE_FORMAT_V2_CRC8,
+    FRAME_SYNC,
 )
 
 
+# The wire layout is fixed, so compile it once instead of re-parsing the format string on every pack.
+PACKET_STRUCT = struct.Struct('BB32sB')
+PACKET_SIZE = PACKET_STRUCT.size  # 1 + 1 + 32 + 1
+PACKET_DATA_SIZE = 32
+
+# V2 frames: [FRAME_SYNC, length, command, data..., checksum], length counts command + data
+V2_OVERHEAD = 4  # sync, length, command, checksum
+MAX_V2_LENGTH = 1 + PACKET_DATA_SIZE
+
+WIRE_FORMAT_NAMES = {WIRE_FORMAT_LEGACY: "legacy", WIRE_FORMAT_V2: "v2", WIRE_FORMAT_V2_CRC8: "v2 + CRC-8"}
+CRC8_POLYNOMIAL = 0x07
+_ZERO_PADDING = bytes(PACKET_DATA_SIZE)
+
+
 class CommandPacket:
     """
     Binary command packet for Teensy communication
@@ -29,43 +52,61 @@ class CommandPacket:
     - data (32 bytes): Command data (padded with zeros)
     - checksum (1 byte): XOR checksum
     """
+
+    __slots__ = ('command', 'data_length', 'data', 'checksum')
     
     def __init__(self, command=0, data_length=0, data=None, checksum=0):
         self.command = command
         self.data_length = data_length
-        self.data = data if data is not None else [0] * 32
+        # Always backed by a zero-padded 32 byte buffer, so packing never has to copy or pad it.
+        if data is None:
+            self.data = bytearray(PACKET_DATA_SIZE)
+        else:
+            self.data = bytearray(data[:PACKET_DATA_SIZE])
+            if len(self.data) < PACKET_DATA_SIZE:
+                self.data += _ZERO_PADDING[len(self.data):]
         self.checksum = checksum
     
     def calculate_checksum(self):
         """Calculate XOR checksum for the packet"""
-        checksum = 0
-        checksum ^= self.command
-        checksum ^= self.data_length
-        for i in range(self.data_length):
-            checksum ^= self.data[i]
+        checksum = self.command ^ self.data_length
+        for byte in self.data[:self.data_length]:
+            checksum ^= byte
         return checksum
     
     def to_bytes(self):
         """Convert packet to bytes for transmission"""
         self.checksum = self.calculate_checksum()
-        packet_bytes = struct.pack('BB32sB', 
-                                 self.command, 
-                                 self.data_length, 
-                                 bytes(self.data), 
-                                 self.checksum)
-        return packet_bytes
+        return PACKET_STRUCT.pack(self.command, self.data_length, self.data, self.checksum)
+
+    def pack_into(self, buffer, offset=0):
+        """Pack the packet into an existing writable buffer (e.g. a reused bytearray) at offset"""
+        self.checksum = self.calculate_checksum()
+        PACKET_STRUCT.pack_into(buffer, offset, self.command, self.data_length, self.data, self.checksum)
+        return PACKET_SIZE
+
+    def to_v2_bytes(self, wire_format=WIRE_FORMAT_V2):
+        """
+        Convert packet to a variable-length v2 frame; only data_length bytes of data are sent
+
+        wire_format picks the frame's checksum: XOR for WIRE_FORMAT_V2, CRC-8 for WIRE_FORMAT_V2_CRC8
+        """
+        return encode_v2_frame(self.command, self.data[:self.data_length], wire_format)
     
     @classmethod
     def from_bytes(cls, packet_bytes):
         """Create CommandPacket from received bytes"""
-        if len(packet_bytes) != 35:  # 1 + 1 + 32 + 1
+        if len(packet_bytes) != PACKET_SIZE:
             raise ValueError(f"Invalid packet length: {len(packet_bytes)}")
         
-        command, data_length, data_bytes, checksum = struct.unpack('BB32sB', packet_bytes)
-        data = list(data_bytes[:data_length])
-        
-        packet = cls(command, data_length, data, checksum)
-        
+        command, data_length, data_bytes, checksum = PACKET_STRUCT.unpack(packet_bytes)
+        # data_bytes is already the full 32 bytes, so skip __init__'s pad-and-copy
+        packet = cls.__new__(cls)
+        packet.command = command
+        packet.data_length = data_length
+        packet.data = bytearray(data_bytes)
+        packet.checksum = checksum
+
         # Verify checksum
         expected_checksum = packet.calculate_checksum()
         if checksum != expected_checksum:
@@ -75,7 +116,152 @@ class CommandPacket:
     
     def __str__(self):
         """String representation for debugging"""
-        return f"CommandPacket(cmd=0x{self.command:02x}, len={self.data_length}, data={self.data[:self.data_length]})"
+        return f"CommandPacket(cmd=0x{self.command:02x}, len={self.data_length}, data={list(self.data[:self.data_length])})"
+
+def calculate_v2_checksum(frame, start, end):
+    """XOR of frame[start:end], i.e. the length, command and data bytes of a v2 frame"""
+    checksum = 0
+    for byte in frame[start:end]:
+        checksum ^= byte
+    return checksum
+
+def _build_crc8_table(polynomial=CRC8_POLYNOMIAL):
+    table = bytearray(256)
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ polynomial if crc & 0x80 else crc << 1) & 0xFF
+        table[byte] = crc
+    return bytes(table)
+
+# CRC of every single byte value, so checking a frame is one lookup per byte (same table as communication.cpp)
+CRC8_TABLE = _build_crc8_table()
+
+def calculate_crc8(frame, start, end):
+    """CRC-8 (polynomial 0x07, initial value 0) of frame[start:end]"""
+    crc = 0
+    table = CRC8_TABLE
+    for byte in frame[start:end]:
+        crc = table[crc ^ byte]
+    return crc
+
+# Checksum function for each v2 wire format
+V2_CHECKSUMS = {WIRE_FORMAT_V2: calculate_v2_checksum, WIRE_FORMAT_V2_CRC8: calculate_crc8}
+
+def encode_v2_frame(command, data, wire_format=WIRE_FORMAT_V2):
+    """Encode a (command, data) pair as a v2 frame, with the checksum wire_format calls for"""
+    if len(data) > PACKET_DATA_SIZE:
+        raise ValueError(f"Data too long for one frame: {len(data)} bytes, max is {PACKET_DATA_SIZE}")
+    frame = bytearray((FRAME_SYNC, len(data) + 1, command))
+    frame += data
+    frame.append(V2_CHECKSUMS[wire_format](frame, 1, len(frame)))
+    return bytes(frame)
+
+def frame_size(data_length, wire_format=WIRE_FORMAT_LEGACY):
+    """Bytes on the wire for one command carrying data_length bytes of data"""
+    if wire_format >= WIRE_FORMAT_V2:
+        return V2_OVERHEAD + data_length
+    return PACKET_SIZE
+
+def create_hello_packet(max_version=WIRE_FORMAT_V2_CRC8, capabilities=0):
+    """Create the handshake packet the Pi sends (always in legacy format) after opening a port"""
+    return CommandPacket(CMD_HELLO, 2, [max_version, capabilities])
+
+# Binary button events from Teensy A (CMD_BUTTON_PRESS data, big-endian):
+# button number (1-based), pressed (1) / released (0), firmware millis, bitmap of pressed buttons
+BUTTON_EVENT_STRUCT = struct.Struct('>BBIH')
+ButtonEvent = namedtuple('ButtonEvent', ['button_id', 'pressed', 'timestamp_ms', 'pressed_bitmap'])
+
+def decode_button_event(packet):
+    """Decode the data of a CMD_BUTTON_PRESS packet into a ButtonEvent"""
+    return ButtonEvent._make(BUTTON_EVENT_STRUCT.unpack_from(packet.data))
+
+def create_button_event_packet(button_id, pressed, timestamp_ms, pressed_bitmap):
+    """Create a binary button event packet, as sent by Teensy A"""
+    data = BUTTON_EVENT_STRUCT.pack(button_id, int(pressed), timestamp_ms & 0xFFFFFFFF, pressed_bitmap)
+    return CommandPacket(CMD_BUTTON_PRESS, len(data), data)
+
+# Array helpers for encoding/validating many packets at once (replays, load tests, bulk uploads).
+# NumPy is an optional dependency (the "arrays" extra), only imported when one of these is used.
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("Packet arrays need NumPy, which is optional: "
+                          "pip install numpy, or install this package with the [arrays] extra") from e
+    return numpy
+
+@lru_cache(maxsize=None)
+def get_packet_dtype():
+    """NumPy structured dtype with the same 35 byte 'BB32sB' layout as a CommandPacket"""
+    np = _numpy()
+    return np.dtype([
+        ('command', np.uint8),
+        ('data_length', np.uint8),
+        ('data', np.uint8, (PACKET_DATA_SIZE,)),
+        ('checksum', np.uint8),
+    ])
+
+def create_packet_array(commands):
+    """Create a packet array from (command, data) pairs; checksums are filled in by encode_packet_array"""
+    np = _numpy()
+    count = len(commands)
+    packets = np.zeros(count, dtype=get_packet_dtype())
+    if not count:
+        return packets
+    packets['command'] = np.fromiter((command for command, _ in commands), dtype=np.uint8, count=count)
+    lengths = np.fromiter((len(data) for _, data in commands), dtype=np.intp, count=count)
+    if lengths.max() > PACKET_DATA_SIZE:
+        raise ValueError(f"Packet data is limited to {PACKET_DATA_SIZE} bytes, got {lengths.max()}")
+    packets['data_length'] = lengths
+
+    # Scatter every packet's data into its row in one assignment
+    flat = np.frombuffer(b''.join(bytes(data) for _, data in commands), dtype=np.uint8)
+    rows = np.repeat(np.arange(count), lengths)
+    columns = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    packets['data'][rows, columns] = flat
+    return packets
+
+def calculate_packet_array_checksums(packets):
+    """XOR checksum of every packet in the array, computed as one vectorized reduction"""
+    np = _numpy()
+    lengths = packets['data_length']
+    # Only the first data_length bytes of each packet are covered by the checksum
+    in_use = np.arange(PACKET_DATA_SIZE, dtype=np.uint8) < lengths[:, None]
+    data_checksums = np.bitwise_xor.reduce(np.where(in_use, packets['data'], 0), axis=1)
+    return (data_checksums ^ packets['command'] ^ lengths).astype(np.uint8)
+
+def encode_packet_array(packets):
+    """
+    Checksum a packet array in place and return it as one contiguous buffer
+
+    Args:
+        packets: Array with the get_packet_dtype() layout
+
+    Returns:
+        Bytes ready to write, PACKET_SIZE bytes per packet
+    """
+    packets['checksum'] = calculate_packet_array_checksums(packets)
+    return packets.tobytes()
+
+def decode_packet_array(buffer):
+    """
+    Decode and validate a buffer of back-to-back packets in one call
+
+    Args:
+        buffer: Bytes-like object whose length is a multiple of PACKET_SIZE
+
+    Returns:
+        (packets, bad) where packets is a read-only array view of the buffer and
+        bad is a boolean mask of packets with a bad length or checksum
+    """
+    np = _numpy()
+    if len(buffer) % PACKET_SIZE:
+        raise ValueError(f"Buffer length {len(buffer)} is not a multiple of {PACKET_SIZE}")
+    packets = np.frombuffer(buffer, dtype=get_packet_dtype())
+    bad = (packets['data_length'] > PACKET_DATA_SIZE) | (calculate_packet_array_checksums(packets) != packets['checksum'])
+    return packets, bad
 
 # Safety function to make sure we are always sending strip indices with values [0-7].
 # Committing to this standard this on the raspberry pi allows us to avoid doing post-unpack checks on the Teensy side.
@@ -87,6 +273,153 @@ def create_led_pulse_packet(strip_id):
     """Create a packet to pulse a specific LED strip"""
     return CommandPacket(CMD_LED_PULSE, 1, [get_validated_strip_id(strip_id)])
 
+# There are only NUM_STRIPS_PER_TEENSY distinct pulse packets, so pack them once up front.
+# Sending a pulse is then just a write of one of these immutable frames.
+LED_PULSE_FRAMES = tuple(create_led_pulse_packet(strip).to_bytes() for strip in range(NUM_STRIPS_PER_TEENSY))
+
+def get_led_pulse_frame(strip_id):
+    """Get the prebuilt wire bytes for a pulse on the given strip"""
+    return LED_PULSE_FRAMES[get_validated_strip_id(strip_id)]
+
+# (command, data) pairs for pulses, shared so queueing a pulse doesn't allocate
+LED_PULSE_COMMANDS = tuple((CMD_LED_PULSE, bytes([strip])) for strip in range(NUM_STRIPS_PER_TEENSY))
+
+def get_led_pulse_command(strip_id):
+    """Get the (command, data) pair for a pulse on the given strip"""
+    return LED_PULSE_COMMANDS[get_validated_strip_id(strip_id)]
+
+def get_led_pulse_at_command(strip_id, device_ms):
+    """Get the (command, data) pair for a pulse starting at device_ms on the Teensy's millis() clock"""
+    return CMD_LED_PULSE_AT, bytes([get_validated_strip_id(strip_id)]) + (device_ms & 0xFFFFFFFF).to_bytes(4, 'big')
+
+# Prebuilt frames for fixed (command, data) pairs in each wire format, looked up before encoding anything
+_FRAME_CACHES = {
+    WIRE_FORMAT_LEGACY: dict(zip(LED_PULSE_COMMANDS, LED_PULSE_FRAMES)),
+    WIRE_FORMAT_V2: {command: encode_v2_frame(*command) for command in LED_PULSE_COMMANDS},
+    WIRE_FORMAT_V2_CRC8: {command: encode_v2_frame(*command, WIRE_FORMAT_V2_CRC8) for command in LED_PULSE_COMMANDS},
+}
+
+def encode_command(command, data, wire_format=WIRE_FORMAT_LEGACY):
+    """Encode a single (command, data) pair to wire bytes, using a prebuilt frame when there is one"""
+    frame = _FRAME_CACHES[wire_format].get((command, data))
+    if frame is None:
+        if wire_format >= WIRE_FORMAT_V2:
+            frame = encode_v2_frame(command, data, wire_format)
+        else:
+            frame = CommandPacket(command, len(data), data).to_bytes()
+    return frame
+
+# Batch packets carry [command, data_length, data...] entries back to back, i.e. CommandPackets
+# without their padding and checksum. The batch packet's own checksum covers all of them.
+BATCH_ENTRY_HEADER_SIZE = 2
+MAX_BATCH_ENTRY_DATA = PACKET_DATA_SIZE - BATCH_ENTRY_HEADER_SIZE
+
+def create_batch_packet(commands):
+    """Create a packet carrying several (command, data) entries; they must all fit in one packet"""
+    data = bytearray()
+    for command, entry_data in commands:
+        data.append(command)
+        data.append(len(entry_data))
+        data += entry_data
+    if len(data) > PACKET_DATA_SIZE:
+        raise ValueError(f"Batch of {len(commands)} commands needs {len(data)} bytes, max is {PACKET_DATA_SIZE}")
+    return CommandPacket(CMD_LED_BATCH, len(data), data)
+
+def encode_command_burst(commands, wire_format=WIRE_FORMAT_LEGACY):
+    """
+    Encode a list of (command, data) pairs into as few frames as possible
+
+    Commands are packed in order into CMD_LED_BATCH packets; a batch that would only hold one
+    command is sent as that command's own (possibly prebuilt) frame instead, so single commands
+    stay readable by firmware without batch support.
+
+    Args:
+        commands: (command, data) pairs, in send order
+        wire_format: WIRE_FORMAT_LEGACY, WIRE_FORMAT_V2 or WIRE_FORMAT_V2_CRC8, as negotiated with the Teensy
+
+    Returns:
+        Bytes ready for a single write()
+    """
+    frames = []
+    batch = []
+    batch_size = 0
+
+    def flush():
+        if len(batch) == 1:
+            frames.append(encode_command(*batch[0], wire_format))
+        elif batch:
+            packet = create_batch_packet(batch)
+            frames.append(packet.to_v2_bytes(wire_format) if wire_format >= WIRE_FORMAT_V2 else packet.to_bytes())
+        batch.clear()
+
+    for command, data in commands:
+        entry_size = BATCH_ENTRY_HEADER_SIZE + len(data)
+        if len(data) > MAX_BATCH_ENTRY_DATA:
+            flush()
+            batch_size = 0
+            frames.append(encode_command(command, data, wire_format))
+            continue
+        if batch_size + entry_size > PACKET_DATA_SIZE:
+            flush()
+            batch_size = 0
+        batch.append((command, data))
+        batch_size += entry_size
+    flush()
+    return b''.join(frames)
+
+class BurstSize:
+    """
+    Running size of encode_command_burst() over commands added one at a time
+
+    Follows the same packing rules without encoding anything, so checking whether one
+    more command still fits a write is O(1) rather than a re-encode of everything so far.
+    """
+
+    __slots__ = ('wire_format', '_closed', '_entries', '_batch_data', '_first_data')
+
+    def __init__(self, wire_format=WIRE_FORMAT_LEGACY):
+        self.wire_format = wire_format
+        self._closed = 0  # Bytes of frames already complete
+        self._entries = 0  # Commands in the open batch
+        self._batch_data = 0  # Data bytes of the open batch
+        self._first_data = 0  # Data length of its first command, sent alone if it stays alone
+
+    @property
+    def size(self):
+        """Bytes encode_command_burst() would return for the commands added so far"""
+        return self._closed + self._open_size(self._entries, self._batch_data, self._first_data)
+
+    def size_with(self, data_length):
+        """Bytes it would return with one more command carrying data_length bytes"""
+        closed, entries, batch_data, first_data = self._after(data_length)
+        return closed + self._open_size(entries, batch_data, first_data)
+
+    def add(self, data_length):
+        """Count one more command carrying data_length bytes"""
+        self._closed, self._entries, self._batch_data, self._first_data = self._after(data_length)
+
+    def add_frame(self, length):
+        """Count an already encoded frame of length bytes, which ends the open batch"""
+        self._closed += self._open_size(self._entries, self._batch_data, self._first_data) + length
+        self._entries = self._batch_data = self._first_data = 0
+
+    def _after(self, data_length):
+        closed, entries, batch_data = self._closed, self._entries, self._batch_data
+        if data_length > MAX_BATCH_ENTRY_DATA:
+            # Sent as its own frame, after whatever batch was open
+            closed += self._open_size(entries, batch_data, self._first_data) + frame_size(data_length, self.wire_format)
+            return closed, 0, 0, 0
+        entry_size = BATCH_ENTRY_HEADER_SIZE + data_length
+        if batch_data + entry_size > PACKET_DATA_SIZE:
+            closed += self._open_size(entries, batch_data, self._first_data)
+            return closed, 1, entry_size, data_length
+        return closed, entries + 1, batch_data + entry_size, self._first_data if entries else data_length
+
+    def _open_size(self, entries, batch_data, first_data):
+        if not entries:
+            return 0
+        return frame_size(first_data if entries == 1 else batch_data, self.wire_format)
+
 def create_led_effect_packet(strip_id, effect_type, *params):
     """Create a packet for LED effects"""
     data = [get_validated_strip_id(strip_id), effect_type] + list(params)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Pi-side model of an LED Teensy's pulse slots
+
+The firmware draws at most MAX_ACTIVE_PULSES pulses at once. Each pulse holds a slot
+from when it arrives until PULSE_DURATION after it starts, and triggerLedPulse()
+silently ignores a pulse when every slot is busy. Because the Pi knows when it sent each
+pulse and when it was scheduled to start, it can track the same occupancy and avoid
+sending pulses that would never be drawn. A pulse the writer drops instead of sending
+(queue full, deadline passed, Teensy gone) hands its slot back with release().
+"""
+
+import heapq
+import threading
+
+from .config import MAX_ACTIVE_PULSES, PULSE_DURATION, PULSE_SLOT_MARGIN, PULSE_MERGE_WINDOW
+
+
+class PulseSlots:
+    """
+    Slot occupancy of one LED Teensy, as far as the Pi can tell
+
+    A pulse on a strip that already has one starting within merge_window is merged into
+    it (the two would light the same pixels); a pulse that finds every slot busy is
+    discarded. Either way it is never sent.
+
+    admit() runs on the thread handling button presses and release() on writer threads,
+    so both take a lock. Held slots are indexed by strip and start time, so release()
+    doesn't search them.
+    """
+
+    def __init__(self, slots=MAX_ACTIVE_PULSES, duration=PULSE_DURATION, margin=PULSE_SLOT_MARGIN,
+                 merge_window=PULSE_MERGE_WINDOW):
+        self.slots = slots
+        self._hold_ns = int((duration + margin) * 1e9)
+        self._merge_window_ns = int(merge_window * 1e9)
+        # heap of (release time, strip, start time) in perf_counter_ns; a released pulse's
+        # entry stays until its time comes, and is skipped then
+        self._releases = []
+        self._held = {}  # strip -> {start time: pulses} of every pulse holding a slot
+        self._busy = 0  # Slots held
+        self._latest_start = {}  # strip -> start time of its latest admitted pulse
+        self._lock = threading.Lock()
+
+        # Counters
+        self.admitted = 0
+        self.merged = 0
+        self.discarded = 0
+        self.released = 0  # Admitted, then dropped by the writer instead of being sent
+
+    def admit(self, strip, start_ns, now_ns):
+        """
+        Decide whether a pulse is worth sending, and take a slot for it if so
+
+        Args:
+            strip: The Teensy's local strip
+            start_ns: perf_counter_ns() at which the Teensy will start the pulse
+            now_ns: perf_counter_ns() now
+
+        Returns:
+            True if the pulse should be sent
+        """
+        with self._lock:
+            releases = self._releases
+            while releases and releases[0][0] <= now_ns:
+                _, released_strip, started_ns = heapq.heappop(releases)
+                self._free(released_strip, started_ns)
+
+            latest = self._latest_start.get(strip)
+            if latest is not None and abs(start_ns - latest) <= self._merge_window_ns:
+                self.merged += 1
+                return False
+            if self._busy >= self.slots:
+                self.discarded += 1
+                return False
+
+            heapq.heappush(releases, (start_ns + self._hold_ns, strip, start_ns))
+            starts = self._held.setdefault(strip, {})
+            starts[start_ns] = starts.get(start_ns, 0) + 1
+            self._busy += 1
+            self._latest_start[strip] = start_ns
+            self.admitted += 1
+            return True
+
+    def release(self, strip, start_ns):
+        """
+        Give back the slot of an admitted pulse that was never sent
+
+        Args:
+            strip, start_ns: As passed to admit()
+        """
+        with self._lock:
+            # Nothing to give back if its slot had already freed up
+            if self._free(strip, start_ns):
+                self.released += 1
+
+    def reset(self):
+        """Forget every held slot, for a Teensy that disconnected or came back (and may have rebooted)"""
+        with self._lock:
+            self._releases = []
+            self._held = {}
+            self._busy = 0
+            self._latest_start = {}
+
+    def active(self, now_ns):
+        """Slots still busy at now_ns"""
+        with self._lock:
+            return sum(count for starts in self._held.values() for start_ns, count in starts.items()
+                       if start_ns + self._hold_ns > now_ns)
+
+    def _free(self, strip, start_ns):
+        """Give back one slot held by a pulse, with the lock held; False if none was"""
+        starts = self._held.get(strip)
+        if not starts or start_ns not in starts:
+            return False
+        starts[start_ns] -= 1
+        if not starts[start_ns]:
+            del starts[start_ns]
+        self._busy -= 1
+
+        if self._latest_start.get(strip) == start_ns and start_ns not in starts:
+            # Merge with whatever this strip still has coming, if anything
+            if starts:
+                self._latest_start[strip] = max(starts)
+            else:
+                del self._latest_start[strip]
+        if not starts:
+            del self._held[strip]
+        return True
+
+    def shed(self):
+        """Pulses that were never sent, whether the model or the writer decided so"""
+        return self.merged + self.discarded + self.released
+
+    def stats(self):
+        """Snapshot of the counters"""
+        return {
+            'admitted': self.admitted,
+            'merged': self.merged,
+            'discarded': self.discarded,
+            'released': self.released,
+        }
+
+    def __str__(self):
+        return (f"{self.admitted - self.released} pulses sent, {self.merged} merged, "
+                f"{self.discarded} discarded (all {self.slots} slots busy), {self.released} dropped by the writer")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Sequence numbers, acks and retransmission for commands to one Teensy
+
+With firmware that reports CAP_SEQUENCED, commands go out wrapped as
+    CMD_SEQUENCED [seq, command, data...]
+and the Teensy answers every read loop that saw any with one
+    CMD_ACK [latest seq, bitmap (big-endian): bit i set = seq latest - 1 - i received]
+so one ack covers up to 17 commands and a lost ack is repaired by the next one.
+
+Up to `window` commands are in flight at once. A command that isn't acked within the
+retransmission timeout (RFC 6298 style, from measured round trips) is resent if it was
+marked reliable, up to max_retries times, and otherwise counted as lost. The Teensy
+ignores repeats of a sequence number it has already handled, so a retransmit whose
+original did arrive (only the ack was lost) isn't applied twice.
+"""
+
+from .config import CMD_SEQUENCED, SEQUENCED_WINDOW, SEQUENCED_MAX_RETRIES
+from .protocol import PACKET_DATA_SIZE
+
+SEQUENCED_HEADER_SIZE = 2  # seq, command
+MAX_SEQUENCED_DATA = PACKET_DATA_SIZE - SEQUENCED_HEADER_SIZE  # Longer commands are sent unsequenced
+ACK_HISTORY_BITS = 16
+
+INITIAL_RTO_NS = 100_000_000
+MIN_RTO_NS = 20_000_000
+MAX_RTO_NS = 1_000_000_000
+
+
+def acked_sequences(ack_data):
+    """Sequence numbers covered by the data of a CMD_ACK"""
+    latest = ack_data[0]
+    history = (ack_data[1] << 8) | ack_data[2] if len(ack_data) >= 3 else 0
+    acked = [latest]
+    for i in range(ACK_HISTORY_BITS):
+        if history & (1 << i):
+            acked.append((latest - 1 - i) & 0xFF)
+    return acked
+
+
+class SequencedLink:
+    """
+    Send window and round trip statistics for one Teensy
+
+    Not thread-safe on its own: the owning DeviceWriter only calls it with its lock held.
+    """
+
+    def __init__(self, window=SEQUENCED_WINDOW, max_retries=SEQUENCED_MAX_RETRIES, latency=None,
+                 latency_stage='link_rtt'):
+        self.window = window
+        self.max_retries = max_retries
+        # Optional LatencyRecorder; every round trip sample is recorded under latency_stage
+        self.latency = latency
+        self.latency_stage = latency_stage
+        self._next_seq = 0
+        self._in_flight = {}  # seq -> [command, data, reliable, last sent ns, transmissions]
+
+        # Retransmission timeout from smoothed round trips (RFC 6298)
+        self.srtt_ns = None
+        self.rttvar_ns = 0
+        self.rto_ns = INITIAL_RTO_NS
+        self.min_rtt_ns = None
+        self.max_rtt_ns = 0
+
+        # Counters
+        self.sent = 0  # Distinct sequenced commands
+        self.acked = 0
+        self.retransmits = 0
+        self.lost = 0  # Unreliable commands never acked
+        self.failed = 0  # Reliable commands still unacked after max_retries
+        self.stray_acks = 0  # Acks for nothing in flight (late or duplicate)
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    def window_free(self):
+        return self.window - len(self._in_flight)
+
+    def wrap(self, command, data, reliable, now_ns):
+        """
+        Give a command the next sequence number and start tracking it
+
+        Returns:
+            The (CMD_SEQUENCED, data) pair to send in its place
+        """
+        seq = self._next_seq
+        self._next_seq = (seq + 1) & 0xFF
+        self._in_flight[seq] = [command, data, reliable, now_ns, 1]
+        self.sent += 1
+        return CMD_SEQUENCED, bytes((seq, command)) + data
+
+    def acknowledge(self, ack_data, now_ns):
+        """Handle a CMD_ACK; returns how many in-flight commands it settled"""
+        settled = 0
+        for seq in acked_sequences(ack_data):
+            entry = self._in_flight.pop(seq, None)
+            if entry is None:
+                continue
+            settled += 1
+            self.acked += 1
+            if entry[4] == 1:
+                # Karn: only commands sent once give an unambiguous round trip
+                self._sample_rtt(now_ns - entry[3], entry[3])
+        if not settled:
+            self.stray_acks += 1
+        return settled
+
+    def due(self, now_ns):
+        """
+        Deal with commands whose ack is overdue
+
+        Returns:
+            (CMD_SEQUENCED, data) pairs to resend now
+        """
+        resend = []
+        for seq, entry in list(self._in_flight.items()):
+            command, data, reliable, sent_ns, transmissions = entry
+            if now_ns - sent_ns < self.rto_ns:
+                continue
+            if not reliable:
+                del self._in_flight[seq]
+                self.lost += 1
+            elif transmissions > self.max_retries:
+                del self._in_flight[seq]
+                self.failed += 1
+            else:
+                entry[3] = now_ns
+                entry[4] += 1
+                self.retransmits += 1
+                resend.append((CMD_SEQUENCED, bytes((seq, command)) + data))
+        if resend:
+            # Back off while acks aren't coming back
+            self.rto_ns = min(self.rto_ns * 2, MAX_RTO_NS)
+        return resend
+
+    def next_deadline_ns(self):
+        """perf_counter_ns() by which due() has something to do, or None if nothing is in flight"""
+        if not self._in_flight:
+            return None
+        return min(entry[3] for entry in self._in_flight.values()) + self.rto_ns
+
+    def loss_rate(self):
+        """Fraction of settled commands that needed a retransmit or never made it"""
+        settled = self.acked + self.lost + self.failed
+        return (self.retransmits + self.lost + self.failed) / settled if settled else 0.0
+
+    def stats(self):
+        """Snapshot of the counters and round trip estimates (times in ms)"""
+        return {
+            'sent': self.sent,
+            'acked': self.acked,
+            'in_flight': self.in_flight,
+            'retransmits': self.retransmits,
+            'lost': self.lost,
+            'failed': self.failed,
+            'stray_acks': self.stray_acks,
+            'loss_rate': self.loss_rate(),
+            'srtt_ms': self.srtt_ns / 1e6 if self.srtt_ns is not None else None,
+            'min_rtt_ms': self.min_rtt_ns / 1e6 if self.min_rtt_ns is not None else None,
+            'max_rtt_ms': self.max_rtt_ns / 1e6,
+            'rto_ms': self.rto_ns / 1e6,
+        }
+
+    def __str__(self):
+        srtt = f"{self.srtt_ns / 1e6:.2f}ms" if self.srtt_ns is not None else "-"
+        return (f"{self.sent} sequenced, {self.acked} acked, {self.retransmits} retransmits, "
+                f"{self.lost} lost, {self.failed} failed, srtt {srtt}, rto {self.rto_ns / 1e6:.0f}ms")
+
+    def _sample_rtt(self, rtt_ns, sent_ns):
+        if self.latency is not None:
+            self.latency.record(self.latency_stage, sent_ns)
+        self.min_rtt_ns = rtt_ns if self.min_rtt_ns is None else min(self.min_rtt_ns, rtt_ns)
+        self.max_rtt_ns = max(self.max_rtt_ns, rtt_ns)
+        if self.srtt_ns is None:
+            self.srtt_ns = rtt_ns
+            self.rttvar_ns = rtt_ns // 2
+        else:
+            self.rttvar_ns = (3 * self.rttvar_ns + abs(self.srtt_ns - rtt_ns)) // 4
+            self.srtt_ns = (7 * self.srtt_ns + rtt_ns) // 8
+        self.rto_ns = max(MIN_RTO_NS, min(MAX_RTO_NS, self.srtt_ns + 4 * self.rttvar_ns))
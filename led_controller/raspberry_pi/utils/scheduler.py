@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+One thread for every timed callback
+
+threading.Timer starts a thread per callback. TimerScheduler keeps the deadlines in a heap
+instead and runs them all from one thread, which sleeps until the earliest one is due.
+Scheduling and cancelling cost O(log n), and nothing runs between deadlines. Cancelled
+calls stay in the heap until they reach the top, where they are dropped without running.
+
+Callbacks run one at a time on the scheduler thread, so they should be short.
+"""
+
+import heapq
+import math
+import threading
+import time
+
+from .log import get_logger
+
+log = get_logger("timers")
+
+
+def next_tick(start, period, at):
+    """
+    First tick of a period started at start that falls at or after at
+
+    For running work on the same beat a periodic timer would, without the timer:
+    ticks are start + period, start + 2 * period, ...
+    """
+    return start + max(1, math.ceil((at - start) / period)) * period
+
+
+class ScheduledCall:
+    """Handle for a callback waiting in a TimerScheduler"""
+
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """Don't run the callback (no effect once it has run)"""
+        self.cancelled = True
+
+
+class TimerScheduler:
+    """
+    Runs callbacks at time.monotonic() deadlines from a single thread
+
+    The thread is started by the first call_at()/call_later().
+    """
+
+    def __init__(self, name="timer-scheduler"):
+        self.name = name
+        self._heap = []  # (deadline, sequence, ScheduledCall)
+        self._sequence = 0  # Keeps calls with equal deadlines in the order they were made
+        self._condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        # Counters
+        self.fired = 0
+        self.cancelled = 0
+        self.max_late = 0.0  # Worst seconds between a deadline and its callback starting
+
+    @property
+    def pending(self):
+        """Calls in the heap, including cancelled ones not yet dropped"""
+        return len(self._heap)
+
+    def call_at(self, deadline, callback, *args):
+        """
+        Run callback(*args) at deadline
+
+        Args:
+            deadline: time.monotonic() to run at; past deadlines run as soon as possible
+
+        Returns:
+            ScheduledCall whose cancel() stops it running
+        """
+        call = ScheduledCall(deadline, callback, args)
+        with self._condition:
+            self._sequence += 1
+            heapq.heappush(self._heap, (deadline, self._sequence, call))
+            if self.thread is None:
+                self.running = True
+                self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+            elif self._heap[0][2] is call:
+                # The thread is sleeping until a later deadline
+                self._condition.notify()
+        return call
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) delay seconds from now (see call_at)"""
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def stop(self):
+        """Stop the thread; calls still waiting never run"""
+        with self._condition:
+            self.running = False
+            self._condition.notify()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def _next_due(self):
+        """Pop the next call once it is due, or None when stopped (with the condition held)"""
+        heap = self._heap
+        while self.running:
+            while heap and heap[0][2].cancelled:
+                heapq.heappop(heap)
+                self.cancelled += 1
+            if not heap:
+                self._condition.wait()
+                continue
+            delay = heap[0][0] - time.monotonic()
+            if delay <= 0:
+                return heapq.heappop(heap)[2]
+            self._condition.wait(delay)
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                call = self._next_due()
+            if call is None:
+                return
+            self.max_late = max(self.max_late, time.monotonic() - call.deadline)
+            self.fired += 1
+            try:
+                call.callback(*call.args)
+            except Exception as e:
+                log.error("❌ Timer callback %r failed: %s", call.callback, e)
+
+    def stats(self):
+        """Snapshot of the counters (max_late_ms in ms)"""
+        return {
+            'pending': self.pending,
+            'fired': self.fired,
+            'cancelled': self.cancelled,
+            'max_late_ms': self.max_late * 1000,
+        }
+
+    def __str__(self):
+        return (f"{self.fired} fired, {self.cancelled} cancelled, {self.pending} pending, "
+                f"at most {self.max_late * 1000:.2f}ms late")
@@ -0,0 +1,578 @@
+#!/usr/bin/env python3
+"""
+Simulated Teensys on pseudo-terminals
+
+Each SimulatedTeensy owns a pty and behaves like the firmware on the other end: it
+answers the CMD_HELLO handshake, reads legacy packets and v2 frames (including
+CMD_LED_BATCH), acks sequenced commands, answers clock sync requests, echoes frame
+commits, sends heartbeats and, for the button Teensy,
+sends button events on demand or on a schedule. Optional baud rate throttling and
+byte corruption make it behave like a real (or a bad) USB serial link.
+
+TeensySimulator starts one per TEENSY_MAPPING entry and makes device detection list
+them by serial number, and plugging or unplugging one sends the udev event a real
+Teensy would, so TeensyHub, the test scripts and the benchmarks run unchanged without
+hardware:
+
+    with TeensySimulator() as sim:
+        hub = TeensyHub()
+        hub.connect()
+        sim['a'].press(3)
+"""
+
+import heapq
+import os
+import random
+import selectors
+import socket
+import threading
+import time
+import tty
+from collections import Counter, namedtuple
+
+from .config import (
+    TEENSY_MAPPING,
+    BUTTON_TEENSY_ID,
+    NUM_STRIPS_PER_TEENSY,
+    MAX_ACTIVE_PULSES,
+    PULSE_DURATION,
+    CMD_LED_PULSE,
+    CMD_LED_PULSE_AT,
+    CMD_LED_BATCH,
+    CMD_LED_FRAME_COMMIT,
+    CMD_HELLO,
+    CMD_SEQUENCED,
+    CMD_ACK,
+    CMD_TIME_SYNC,
+    CMD_LINK_STATS,
+    CMD_HEARTBEAT,
+    WIRE_FORMAT_LEGACY,
+    WIRE_FORMAT_V2,
+    WIRE_FORMAT_V2_CRC8,
+    FRAME_SYNC,
+    CAP_SEQUENCED,
+    CAP_TIME_SYNC,
+)
+from .device_utils import set_port_lister
+from .hotplug import encode_uevent, set_uevent_source
+from .protocol import (
+    PACKET_SIZE,
+    MAX_V2_LENGTH,
+    CommandPacket,
+    V2_CHECKSUMS,
+    WIRE_FORMAT_NAMES,
+    create_button_event_packet,
+    encode_command,
+)
+
+# Looks enough like pyserial's ListPortInfo for device detection
+SimulatedPort = namedtuple('SimulatedPort', ['device', 'description', 'serial_number', 'hwid'])
+
+BITS_PER_BYTE = 10  # 8N1: start + 8 data + stop
+READ_CHUNK = 64  # Bytes read at a time, so throttling paces reads smoothly
+
+
+class SimulatedTeensy:
+    """
+    One fake Teensy on a pty
+
+    Args:
+        teensy_id: "a", "b", ...; the button Teensy sends button events, the rest take LED commands
+        serial_number: Reported to device detection (default from TEENSY_MAPPING)
+        baudrate: Throttle both directions to this line rate; None for as fast as the pty goes
+        error_rate: Chance of each byte, in either direction, having a bit flipped
+        supports_v2: Answer the wire format handshake (False behaves like old firmware)
+        supports_crc: Offer v2 frames with a CRC-8 in the handshake (False behaves like XOR-only firmware)
+        supports_sequencing: Offer CAP_SEQUENCED in the handshake and ack sequenced commands
+        supports_time_sync: Offer CAP_TIME_SYNC and answer clock sync requests
+        clock_skew_ppm: How fast this Teensy's millis() runs compared to the Pi's clock
+        text_events: Send BUTTON_PRESS:n lines instead of binary button events
+        heartbeat_interval: Seconds between heartbeats, None for none
+        seed: Seed for the error injection
+    """
+
+    def __init__(self, teensy_id, serial_number=None, baudrate=None, error_rate=0.0, supports_v2=True,
+                 supports_crc=True, supports_sequencing=True, supports_time_sync=True, clock_skew_ppm=0.0, text_events=False,
+                 heartbeat_interval=1.0, seed=None):
+        self.teensy_id = teensy_id
+        self.serial_number = serial_number or TEENSY_MAPPING.get(teensy_id, f"SIM-{teensy_id}")
+        self.baudrate = baudrate
+        self.error_rate = error_rate
+        self.supports_v2 = supports_v2
+        self.supports_crc = supports_crc
+        self.supports_sequencing = supports_sequencing
+        self.supports_time_sync = supports_time_sync
+        self.clock_rate = 1.0 + clock_skew_ppm / 1e6
+        self.text_events = text_events
+        self.heartbeat_interval = heartbeat_interval
+        self.random = random.Random(seed)
+
+        self.path = None
+        self._master = None
+        self._slave = None
+        self._generation = 0  # Bumped on plug/unplug; fd numbers get reused
+        self._buffer = bytearray()
+        self._write_lock = threading.Lock()
+        self._schedule = []  # heap of (due, sequence, button_id)
+        self._schedule_lock = threading.Lock()
+        self._sequence = 0
+        self._running = False
+        self.thread = None
+        self._started = time.monotonic()
+        self._pressed_bitmap = 0
+        self.on_hotplug = None  # Called with ("add" or "remove", self) by plug() and unplug()
+        self.wire_format = WIRE_FORMAT_LEGACY
+        self._reset_sequencing()
+
+        # What the Pi sent and what was sent back
+        self.commands = Counter()  # command -> count, batches unpacked
+        self.host_capabilities = 0  # Capability bits the Pi offered in its CMD_HELLO
+        self.pulses = [0] * NUM_STRIPS_PER_TEENSY
+        self.pulse_starts = []  # (strip, millis() start time) of every CMD_LED_PULSE_AT
+        self.pulses_dropped = 0  # Arrived with every pulse slot busy, so never drawn
+        self._slot_releases = []  # time.monotonic() each busy pulse slot frees up
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.good_frames = 0
+        self.checksum_errors = 0  # Bad frames
+        self.resyncs = 0
+        self.corrupted_bytes = 0
+        self.presses_sent = 0
+        self.duplicates = 0  # Sequenced commands seen before (their ack was lost)
+        self.batched_link_requests = 0  # Clock sync and stats requests that arrived inside a batch
+
+    @property
+    def connected(self):
+        return self._master is not None
+
+    def start(self):
+        """Create the pty and start answering on it"""
+        self.plug()
+        self._running = True
+        self.thread = threading.Thread(target=self._run, name=f"sim-teensy-{self.teensy_id}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.unplug()
+
+    def plug(self):
+        """Appear on a fresh pty (a new path, like re-enumerating on USB)"""
+        if self._master is not None:
+            return
+        master, slave = os.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+        self._buffer.clear()
+        self.wire_format = WIRE_FORMAT_LEGACY
+        self._reset_sequencing()
+        self.path = os.ttyname(slave)
+        self._slave = slave
+        self._master = master
+        self._generation += 1
+        if self.on_hotplug:
+            self.on_hotplug("add", self)
+
+    def unplug(self):
+        """Disappear: the host's reads and writes start failing"""
+        master, slave = self._master, self._slave
+        self._master = self._slave = None
+        self._generation += 1
+        if master is not None:
+            with self._write_lock:
+                os.close(master)
+            os.close(slave)
+            if self.on_hotplug:
+                self.on_hotplug("remove", self)
+
+    def port_info(self):
+        return SimulatedPort(self.path, f"Simulated Teensy {self.teensy_id.upper()}", self.serial_number,
+                             f"SIM SER={self.serial_number}")
+
+    def press(self, button_id):
+        """Press and release a button right away (button Teensy)"""
+        self._pressed_bitmap |= 1 << (button_id - 1)
+        self._send_button_event(button_id, True)
+        self._pressed_bitmap &= ~(1 << (button_id - 1))
+        self._send_button_event(button_id, False)
+        self.presses_sent += 1
+
+    def schedule_presses(self, presses):
+        """
+        Queue button presses to be sent from the simulator thread
+
+        Args:
+            presses: (seconds from now, button_id) pairs
+        """
+        now = time.monotonic()
+        with self._schedule_lock:
+            for delay, button_id in presses:
+                self._sequence += 1
+                heapq.heappush(self._schedule, (now + delay, self._sequence, button_id))
+
+    def pending_presses(self):
+        return len(self._schedule)
+
+    def send_text(self, line):
+        """Send a line of debug output, like Serial.println()"""
+        self._write(line.encode() + b"\r\n")
+
+    def send_command(self, command, data=b""):
+        """Send a command in the current wire format, like the firmware's sendCommand()"""
+        self._write(encode_command(command, bytes(data), self.wire_format))
+
+    def _send_button_event(self, button_id, pressed):
+        if self.text_events:
+            self.send_text(f"{'BUTTON_PRESS' if pressed else 'BUTTON_RELEASE'}:{button_id}")
+            return
+        packet = create_button_event_packet(button_id, pressed, self._millis(), self._pressed_bitmap)
+        self.send_command(packet.command, packet.data[:packet.data_length])
+
+    def _millis(self):
+        return int((time.monotonic() - self._started) * 1000 * self.clock_rate) & 0xFFFFFFFF
+
+    def millis_to_monotonic(self, device_ms):
+        """time.monotonic() at which this Teensy's millis() reads device_ms"""
+        return self._started + device_ms / 1000 / self.clock_rate
+
+    def _write(self, data):
+        data = self._corrupt(data)
+        with self._write_lock:
+            if self._master is None:
+                return
+            try:
+                os.write(self._master, data)
+            except OSError:
+                return
+            self.bytes_sent += len(data)
+        self._throttle(len(data))
+
+    def _throttle(self, size):
+        if self.baudrate:
+            time.sleep(size * BITS_PER_BYTE / self.baudrate)
+
+    def _corrupt(self, data):
+        if not self.error_rate:
+            return data
+        data = bytearray(data)
+        for i in range(len(data)):
+            if self.random.random() < self.error_rate:
+                data[i] ^= 1 << self.random.randrange(8)
+                self.corrupted_bytes += 1
+        return bytes(data)
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        registered = None
+        registered_generation = None
+        next_heartbeat = time.monotonic()
+        while self._running:
+            if registered_generation != self._generation:
+                registered_generation = self._generation
+                if registered is not None:
+                    try:
+                        selector.unregister(registered)
+                    except (KeyError, ValueError, OSError):
+                        pass
+                registered = self._master
+                if registered is not None:
+                    selector.register(registered, selectors.EVENT_READ)
+            master = registered
+
+            now = time.monotonic()
+            if self.heartbeat_interval and master is not None and now >= next_heartbeat:
+                next_heartbeat = now + self.heartbeat_interval
+                self.send_command(CMD_HEARTBEAT, self._millis().to_bytes(4, 'big'))
+            self._send_due_presses(now)
+
+            timeout = 0.01
+            with self._schedule_lock:
+                if self._schedule:
+                    timeout = max(0, min(timeout, self._schedule[0][0] - now))
+            if registered is None:
+                time.sleep(timeout)
+                continue
+            if not selector.select(timeout):
+                continue
+            try:
+                chunk = os.read(registered, READ_CHUNK)
+            except OSError:
+                # Nobody has the pty open (yet); don't spin on it
+                time.sleep(0.01)
+                continue
+            self.bytes_received += len(chunk)
+            self._throttle(len(chunk))
+            self._feed(self._corrupt(chunk))
+            if self._ack_pending:
+                # Like the firmware: one ack once everything that arrived has been read
+                self._ack_pending = False
+                history = self._seq_history
+                self.send_command(CMD_ACK, bytes((self._last_seq, history >> 8, history & 0xFF)))
+        selector.close()
+
+    def _send_due_presses(self, now):
+        while True:
+            with self._schedule_lock:
+                if not self._schedule or self._schedule[0][0] > now:
+                    return
+                _, _, button_id = heapq.heappop(self._schedule)
+            self.press(button_id)
+
+    def _feed(self, chunk):
+        """Parse commands from the Pi the way the firmware does"""
+        buffer = self._buffer
+        buffer += chunk
+        while buffer:
+            if self.wire_format >= WIRE_FORMAT_V2:
+                if buffer[0] != FRAME_SYNC:
+                    self.resyncs += 1
+                    del buffer[0]
+                    continue
+                if len(buffer) < 2:
+                    return
+                length = buffer[1]
+                if not 1 <= length <= MAX_V2_LENGTH:
+                    self.resyncs += 1
+                    del buffer[0]
+                    continue
+                end = 2 + length + 1
+                if len(buffer) < end:
+                    return
+                if V2_CHECKSUMS[self.wire_format](buffer, 1, end - 1) != buffer[end - 1]:
+                    self.checksum_errors += 1
+                    self.resyncs += 1
+                    self.send_text("Checksum error")
+                    del buffer[0]
+                    continue
+                command, data = buffer[2], bytes(buffer[3:end - 1])
+                del buffer[:end]
+            else:
+                if len(buffer) < PACKET_SIZE:
+                    return
+                raw = bytes(buffer[:PACKET_SIZE])
+                del buffer[:PACKET_SIZE]
+                try:
+                    packet = CommandPacket.from_bytes(raw)
+                except ValueError:
+                    self.checksum_errors += 1
+                    self.send_text("Checksum error")
+                    continue
+                command, data = packet.command, bytes(packet.data[:packet.data_length])
+            self.good_frames += 1
+            self._handle(command, data)
+
+    def _handle(self, command, data):
+        """A command read from the port, dispatched the way receiveCommand() and loopLedStrips() do"""
+        if command == CMD_HELLO:
+            self.commands[command] += 1
+            self.host_capabilities = data[1] if len(data) > 1 else 0
+            if self.supports_v2 and data:
+                # The reply goes out in legacy format, then both sides switch
+                capabilities = ((CAP_SEQUENCED if self.supports_sequencing else 0)
+                                | (CAP_TIME_SYNC if self.supports_time_sync else 0))
+                version = WIRE_FORMAT_V2_CRC8 if self.supports_crc else WIRE_FORMAT_V2
+                self.send_command(CMD_HELLO, bytes([version, capabilities]))
+                self.wire_format = min(data[0], version)
+                self._reset_sequencing()
+                self.good_frames = self.checksum_errors = self.resyncs = 0
+                self.send_text(f"Wire format: {WIRE_FORMAT_NAMES[self.wire_format]}")
+            return
+        if command == CMD_SEQUENCED and self.supports_sequencing:
+            unwrapped = self._unwrap_sequenced(data)
+            if unwrapped is None:
+                return
+            command, data = unwrapped
+        if self._handle_link_command(command, data):
+            return
+        self._handle_led_command(command, data)
+
+    def _unwrap_sequenced(self, data):
+        """(command, data) inside a CMD_SEQUENCED, or None if it is a repeat, like unwrapSequenced()"""
+        if len(data) < 2:
+            return None
+        if not self._accept_sequence(data[0]):
+            self.duplicates += 1
+            return None
+        return data[1], data[2:]
+
+    def _handle_link_command(self, command, data):
+        """Like handleLinkCommand(): True if command was a link request (and has been answered)"""
+        if command == CMD_TIME_SYNC and self.supports_time_sync:
+            self.commands[command] += 1
+            self.send_command(CMD_TIME_SYNC, data[:4] + self._millis().to_bytes(4, 'big'))
+            return True
+        if command == CMD_LINK_STATS:
+            self.commands[command] += 1
+            self.send_command(CMD_LINK_STATS, b''.join(count.to_bytes(4, 'big') for count in
+                                                       (self.good_frames, self.checksum_errors, self.resyncs)))
+            return True
+        return False
+
+    def _handle_batch(self, data):
+        """Like handleBatchCommand(): each entry handled as if it had arrived on its own"""
+        offset = 0
+        while offset + 2 <= len(data):
+            command, length = data[offset], data[offset + 1]
+            offset += 2
+            if length > len(data) - offset:
+                break  # Truncated entry
+            entry = data[offset:offset + length]
+            offset += length
+
+            if command == CMD_SEQUENCED and self.supports_sequencing:
+                unwrapped = self._unwrap_sequenced(entry)
+                if unwrapped is None:
+                    continue
+                command, entry = unwrapped
+            if self._handle_link_command(command, entry):
+                self.batched_link_requests += 1
+                continue
+            # Batches don't nest
+            if command != CMD_LED_BATCH:
+                self._handle_led_command(command, entry)
+
+    def _handle_led_command(self, command, data):
+        """Like handleLedCommand(); anything else is counted and ignored"""
+        if command == CMD_LED_BATCH:
+            self._handle_batch(data)
+            return
+        self.commands[command] += 1
+        if command == CMD_LED_PULSE and data and data[0] < len(self.pulses):
+            self.pulses[data[0]] += 1
+            self._take_pulse_slot(time.monotonic())
+        elif command == CMD_LED_PULSE_AT and len(data) >= 5 and data[0] < len(self.pulses):
+            self.pulses[data[0]] += 1
+            start_ms = int.from_bytes(data[1:5], 'big')
+            self.pulse_starts.append((data[0], start_ms))
+            now = time.monotonic()
+            start = self.millis_to_monotonic(start_ms)
+            self._take_pulse_slot(start if start - now <= 1.0 else now)
+        elif command == CMD_LED_FRAME_COMMIT and data:
+            self.send_command(CMD_LED_FRAME_COMMIT, bytes([data[0], 1]))
+
+    def _take_pulse_slot(self, start):
+        """Occupy a pulse slot until the pulse has crossed its strip, like triggerLedPulse()"""
+        now = time.monotonic()
+        self._slot_releases = [release for release in self._slot_releases if release > now]
+        if len(self._slot_releases) >= MAX_ACTIVE_PULSES:
+            self.pulses_dropped += 1
+        else:
+            self._slot_releases.append(start + PULSE_DURATION)
+
+    def _reset_sequencing(self):
+        self._seq_active = False
+        self._last_seq = 0
+        self._seq_history = 0  # bit i: seq _last_seq - 1 - i seen
+        self._ack_pending = False
+
+    def _accept_sequence(self, seq):
+        """Record seq as seen; False if it was seen already (same rules as the firmware)"""
+        self._ack_pending = True
+        if not self._seq_active:
+            self._seq_active = True
+            self._last_seq = seq
+            self._seq_history = 0
+            return True
+        ahead = (seq - self._last_seq) & 0xFF
+        if ahead == 0:
+            return False
+        if ahead < 128:
+            history = (self._seq_history << ahead) | (1 << (ahead - 1)) if ahead <= 16 else 0
+            self._seq_history = history & 0xFFFF
+            self._last_seq = seq
+            return True
+        behind = (self._last_seq - seq) & 0xFF
+        bit = 1 << (behind - 1)
+        if behind > 16 or self._seq_history & bit:
+            return False
+        self._seq_history |= bit
+        return True
+
+    def __str__(self):
+        return (f"Simulated Teensy {self.teensy_id.upper()} on {self.path}: {sum(self.commands.values())} commands, "
+                f"{self.presses_sent} presses, {self.bytes_received} bytes in, {self.bytes_sent} bytes out, "
+                f"{self.checksum_errors} checksum errors, {self.corrupted_bytes} bytes corrupted, "
+                f"{self.duplicates} duplicates, {self.pulses_dropped} pulses dropped for want of a slot")
+
+
+class TeensySimulator:
+    """
+    A SimulatedTeensy for every configured Teensy, found by device detection while running
+
+    Extra keyword arguments are passed to every SimulatedTeensy.
+    """
+
+    def __init__(self, teensy_mapping=TEENSY_MAPPING, **options):
+        self.teensys = {teensy_id: SimulatedTeensy(teensy_id, serial_number, **options)
+                        for teensy_id, serial_number in teensy_mapping.items()}
+        self._previous_lister = None
+        self._previous_uevent_source = None
+        self._uevent_peers = []  # Our ends of the sockets handed out by uevent_socket()
+        self._uevent_lock = threading.Lock()
+        self._uevent_seqnum = 0
+        for teensy in self.teensys.values():
+            teensy.on_hotplug = self.send_uevent
+
+    def __getitem__(self, teensy_id):
+        return self.teensys[teensy_id]
+
+    @property
+    def button_teensy(self):
+        return self.teensys[BUTTON_TEENSY_ID]
+
+    def list_ports(self):
+        """Port list for device detection: every simulated Teensy that is plugged in"""
+        return [teensy.port_info() for teensy in self.teensys.values() if teensy.connected]
+
+    def uevent_socket(self, groups=None):
+        """Stand-in for the netlink uevent socket: receives a udev event per plug and unplug"""
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        with self._uevent_lock:
+            self._uevent_peers.append(ours)
+        return theirs
+
+    def send_uevent(self, action, teensy):
+        """Tell every uevent_socket() what udev would say about a simulated Teensy"""
+        with self._uevent_lock:
+            self._uevent_seqnum += 1
+            message = encode_uevent({
+                'ACTION': action,
+                'DEVPATH': f"/devices/virtual/sim/{teensy.teensy_id}/tty/{os.path.basename(teensy.path)}",
+                'SUBSYSTEM': 'tty',
+                'DEVNAME': teensy.path,
+                'SEQNUM': self._uevent_seqnum,
+                'ID_SERIAL_SHORT': teensy.serial_number,
+            })
+            for peer in list(self._uevent_peers):
+                try:
+                    peer.send(message)
+                except OSError:
+                    # The monitor closed its end
+                    self._uevent_peers.remove(peer)
+                    peer.close()
+
+    def start(self):
+        for teensy in self.teensys.values():
+            teensy.start()
+        self._previous_lister = set_port_lister(self.list_ports)
+        self._previous_uevent_source = set_uevent_source(self.uevent_socket)
+        return self
+
+    def stop(self):
+        set_port_lister(self._previous_lister)
+        set_uevent_source(self._previous_uevent_source)
+        for teensy in self.teensys.values():
+            teensy.stop()
+        with self._uevent_lock:
+            for peer in self._uevent_peers:
+                peer.close()
+            self._uevent_peers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
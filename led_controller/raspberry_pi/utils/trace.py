@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Compact binary traces of input and LED traffic, and a replay driver
+
+A trace file is a short header followed by fixed size records:
+    timestamp_ns  u64  time.perf_counter_ns() when the event happened
+    kind          u8   TRACE_BUTTON, TRACE_GPIO, TRACE_KEYBOARD or TRACE_LED_COMMAND
+    device        u8   Teensy id as a character code ("a" = 0x61), 0 for Pi-side inputs
+    code          u8   Button id (TRACE_BUTTON), trigger() index (GPIO/keyboard) or command
+    arg           u8   First data byte of an LED command (its strip), otherwise 0
+
+Records are packed into a preallocated buffer and written out a buffer at a time on a
+background thread, and read back with struct.iter_unpack straight from the file bytes,
+so neither side builds a list of objects.
+"""
+
+import queue
+import struct
+import threading
+import time
+
+TRACE_MAGIC = b"GTRC"
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct("<4sHHd")  # magic, version, record size, wall clock start time
+TRACE_RECORD = struct.Struct("<QBBBB")
+
+# Record kinds
+TRACE_BUTTON = 1  # Button press from the button Teensy
+TRACE_GPIO = 2  # GPIO button read by sound/main.py
+TRACE_KEYBOARD = 3  # Keyboard trigger in sound/main.py
+TRACE_LED_COMMAND = 4  # Command queued for an LED Teensy
+TRACE_KIND_NAMES = {
+    TRACE_BUTTON: "button",
+    TRACE_GPIO: "gpio",
+    TRACE_KEYBOARD: "keyboard",
+    TRACE_LED_COMMAND: "led",
+}
+
+TRACE_BUFFER_RECORDS = 4096  # Records per buffer handed to the flush thread
+
+
+class TraceRecorder:
+    """
+    Appends records to a trace file
+
+    record() only packs into an in-memory buffer; full buffers are written by a flush
+    thread. Safe to call from several threads.
+    """
+
+    def __init__(self, path, buffer_records=TRACE_BUFFER_RECORDS):
+        self.path = path
+        self.buffer_size = buffer_records * TRACE_RECORD.size
+        self.records = 0
+        self._file = open(path, "wb")
+        self._file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, TRACE_RECORD.size, time.time()))
+        self._buffer = bytearray(self.buffer_size)
+        self._offset = 0
+        self._lock = threading.Lock()
+        self._full = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._flush_buffers, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, kind, device, code, arg=0, timestamp_ns=None):
+        """
+        Add one record
+
+        Args:
+            kind: TRACE_BUTTON, TRACE_GPIO, TRACE_KEYBOARD or TRACE_LED_COMMAND
+            device: Teensy id ("a", "b", ...) or 0
+            code: Button id, trigger index or command
+            arg: Extra byte (LED command strip)
+            timestamp_ns: perf_counter_ns() of the event, if not now
+        """
+        if timestamp_ns is None:
+            timestamp_ns = time.perf_counter_ns()
+        if isinstance(device, str):
+            device = ord(device)
+        with self._lock:
+            TRACE_RECORD.pack_into(self._buffer, self._offset, timestamp_ns, kind, device, code & 0xFF, arg & 0xFF)
+            self._offset += TRACE_RECORD.size
+            self.records += 1
+            if self._offset == self.buffer_size:
+                self._full.put(self._buffer)
+                self._buffer = bytearray(self.buffer_size)
+                self._offset = 0
+
+    def close(self):
+        """Write out everything recorded and close the file"""
+        with self._lock:
+            if self._offset:
+                self._full.put(self._buffer[:self._offset])
+                self._offset = 0
+            self._full.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _flush_buffers(self):
+        while True:
+            buffer = self._full.get()
+            if buffer is None:
+                return
+            self._file.write(buffer)
+
+
+class TraceReader:
+    """Random access and iteration over the records of a trace file, without unpacking them all"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < TRACE_HEADER.size:
+            raise ValueError(f"{path} is too short to be a trace")
+        magic, version, record_size, self.start_time = TRACE_HEADER.unpack_from(data)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION or record_size != TRACE_RECORD.size:
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} trace")
+        body = memoryview(data)[TRACE_HEADER.size:]
+        # A trace cut short by a crash can end part way through a record
+        self._records = body[:len(body) - len(body) % TRACE_RECORD.size]
+
+    def __len__(self):
+        return len(self._records) // TRACE_RECORD.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return TRACE_RECORD.unpack_from(self._records, index * TRACE_RECORD.size)
+
+    def __iter__(self):
+        """(timestamp_ns, kind, device, code, arg) tuples in recorded order"""
+        return TRACE_RECORD.iter_unpack(self._records)
+
+    def duration(self):
+        """Seconds between the first and last record"""
+        if len(self) < 2:
+            return 0.0
+        return (self[-1][0] - self[0][0]) / 1e9
+
+    def counts(self):
+        """{kind name: number of records}"""
+        counts = {}
+        for _, kind, _, _, _ in self:
+            name = TRACE_KIND_NAMES.get(kind, str(kind))
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+
+def replay_trace(path, hub=None, trigger=None, speed=1.0):
+    """
+    Feed a recorded trace back through the hub and the sound engine
+
+    Button records go to hub.handle_button_press() (which also triggers its
+    sound_callback), GPIO and keyboard records to trigger(). LED command records are
+    skipped: replaying the button presses produces them again.
+
+    Args:
+        path: Trace file
+        hub: TeensyHub to drive, or None
+        trigger: The sound engine's trigger(button_index), or None
+        speed: 1.0 for real time, 10.0 for ten times faster, 0 for as fast as possible
+
+    Returns:
+        {'events': replayed, 'skipped': not replayed, 'duration_s': wall time,
+         'max_lag_ms': furthest behind schedule an event was delivered}
+    """
+    reader = TraceReader(path)
+    events = skipped = 0
+    max_lag_ns = 0
+    first_ns = None
+    start_ns = time.perf_counter_ns()
+
+    for timestamp_ns, kind, device, code, arg in reader:
+        if first_ns is None:
+            first_ns = timestamp_ns
+        if speed > 0:
+            due_ns = start_ns + int((timestamp_ns - first_ns) / speed)
+            wait_ns = due_ns - time.perf_counter_ns()
+            if wait_ns > 0:
+                time.sleep(wait_ns / 1e9)
+            max_lag_ns = max(max_lag_ns, time.perf_counter_ns() - due_ns)
+
+        if kind == TRACE_BUTTON and hub is not None:
+            hub.handle_button_press(code, time.perf_counter_ns())
+        elif kind in (TRACE_GPIO, TRACE_KEYBOARD) and trigger is not None:
+            trigger(code)
+        else:
+            skipped += 1
+            continue
+        events += 1
+
+    return {
+        'events': events,
+        'skipped': skipped,
+        'duration_s': (time.perf_counter_ns() - start_ns) / 1e9,
+        'max_lag_ms': max_lag_ns / 1e6,
+    }
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Non-blocking per-device writer
+
+Each output Teensy gets a DeviceWriter: callers queue commands and return immediately,
+and a writer thread sends everything that queued up while it was busy in one write().
+A slow or stalled port only ever backs up its own bounded queue.
+
+Writes are paced by a token bucket sized to the link, so a burst of presses queues on
+the Pi, where it can still be reordered and shed, instead of in the port's buffers.
+Commands have a priority: interactive ones (pulses) always go before bulk ones
+(effects, pushed frames), and only interactive ones may spend the last `reserve` bytes
+of the bucket, so a big write never leaves the next pulse waiting for tokens. Each
+priority has a deadline, and commands that have waited longer than that are dropped
+unsent, because by then they are only lag.
+"""
+
+import threading
+import time
+from collections import deque
+
+from .config import (
+    WIRE_FORMAT_LEGACY,
+    WRITER_QUEUE_SIZE,
+    WRITER_FULL_POLICY,
+    LINK_BYTES_PER_SECOND,
+    LINK_BURST_BYTES,
+    LINK_INTERACTIVE_RESERVE_BYTES,
+    COMMAND_DEADLINES,
+)
+from .protocol import BurstSize, encode_command_burst, frame_size
+from .reliable import MAX_SEQUENCED_DATA, SEQUENCED_HEADER_SIZE
+
+# Command priorities, most urgent first
+PRIORITY_INTERACTIVE = 0  # Responses to button presses
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2  # Effects and pushed frames
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK)
+
+UTILISATION_WINDOW_NS = 1_000_000_000  # recent_utilisation is measured over this long
+
+# What to do with a new command when the queue is full
+DROP_OLDEST = "drop_oldest"  # Make room by discarding the oldest queued command of the lowest priority
+DROP_NEWEST = "drop_newest"  # Discard the new command
+MERGE = "merge"  # Fold it into an identical queued command if there is one, else drop oldest
+FULL_POLICIES = (DROP_OLDEST, DROP_NEWEST, MERGE)
+
+
+class DeviceWriter:
+    """
+    Bounded, prioritised write queue with its own thread for one serial port
+
+    Queue entries are (command, data, reliable, queued_ns, on_drop) tuples in one FIFO per
+    priority, encoded at write time in the writer's wire_format, or already encoded frames
+    queued with send_bytes() (command is None). data may also be a function, called with
+    perf_counter_ns() when the command is taken for a write, for data that carries its own
+    send time (clock sync requests). on_drop, if not None, is called with no
+    arguments when the entry is shed instead of written (queue full, merged, expired or
+    abandoned), on the thread that shed it once the writer's lock is released.
+
+    With a SequencedLink, commands are numbered as they are written, at most link.window
+    are in flight at once, and the thread also wakes up to retransmit overdue ones.
+
+    Args:
+        rate: Token bucket rate in bytes per second, None for no pacing
+        burst: Token bucket size in bytes
+        reserve: Bytes of the bucket only interactive commands may spend
+        deadlines: Seconds a command may wait in the queue, per priority
+    """
+
+    def __init__(self, port, name, max_queue=WRITER_QUEUE_SIZE, policy=WRITER_FULL_POLICY,
+                 wire_format=WIRE_FORMAT_LEGACY, on_error=None, latency=None, link=None,
+                 rate=LINK_BYTES_PER_SECOND, burst=LINK_BURST_BYTES, reserve=LINK_INTERACTIVE_RESERVE_BYTES,
+                 deadlines=COMMAND_DEADLINES):
+        if policy not in FULL_POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}, expected one of {FULL_POLICIES}")
+        self.port = port
+        self.name = name
+        self.max_queue = max_queue
+        self.policy = policy
+        self.wire_format = wire_format
+        self.on_error = on_error
+        # Optional LatencyRecorder; each write records the wait of its oldest entry under 'led_write'
+        self.latency = latency
+        self.link = link
+        self._queues = tuple(deque() for _ in PRIORITIES)
+        self._deadlines_ns = tuple(int(deadline * 1e9) for deadline in deadlines)
+        self._condition = threading.Condition()
+        self._shed_callbacks = []  # on_drop callbacks to call once the lock is released
+        self._running = False
+        self.thread = None
+
+        # Token bucket, only touched by the writer thread
+        self.rate = rate
+        self.burst = burst
+        self.reserve = min(reserve, burst)
+        self.tokens = burst
+        self._refilled_ns = time.perf_counter_ns()
+        self._blocked_tokens = 0  # Tokens the next command needs, if the bucket held it back
+
+        # Counters
+        self.queued = 0
+        self.dropped = 0  # Shed because the queue was full
+        self.merged = 0
+        self.expired = 0  # Shed because they waited past their deadline
+        self.throttled = 0  # Times the bucket started holding writes back
+        self.writes = 0
+        self.commands_written = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.started_ns = None
+        self.recent_utilisation = 0.0
+        self._window_start_ns = None
+        self._window_bytes = 0
+
+    @property
+    def bulk_write_size(self):
+        """Largest write a non-interactive command should be, to go out without overdrawing the bucket"""
+        return self.burst - self.reserve
+
+    @property
+    def depth(self):
+        """Commands currently waiting to be written"""
+        return sum(len(queue) for queue in self._queues)
+
+    def start(self):
+        self._running = True
+        self.started_ns = self._window_start_ns = time.perf_counter_ns()
+        self.thread = threading.Thread(target=self._run, name=f"writer-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        """Stop the writer thread, giving it up to timeout seconds to write what is queued"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        self.thread = None
+
+    def abandon(self):
+        """Stop without writing what is queued (the port is gone); doesn't wait for the thread"""
+        with self._condition:
+            for queue in self._queues:
+                while queue:
+                    self._shed(queue.popleft())
+                    self.dropped += 1
+            self._running = False
+            self._condition.notify()
+            shed = self._take_shed()
+        self.thread = None
+        self._call_on_drops(shed)
+
+    def send(self, command, data, reliable=False, priority=PRIORITY_NORMAL, on_drop=None):
+        """
+        Queue one command; returns False if it was dropped
+
+        reliable commands are retransmitted until acked (with a SequencedLink)
+        """
+        return self.send_many(((command, data, reliable, priority, on_drop),)) == 1
+
+    def send_many(self, commands):
+        """
+        Queue several commands at once, so they go out in the same write
+
+        Args:
+            commands: (command, data), (command, data, reliable),
+                      (command, data, reliable, priority) or
+                      (command, data, reliable, priority, on_drop) tuples
+
+        Returns:
+            How many of them were queued (rather than dropped or merged)
+        """
+        accepted = 0
+        now = time.perf_counter_ns()
+        with self._condition:
+            for entry in commands:
+                command, data = entry[0], entry[1]
+                reliable = entry[2] if len(entry) > 2 else False
+                priority = entry[3] if len(entry) > 3 else PRIORITY_NORMAL
+                on_drop = entry[4] if len(entry) > 4 else None
+                accepted += self._enqueue((command, data, reliable, now, on_drop), priority)
+            self._condition.notify()
+            shed = self._take_shed()
+        self._call_on_drops(shed)
+        return accepted
+
+    def send_bytes(self, frame, priority=PRIORITY_BULK):
+        """Queue already encoded bytes (e.g. a pushed frame); returns False if dropped"""
+        return self.send(None, frame, priority=priority)
+
+    def acknowledge(self, ack_data):
+        """Handle a CMD_ACK from the Teensy (called on the reader thread)"""
+        if self.link is None:
+            return
+        with self._condition:
+            if self.link.acknowledge(ack_data, time.perf_counter_ns()):
+                # Room in the window again
+                self._condition.notify()
+
+    def utilisation(self):
+        """Fraction of the link's rate used since the writer started"""
+        if not self.rate or self.started_ns is None:
+            return 0.0
+        elapsed = (time.perf_counter_ns() - self.started_ns) / 1e9
+        return self.bytes_written / (self.rate * elapsed) if elapsed > 0 else 0.0
+
+    def stats(self):
+        """Snapshot of the counters"""
+        return {
+            'depth': self.depth,
+            'depth_by_priority': tuple(len(queue) for queue in self._queues),
+            'max_depth': self.max_depth,
+            'queued': self.queued,
+            'dropped': self.dropped,
+            'merged': self.merged,
+            'expired': self.expired,
+            'throttled': self.throttled,
+            'writes': self.writes,
+            'commands_written': self.commands_written,
+            'bytes_written': self.bytes_written,
+            'errors': self.errors,
+            'utilisation': self.utilisation(),
+            'recent_utilisation': self.recent_utilisation,
+        }
+
+    def __str__(self):
+        return (f"{self.name}: {self.commands_written} commands in {self.writes} writes "
+                f"({self.bytes_written} bytes, {self.utilisation():.0%} of the link), depth {self.depth}/{self.max_queue} "
+                f"(max {self.max_depth}), {self.dropped} dropped, {self.expired} expired, {self.merged} merged, "
+                f"{self.throttled} throttled, {self.errors} errors")
+
+    def _enqueue(self, entry, priority):
+        # Called with the condition held
+        queue = self._queues[priority]
+        if self.depth >= self.max_queue:
+            if self.policy == DROP_NEWEST:
+                self._shed(entry)
+                self.dropped += 1
+                return 0
+            if self.policy == MERGE and entry[0] is not None and any(
+                    queued[0] == entry[0] and queued[1] == entry[1] for queued in queue):
+                self._shed(entry)
+                self.merged += 1
+                return 0
+            # Shed the oldest command of the least important priority, as long as it is no
+            # more important than the new one
+            for victims in reversed(self._queues[priority:]):
+                if victims:
+                    self._shed(victims.popleft())
+                    self.dropped += 1
+                    break
+            else:
+                self._shed(entry)
+                self.dropped += 1
+                return 0
+
+        queue.append(entry)
+        self.queued += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        return 1
+
+    def _run(self):
+        while True:
+            with self._condition:
+                entries, fresh, oldest_queued_ns = self._take()
+                shed = self._take_shed()
+                if not entries and not shed:
+                    if not self._running:
+                        return
+                    self._condition.wait(self._wait_timeout())
+                    continue
+            self._call_on_drops(shed)
+            if entries:
+                self._write(entries, fresh, oldest_queued_ns)
+
+    def _write(self, entries, fresh, oldest_queued_ns):
+        payload = self._encode(entries)
+        try:
+            self.port.write(payload)
+        except Exception as e:
+            self.errors += 1
+            if self.on_error:
+                self.on_error(e)
+            return
+        self.tokens -= len(payload)
+        self.writes += 1
+        self.commands_written += len(entries)
+        self.bytes_written += len(payload)
+        self._count_utilisation(len(payload))
+        if fresh and self.latency is not None:
+            self.latency.record('led_write', oldest_queued_ns)
+
+    def _take(self):
+        """
+        Take what can be written now (with the condition held)
+
+        Commands past their deadline are dropped first. Then retransmits go out, followed
+        by queued commands in priority order for as long as the token bucket and the send
+        window allow; a command that has to wait holds back everything less important too.
+        Only interactive commands may spend the bucket's reserve. Each command costs what it
+        adds to the batched write, which is what the bucket is charged once it goes out. One
+        bigger than the bucket can ever hold for it goes once the bucket is full, and is paid
+        back before anything else goes. When stopping, everything left is written as it is.
+
+        Returns:
+            ((command, data) pairs, how many came off the queue, oldest queued_ns among them)
+        """
+        now = time.perf_counter_ns()
+        self._expire(now)
+        was_blocked, self._blocked_tokens = self._blocked_tokens, 0
+        if not self._running:
+            entries = [(command, self._stamp(data, now)) for queue in self._queues for command, data, _, _, _ in queue]
+            oldest = min((queue[0][3] for queue in self._queues if queue), default=now)
+            for queue in self._queues:
+                queue.clear()
+            return entries, len(entries), oldest
+
+        self._refill(now)
+        link = self.link
+        entries = link.due(now) if link is not None else []
+        payload = BurstSize(self.wire_format)  # What _encode() will make of entries
+        for _, data in entries:
+            payload.add(len(data))
+        taken = 0
+        oldest = now
+        for priority, queue in zip(PRIORITIES, self._queues):
+            floor = 0 if priority == PRIORITY_INTERACTIVE else self.reserve
+            while queue:
+                command, data, reliable, queued_ns, _ = queue[0]
+                data = self._stamp(data, now)
+                sequenced = link is not None and command is not None and len(data) <= MAX_SEQUENCED_DATA
+                if command is None:
+                    size = alone = len(data)
+                else:
+                    data_length = len(data) + (SEQUENCED_HEADER_SIZE if sequenced else 0)
+                    size = payload.size_with(data_length) - payload.size
+                    alone = frame_size(data_length, self.wire_format)
+                budget = self.tokens - payload.size
+                if self.rate and size > budget - floor and budget < self.burst:
+                    # It goes first in the next write, so then it costs a frame of its own
+                    self._blocked_tokens = min(alone + floor, self.burst)
+                    if not was_blocked:
+                        self.throttled += 1
+                    return entries, taken, oldest
+                if sequenced:
+                    if not link.window_free():
+                        return entries, taken, oldest
+                    command, data = link.wrap(command, data, reliable, now)
+                queue.popleft()
+                entries.append((command, data))
+                if command is None:
+                    payload.add_frame(len(data))
+                else:
+                    payload.add(data_length)
+                taken += 1
+                oldest = min(oldest, queued_ns)
+        return entries, taken, oldest
+
+    @staticmethod
+    def _stamp(data, now):
+        return data(now) if callable(data) else data
+
+    def _expire(self, now):
+        for queue, deadline_ns in zip(self._queues, self._deadlines_ns):
+            while queue and now - queue[0][3] > deadline_ns:
+                self._shed(queue.popleft())
+                self.expired += 1
+
+    def _shed(self, entry):
+        # Called with the condition held; on_drop runs once it is released
+        on_drop = entry[4]
+        if on_drop is not None:
+            self._shed_callbacks.append(on_drop)
+
+    def _take_shed(self):
+        shed, self._shed_callbacks = self._shed_callbacks, []
+        return shed
+
+    @staticmethod
+    def _call_on_drops(shed):
+        for on_drop in shed:
+            on_drop()
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._refilled_ns) * self.rate / 1e9)
+        self._refilled_ns = now
+
+    def _count_utilisation(self, size):
+        now = time.perf_counter_ns()
+        self._window_bytes += size
+        elapsed = now - self._window_start_ns
+        if self.rate and elapsed >= UTILISATION_WINDOW_NS:
+            self.recent_utilisation = self._window_bytes / (self.rate * elapsed / 1e9)
+            self._window_start_ns = now
+            self._window_bytes = 0
+
+    def _wait_timeout(self):
+        """Seconds until there may be something to write, or None to wait for new commands or acks"""
+        timeouts = []
+        if self.link is not None:
+            deadline = self.link.next_deadline_ns()
+            if deadline is not None:
+                timeouts.append((deadline - time.perf_counter_ns()) / 1e9)
+        if self._blocked_tokens:
+            # Until the bucket has refilled enough for the command at the head of the queue
+            timeouts.append((self._blocked_tokens - self.tokens) / self.rate)
+        if not timeouts:
+            return None
+        return max(0.0, min(timeouts))
+
+    def _encode(self, entries):
+        """Encode (command, data) pairs in order, batching runs of commands between raw frames"""
+        parts = []
+        commands = []
+        for command, data in entries:
+            if command is None:
+                if commands:
+                    parts.append(encode_command_burst(commands, self.wire_format))
+                    commands = []
+                parts.append(data)
+            else:
+                commands.append((command, data))
+        if commands:
+            parts.append(encode_command_burst(commands, self.wire_format))
+        return b''.join(parts)
@@ -31,6 +31,42 @@ void setupButtons() {
     }
 }
 
+// Bitmap of the debounced pressed state of every button, bit i = button i + 1
+static uint16_t pressedButtonBitmap() {
+    uint16_t bitmap = 0;
+    for (int i = 0; i < NUM_BUTTONS; i++) {
+        if (buttons[i].read() == LOW) {
+            bitmap |= (1 << i);
+        }
+    }
+    return bitmap;
+}
+
+// Reports a press or release to the Pi.
+// Binary events are CMD_BUTTON_PRESS packets with data (multi-byte values big-endian):
+//   [button number (1-based), pressed (1) / released (0), millis (4 bytes), pressed bitmap (2 bytes)]
+// Build with -D BUTTON_TEXT_EVENTS to print BUTTON_PRESS:n / BUTTON_RELEASE:n lines instead.
+static void sendButtonEvent(int buttonIndex, bool pressed) {
+#ifdef BUTTON_TEXT_EVENTS
+    Serial.print(pressed ? "BUTTON_PRESS:" : "BUTTON_RELEASE:");
+    Serial.print(buttonIndex + 1);
+    Serial.print("\n");
+#else
+    unsigned long now = millis();
+    uint16_t bitmap = pressedButtonBitmap();
+    uint8_t data[8];
+    data[0] = buttonIndex + 1;
+    data[1] = pressed ? 1 : 0;
+    data[2] = (now >> 24) & 0xFF;
+    data[3] = (now >> 16) & 0xFF;
+    data[4] = (now >> 8) & 0xFF;
+    data[5] = now & 0xFF;
+    data[6] = (bitmap >> 8) & 0xFF;
+    data[7] = bitmap & 0xFF;
+    sendCommand(CMD_BUTTON_PRESS, data, 8);
+#endif
+}
+
 void loopButtons() {
     // Update and check all buttons using a single loop
     for (int i = 0; i < NUM_BUTTONS; i++) {
@@ -38,14 +74,10 @@ void loopButtons() {
         
         // Check for button presses (fell = pressed down)
         if (buttons[i].fell()) {
-            Serial.print("BUTTON_PRESS:");
-            Serial.print(i + 1);
-            Serial.print("\n");
+            sendButtonEvent(i, true);
             setEyeStatus(i, true);
         } else if (buttons[i].rose()) {
-            Serial.print("BUTTON_RELEASE:");
-            Serial.print(i + 1);
-            Serial.print("\n");
+            sendButtonEvent(i, false);
             setEyeStatus(i, false);
         }
     }
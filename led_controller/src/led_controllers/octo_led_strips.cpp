@@ -16,6 +16,9 @@ OctoWS2811 leds(LED_STRIP_NUM_LEDS, displayMemoryLeds, drawingMemoryLeds, config
 
 #define MAX_ACTIVE_PULSES 8
 #define FIRE_UPDATE_INTERVAL 100 // ms between fire updates
+#define FRAME_SPAN_RUN 0x80 // Set in a span segment's count byte for run-length segments
+#define FRAME_PUSH_TIMEOUT 1000 // ms without a pushed frame before going back to local animation
+#define MAX_PULSE_LEAD 1000 // ms; a scheduled pulse further ahead than this is started now
 
 static LedPulse activePulses[MAX_ACTIVE_PULSES];
 static uint8_t fireHeat[8][LED_STRIP_NUM_LEDS]; // Simplified: just heat values
@@ -23,6 +26,15 @@ static const unsigned long pulseDuration = 400; // ms for pulse to travel full s
 static const uint32_t pulseColor = 0x00FFFFFF; // White
 static const uint32_t backgroundColor = 0x00000000; // Black background
 
+// Frames pushed from the Pi. Spans are applied to pushFrame as they arrive and only
+// copied to shownFrame on commit, so a half-received frame is never displayed.
+static uint32_t pushFrame[8 * LED_STRIP_NUM_LEDS];
+static uint32_t shownFrame[8 * LED_STRIP_NUM_LEDS];
+static unsigned long lastFrameCommit = 0;
+static bool framePushActive = false;
+static uint8_t spanFrameId = 0;
+static uint8_t spanPacketsReceived = 0;
+
 // Simplified fire colors - just 4 main colors instead of 256
 const uint32_t fireColors[4] = {
     0x00000000, // Black
@@ -118,7 +130,12 @@ void drawAllPulses() {
     unsigned long now = millis();
     for (int i = 0; i < MAX_ACTIVE_PULSES; i++) {
         if (activePulses[i].active) {
-            float progress = float(now - activePulses[i].startTime) / pulseDuration;
+            // Scheduled pulses can start in the future; they wait in their slot until then
+            long elapsed = (long)(now - activePulses[i].startTime);
+            if (elapsed < 0) {
+                continue;
+            }
+            float progress = float(elapsed) / pulseDuration;
             int ledIndex = int(progress * LED_STRIP_NUM_LEDS);
             
             if (ledIndex >= 0 && ledIndex < LED_STRIP_NUM_LEDS) {
@@ -131,19 +148,147 @@ void drawAllPulses() {
     }
 }
 
-void loopLedStrips() {
-    // Handle incoming commands from Pi
-    CommandPacket packet;
-    if (receiveCommand(packet)) {
-        if (packet.command == CMD_LED_PULSE) {
+// Applies the changed pixels of a pushed frame: [frame_id, strip, segments...] where each
+// segment is [start, count, count RGBW pixels] or [start, count | FRAME_SPAN_RUN, one RGBW pixel].
+void handleFrameSpan(const CommandPacket& packet) {
+    if (packet.data_length < 2) {
+        return;
+    }
+    uint8_t frameId = packet.data[0];
+    uint8_t strip = packet.data[1];
+    if (frameId != spanFrameId) {
+        spanFrameId = frameId;
+        spanPacketsReceived = 0;
+    }
+    spanPacketsReceived++;
+    if (strip >= 8) {
+        return;
+    }
+
+    uint8_t offset = 2;
+    while (offset + 2 <= packet.data_length) {
+        uint8_t start = packet.data[offset];
+        bool run = packet.data[offset + 1] & FRAME_SPAN_RUN;
+        uint8_t count = packet.data[offset + 1] & ~FRAME_SPAN_RUN;
+        offset += 2;
+
+        int payloadLength = run ? 4 : count * 4;
+        if (offset + payloadLength > packet.data_length || start + count > LED_STRIP_NUM_LEDS) {
+            break; // Malformed segment
+        }
+
+        uint32_t* pixels = &pushFrame[strip * LED_STRIP_NUM_LEDS + start];
+        for (int i = 0; i < count; i++) {
+            const uint8_t* color = &packet.data[offset + (run ? 0 : i * 4)];
+            pixels[i] = ((uint32_t)color[0] << 24) | ((uint32_t)color[1] << 16) | ((uint32_t)color[2] << 8) | color[3];
+        }
+        offset += payloadLength;
+    }
+}
+
+// Shows the pushed frame and echoes [frame_id, complete] back to the Pi as the ack.
+// complete is false if fewer span packets arrived than the Pi says it sent.
+void handleFrameCommit(const CommandPacket& packet) {
+    if (packet.data_length < 2) {
+        return;
+    }
+    uint8_t frameId = packet.data[0];
+    uint8_t expectedSpanPackets = packet.data[1];
+    uint8_t received = (frameId == spanFrameId) ? spanPacketsReceived : 0;
+
+    memcpy(shownFrame, pushFrame, sizeof(shownFrame));
+    framePushActive = true;
+    lastFrameCommit = millis();
+    spanPacketsReceived = 0;
+
+    uint8_t ack[2] = {frameId, (uint8_t)(received == expectedSpanPackets)};
+    sendCommand(CMD_LED_FRAME_COMMIT, ack, 2);
+}
+
+void drawPushedFrame() {
+    for (int i = 0; i < LED_STRIP_NUM_LEDS * NUM_LED_STRIPS; i++) {
+        leds.setPixel(i, shownFrame[i]);
+    }
+}
+
+// Unpacks the [command, data_length, data...] entries of a CMD_LED_BATCH packet
+// and handles each one exactly as if it had arrived in its own packet.
+void handleBatchCommand(const CommandPacket& batch) {
+    uint8_t offset = 0;
+    while (offset + 2 <= batch.data_length) {
+        CommandPacket entry = {};
+        entry.command = batch.data[offset];
+        entry.data_length = batch.data[offset + 1];
+        offset += 2;
+        if (entry.data_length > batch.data_length - offset) {
+            break; // Truncated entry
+        }
+        memcpy(entry.data, &batch.data[offset], entry.data_length);
+        offset += entry.data_length;
+
+        // Sequenced entries are unwrapped here; repeats of a seq are skipped
+        if (entry.command == CMD_SEQUENCED && !unwrapSequenced(entry)) {
+            continue;
+        }
+        // The writer batches whatever is queued together, clock sync and stats requests included
+        if (handleLinkCommand(entry)) {
+            continue;
+        }
+        // Batches don't nest
+        if (entry.command != CMD_LED_BATCH) {
+            handleLedCommand(entry);
+        }
+    }
+}
+
+void handleLedCommand(const CommandPacket& packet) {
+    switch (packet.command) {
+        case CMD_LED_PULSE: {
             int strip = (packet.data_length > 0) ? packet.data[0] : 0;
             triggerLedPulse(millis(), strip);
+            break;
         }
+        case CMD_LED_PULSE_AT: {
+            // [strip, start time on our millis() clock, u32 big-endian], scheduled by the Pi
+            if (packet.data_length < 5) {
+                break;
+            }
+            unsigned long now = millis();
+            unsigned long start = ((unsigned long)packet.data[1] << 24) | ((unsigned long)packet.data[2] << 16) |
+                                  ((unsigned long)packet.data[3] << 8) | packet.data[4];
+            if ((long)(start - now) > MAX_PULSE_LEAD) {
+                start = now; // The Pi's idea of our clock is off; don't hold the pulse back
+            }
+            triggerLedPulse(start, packet.data[0]);
+            break;
+        }
+        case CMD_LED_BATCH:
+            handleBatchCommand(packet);
+            break;
+        case CMD_LED_FRAME_SPAN:
+            handleFrameSpan(packet);
+            break;
+        case CMD_LED_FRAME_COMMIT:
+            handleFrameCommit(packet);
+            break;
+    }
+}
+
+void loopLedStrips() {
+    // Handle every command that arrived from the Pi since the last frame
+    CommandPacket packet;
+    while (receiveCommand(packet)) {
+        handleLedCommand(packet);
     }
 
     // Update LED animations
     clearAllLEDs();
-    drawFire(); // Draw the fire effect
+    if (framePushActive && millis() - lastFrameCommit < FRAME_PUSH_TIMEOUT) {
+        drawPushedFrame(); // The Pi is driving the pixels
+    } else {
+        framePushActive = false;
+        drawFire(); // Draw the fire effect
+    }
     drawAllPulses(); // Draw active pulses on top
     updateFire(); // Update fire physics
     
@@ -5,6 +5,7 @@
 
 #include <Arduino.h>
 #include <vector>
+#include "shared/communication.h"
 
 struct LedPulse {
     bool active;
@@ -21,6 +22,11 @@ void clearAllLEDs();
 void drawFire();
 void updateFire();
 void drawAllPulses();
+void drawPushedFrame();
+void handleFrameSpan(const CommandPacket& packet);
+void handleFrameCommit(const CommandPacket& packet);
+void handleLedCommand(const CommandPacket& packet);
+void handleBatchCommand(const CommandPacket& batch);
 void loopLedStrips();
 
 #endif // TEENSY_B || TEENSY_C
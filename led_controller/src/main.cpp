@@ -75,8 +75,9 @@ void loop() {
     previousMillis = currentTime;
     ledState = !ledState;
     digitalWrite(BOARD_LED_PIN, ledState);
-    // sendHeartbeat();  // Disabled - causing text/binary interference
   }
+  // Binary heartbeat frames are interleaved with text; the Pi's StreamFramer separates them.
+  sendHeartbeat();
 
   // Run device-specific loops
 #ifdef TEENSY_A
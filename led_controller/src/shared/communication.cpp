@@ -1,38 +1,133 @@
 #include "communication.h"
 #include "config.h"
 
+// Wire format in use on this connection; starts as legacy and is upgraded by the Pi's CMD_HELLO
+static uint8_t wireFormat = WIRE_FORMAT_LEGACY;
+
+// Largest v2 frame: sync, length, command, 32 data bytes, checksum
+#define MAX_V2_FRAME_SIZE 36
+
+// Partially received v2 frame, kept between calls
+static uint8_t v2Frame[MAX_V2_FRAME_SIZE];
+static uint8_t v2Received = 0;
+
+// Link error counters for this connection, reported with CMD_LINK_STATS
+static uint32_t goodFrames = 0;
+static uint32_t badFrames = 0;  // Checksum errors
+static uint32_t resyncs = 0;  // Bytes skipped looking for the start of a frame
+
+// CRC-8 (polynomial 0x07) of every byte value, so a frame costs one lookup per byte
+static const uint8_t crc8Table[256] = {
+    0x00, 0x07, 0x0E, 0x09, 0x1C, 0x1B, 0x12, 0x15, 0x38, 0x3F, 0x36, 0x31, 0x24, 0x23, 0x2A, 0x2D,
+    0x70, 0x77, 0x7E, 0x79, 0x6C, 0x6B, 0x62, 0x65, 0x48, 0x4F, 0x46, 0x41, 0x54, 0x53, 0x5A, 0x5D,
+    0xE0, 0xE7, 0xEE, 0xE9, 0xFC, 0xFB, 0xF2, 0xF5, 0xD8, 0xDF, 0xD6, 0xD1, 0xC4, 0xC3, 0xCA, 0xCD,
+    0x90, 0x97, 0x9E, 0x99, 0x8C, 0x8B, 0x82, 0x85, 0xA8, 0xAF, 0xA6, 0xA1, 0xB4, 0xB3, 0xBA, 0xBD,
+    0xC7, 0xC0, 0xC9, 0xCE, 0xDB, 0xDC, 0xD5, 0xD2, 0xFF, 0xF8, 0xF1, 0xF6, 0xE3, 0xE4, 0xED, 0xEA,
+    0xB7, 0xB0, 0xB9, 0xBE, 0xAB, 0xAC, 0xA5, 0xA2, 0x8F, 0x88, 0x81, 0x86, 0x93, 0x94, 0x9D, 0x9A,
+    0x27, 0x20, 0x29, 0x2E, 0x3B, 0x3C, 0x35, 0x32, 0x1F, 0x18, 0x11, 0x16, 0x03, 0x04, 0x0D, 0x0A,
+    0x57, 0x50, 0x59, 0x5E, 0x4B, 0x4C, 0x45, 0x42, 0x6F, 0x68, 0x61, 0x66, 0x73, 0x74, 0x7D, 0x7A,
+    0x89, 0x8E, 0x87, 0x80, 0x95, 0x92, 0x9B, 0x9C, 0xB1, 0xB6, 0xBF, 0xB8, 0xAD, 0xAA, 0xA3, 0xA4,
+    0xF9, 0xFE, 0xF7, 0xF0, 0xE5, 0xE2, 0xEB, 0xEC, 0xC1, 0xC6, 0xCF, 0xC8, 0xDD, 0xDA, 0xD3, 0xD4,
+    0x69, 0x6E, 0x67, 0x60, 0x75, 0x72, 0x7B, 0x7C, 0x51, 0x56, 0x5F, 0x58, 0x4D, 0x4A, 0x43, 0x44,
+    0x19, 0x1E, 0x17, 0x10, 0x05, 0x02, 0x0B, 0x0C, 0x21, 0x26, 0x2F, 0x28, 0x3D, 0x3A, 0x33, 0x34,
+    0x4E, 0x49, 0x40, 0x47, 0x52, 0x55, 0x5C, 0x5B, 0x76, 0x71, 0x78, 0x7F, 0x6A, 0x6D, 0x64, 0x63,
+    0x3E, 0x39, 0x30, 0x37, 0x22, 0x25, 0x2C, 0x2B, 0x06, 0x01, 0x08, 0x0F, 0x1A, 0x1D, 0x14, 0x13,
+    0xAE, 0xA9, 0xA0, 0xA7, 0xB2, 0xB5, 0xBC, 0xBB, 0x96, 0x91, 0x98, 0x9F, 0x8A, 0x8D, 0x84, 0x83,
+    0xDE, 0xD9, 0xD0, 0xD7, 0xC2, 0xC5, 0xCC, 0xCB, 0xE6, 0xE1, 0xE8, 0xEF, 0xFA, 0xFD, 0xF4, 0xF3
+};
+
+// Sequenced commands seen on this connection: the latest seq, and bit i of seqHistory set
+// if seq lastSeq - 1 - i was seen too. ackPending once there's something new to ack.
+static bool seqActive = false;
+static uint8_t lastSeq = 0;
+static uint16_t seqHistory = 0;
+static bool ackPending = false;
+
+static void resetSequencing() {
+    seqActive = false;
+    seqHistory = 0;
+    ackPending = false;
+}
+
 void initCommunication() {
     Serial.begin(SERIAL_BAUD_RATE);
     Serial.println("Communication initialized");
 }
 
+uint8_t getWireFormat() {
+    return wireFormat;
+}
+
+void setWireFormat(uint8_t format) {
+    wireFormat = format;
+    v2Received = 0;
+    goodFrames = badFrames = resyncs = 0;
+    resetSequencing();
+    Serial.print("Wire format: ");
+    Serial.println(format == WIRE_FORMAT_V2_CRC8 ? "v2 + CRC-8" : format == WIRE_FORMAT_V2 ? "v2" : "legacy");
+}
+
+// Checksum of a v2 frame's length, command and data bytes, as the wire format calls for
+static uint8_t v2Checksum(const uint8_t* bytes, uint8_t length) {
+    uint8_t checksum = 0;
+    if (wireFormat == WIRE_FORMAT_V2_CRC8) {
+        for (int i = 0; i < length; i++) {
+            checksum = crc8Table[checksum ^ bytes[i]];
+        }
+    } else {
+        for (int i = 0; i < length; i++) {
+            checksum ^= bytes[i];
+        }
+    }
+    return checksum;
+}
+
 void sendCommand(uint8_t command, const uint8_t* data, uint8_t length) {
-    CommandPacket packet;
+    if (length > 32) {
+        length = 32;
+    }
+
+    if (wireFormat != WIRE_FORMAT_LEGACY) {
+        uint8_t frame[MAX_V2_FRAME_SIZE];
+        frame[0] = FRAME_SYNC;
+        frame[1] = length + 1;
+        frame[2] = command;
+        memcpy(&frame[3], data, length);
+        frame[length + 3] = v2Checksum(&frame[1], length + 2);
+
+        Serial.write(frame, length + 4);
+        Serial.flush();
+        return;
+    }
+
+    CommandPacket packet = {};
     packet.command = command;
     packet.data_length = length;
-    
+
     // Copy data
     for (int i = 0; i < length && i < 32; i++) {
         packet.data[i] = data[i];
     }
-    
+
     // Calculate checksum
     packet.checksum = calculateChecksum(packet);
-    
+
     // Send packet
     Serial.write((uint8_t*)&packet, sizeof(CommandPacket));
     Serial.flush();
 }
 
-bool receiveCommand(CommandPacket& packet) {
+static bool receiveLegacyCommand(CommandPacket& packet) {
     if (Serial.available() >= sizeof(CommandPacket)) {
         Serial.readBytes((uint8_t*)&packet, sizeof(CommandPacket));
-        
+
         // Verify checksum
         uint8_t expectedChecksum = calculateChecksum(packet);
         if (packet.checksum == expectedChecksum) {
+            goodFrames++;
             return true;
         } else {
+            badFrames++;
             Serial.println("Checksum error");
             Serial.print("Command: ");
             Serial.println((int)packet.command);
@@ -50,19 +145,194 @@ bool receiveCommand(CommandPacket& packet) {
     return false;
 }
 
+// Byte-at-a-time v2 parser. Partial frames are kept between calls, and anything that
+// isn't a well-formed frame is skipped until the next sync byte.
+static bool receiveV2Command(CommandPacket& packet) {
+    while (Serial.available() > 0) {
+        uint8_t byte = Serial.read();
+
+        if (v2Received == 0) {
+            if (byte == FRAME_SYNC) {
+                v2Frame[v2Received++] = byte;
+            } else {
+                resyncs++;
+            }
+            continue;
+        }
+        if (v2Received == 1 && (byte == 0 || byte > 33)) {
+            // Not a valid length; this byte may itself start the next frame
+            v2Received = (byte == FRAME_SYNC) ? 1 : 0;
+            resyncs++;
+            continue;
+        }
+
+        v2Frame[v2Received++] = byte;
+        uint8_t length = v2Frame[1];
+        if (v2Received < length + 3) {
+            continue;
+        }
+
+        v2Received = 0;
+        if (v2Checksum(&v2Frame[1], length + 1) != v2Frame[length + 2]) {
+            badFrames++;
+            Serial.println("Checksum error");
+            continue;
+        }
+        goodFrames++;
+
+        packet.command = v2Frame[2];
+        packet.data_length = length - 1;
+        memcpy(packet.data, &v2Frame[3], packet.data_length);
+        packet.checksum = calculateChecksum(packet);
+        return true;
+    }
+    return false;
+}
+
+// Replies with our version in the current (legacy) format, then switches to the newest
+// format both sides support
+static void handleHello(const CommandPacket& packet) {
+    uint8_t hostVersion = packet.data_length > 0 ? packet.data[0] : WIRE_FORMAT_LEGACY;
+    uint8_t reply[2] = {WIRE_FORMAT_V2_CRC8, CAP_SEQUENCED | CAP_TIME_SYNC};
+    sendCommand(CMD_HELLO, reply, 2);
+    setWireFormat(hostVersion >= WIRE_FORMAT_V2_CRC8 ? WIRE_FORMAT_V2_CRC8
+                  : hostVersion >= WIRE_FORMAT_V2 ? WIRE_FORMAT_V2 : WIRE_FORMAT_LEGACY);
+}
+
+static void putUint32(uint8_t* bytes, uint32_t value) {
+    bytes[0] = (value >> 24) & 0xFF;
+    bytes[1] = (value >> 16) & 0xFF;
+    bytes[2] = (value >> 8) & 0xFF;
+    bytes[3] = value & 0xFF;
+}
+
+static void handleLinkStats() {
+    uint8_t reply[12];
+    putUint32(&reply[0], goodFrames);
+    putUint32(&reply[4], badFrames);
+    putUint32(&reply[8], resyncs);
+    sendCommand(CMD_LINK_STATS, reply, 12);
+}
+
+// Records seq as seen; false if it was seen already
+static bool acceptSequence(uint8_t seq) {
+    ackPending = true;
+    if (!seqActive) {
+        seqActive = true;
+        lastSeq = seq;
+        seqHistory = 0;
+        return true;
+    }
+
+    uint8_t ahead = seq - lastSeq;
+    if (ahead == 0) {
+        return false;
+    }
+    if (ahead < 128) {
+        // Newer than anything so far; the old latest moves into the history
+        seqHistory = (ahead > 16) ? 0 : (uint16_t)((seqHistory << ahead) | (1u << (ahead - 1)));
+        lastSeq = seq;
+        return true;
+    }
+
+    uint8_t behind = lastSeq - seq;
+    if (behind > 16) {
+        return false;  // Too old to tell; the Pi gave up on it long ago
+    }
+    uint16_t bit = 1u << (behind - 1);
+    if (seqHistory & bit) {
+        return false;
+    }
+    seqHistory |= bit;
+    return true;
+}
+
+// Replaces a CMD_SEQUENCED packet with the command inside it. Returns false if the
+// command was already handled (a retransmit whose ack got lost) and should be skipped.
+bool unwrapSequenced(CommandPacket& packet) {
+    if (packet.data_length < 2 || !acceptSequence(packet.data[0])) {
+        return false;
+    }
+    packet.command = packet.data[1];
+    packet.data_length -= 2;
+    memmove(packet.data, &packet.data[2], packet.data_length);
+    return true;
+}
+
+// Echoes the Pi's timestamp with our millis(), so the Pi can work out our clock offset
+static void handleTimeSync(const CommandPacket& packet) {
+    if (packet.data_length < 4) {
+        return;
+    }
+    uint8_t reply[8];
+    memcpy(reply, packet.data, 4);
+    putUint32(&reply[4], millis());
+    sendCommand(CMD_TIME_SYNC, reply, 8);
+}
+
+// Answers the link-level requests the Pi may send to any Teensy, on their own or inside a
+// CMD_LED_BATCH. Returns true if packet was one of them (and needs no further handling).
+bool handleLinkCommand(const CommandPacket& packet) {
+    switch (packet.command) {
+        case CMD_TIME_SYNC:
+            // Answered as soon as it is read rather than after the frame is drawn, to keep the round trip short
+            handleTimeSync(packet);
+            return true;
+        case CMD_LINK_STATS:
+            handleLinkStats();
+            return true;
+    }
+    return false;
+}
+
+static void sendAck() {
+    uint8_t ack[3] = {lastSeq, (uint8_t)(seqHistory >> 8), (uint8_t)(seqHistory & 0xFF)};
+    sendCommand(CMD_ACK, ack, 3);
+    ackPending = false;
+}
+
+bool receiveCommand(CommandPacket& packet) {
+    // The Pi always opens a new connection in legacy format; DTR drops when it closes the port
+    if (wireFormat != WIRE_FORMAT_LEGACY && !Serial.dtr()) {
+        setWireFormat(WIRE_FORMAT_LEGACY);
+    }
+
+    while (true) {
+        bool received = (wireFormat != WIRE_FORMAT_LEGACY) ? receiveV2Command(packet) : receiveLegacyCommand(packet);
+        if (!received) {
+            // One ack for everything that came in since the last one
+            if (ackPending) {
+                sendAck();
+            }
+            return false;
+        }
+        if (packet.command == CMD_HELLO) {
+            handleHello(packet);
+            continue;
+        }
+        if (packet.command == CMD_SEQUENCED && !unwrapSequenced(packet)) {
+            continue;
+        }
+        if (handleLinkCommand(packet)) {
+            continue;
+        }
+        return true;
+    }
+}
+
 void sendHeartbeat() {
     static unsigned long lastHeartbeat = 0;
     unsigned long now = millis();
-    
+
     if (now - lastHeartbeat > 1000) { // Send heartbeat every second
         lastHeartbeat = now;
-        
+
         uint8_t heartbeatData[4];
         heartbeatData[0] = (now >> 24) & 0xFF;
         heartbeatData[1] = (now >> 16) & 0xFF;
         heartbeatData[2] = (now >> 8) & 0xFF;
         heartbeatData[3] = now & 0xFF;
-        
+
         sendCommand(CMD_HEARTBEAT, heartbeatData, 4);
     }
 }
@@ -71,10 +341,10 @@ uint8_t calculateChecksum(const CommandPacket& packet) {
     uint8_t checksum = 0;
     checksum ^= packet.command;
     checksum ^= packet.data_length;
-    
+
     for (int i = 0; i < packet.data_length; i++) {
         checksum ^= packet.data[i];
     }
-    
+
     return checksum;
-} 
\ No newline at end of file
+}
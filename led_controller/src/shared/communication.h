@@ -13,6 +13,10 @@ struct CommandPacket {
 void initCommunication();
 void sendCommand(uint8_t command, const uint8_t* data, uint8_t length);
 bool receiveCommand(CommandPacket& packet);
+bool unwrapSequenced(CommandPacket& packet);
+bool handleLinkCommand(const CommandPacket& packet);
+uint8_t getWireFormat();
+void setWireFormat(uint8_t format);
 void sendHeartbeat();
 uint8_t calculateChecksum(const CommandPacket& packet);
 